@@ -0,0 +1,68 @@
+from datetime import date, datetime
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request
+from fastapi.responses import StreamingResponse
+from app.Parcial2_Service import Parcial2Service
+from app.core.auth import administrador
+from app.core.exportacion import CopiaNoValida, progreso_en_log
+
+router = APIRouter(prefix="/admin", tags=["Administración"], dependencies=[Depends(administrador)])
+
+Coleccion = Literal["Parcial2", "Usuario"]
+Formato = Literal["ndjson", "csv"]
+
+
+# ===================================================
+#            Copias: exportar e importar
+# ===================================================
+# ======= Exportar una colección entera (gzip, en streaming) ========
+@router.get(
+    "/exportar/{coleccion}",
+    status_code=200,
+    responses={
+        200: {
+            "description": "Todos los documentos que casan, sin paginar, como NDJSON (Extended JSON) o CSV "
+                           "comprimidos con gzip. Se envían según salen del cursor.",
+            "content": {"application/gzip": {}},
+        },
+        401: {"description": "Token de Firebase ausente o no válido."},
+        403: {"description": "El usuario no es administrador."},
+        422: {"description": "Colección o formato desconocidos."},
+    },
+)
+async def exportar(
+    coleccion: Coleccion = Path(..., description="Colección a exportar"),
+    formato: Formato = Query("ndjson", description="`ndjson`: copia exacta (ObjectId, fechas); `csv`: columnas fijas para hojas de cálculo"),
+    nombre: Optional[str] = Query(None, max_length=100, description="Solo Parcial2: comienzo del nombre"),
+    fechaComienzo: Optional[date] = Query(None, description="Solo Parcial2: fecha de inicio del rango (YYYY-MM-DD)"),
+    fechaFinal: Optional[date] = Query(None, description="Solo Parcial2: fecha de fin del rango (YYYY-MM-DD)"),
+    usuarioId: Optional[str] = Query(None, description="Solo Parcial2: reseñas de este usuario"),
+    ):
+
+    trozos = Parcial2Service.exportar(coleccion, formato, nombre, fechaComienzo, fechaFinal, usuarioId)
+    fichero = f"{coleccion}-{datetime.utcnow():%Y%m%d-%H%M%S}.{formato}.gz"
+    return StreamingResponse(trozos, media_type="application/gzip", headers={"Content-Disposition": f'attachment; filename="{fichero}"'})
+
+
+# ======= Importar una copia (el cuerpo se lee por trozos) ========
+@router.post(
+    "/importar/{coleccion}",
+    status_code=200,
+    responses={
+        200: {"description": "Resumen: leídos, insertados, duplicados (ese _id ya existía), errores y hasta 10 ejemplos con su línea."},
+        400: {"description": "gzip corrupto o cortado; lleva el resumen de lo importado hasta ese punto."},
+        401: {"description": "Token de Firebase ausente o no válido."},
+        403: {"description": "El usuario no es administrador."},
+        422: {"description": "Colección o formato desconocidos."},
+    },
+)
+async def importar(
+    request: Request,
+    coleccion: Coleccion = Path(..., description="Colección de destino"),
+    formato: Formato = Query("ndjson", description="Formato del cuerpo, con o sin gzip (se detecta solo)"),
+    ):
+
+    try:
+        return await Parcial2Service.importar(coleccion, formato, request.stream(), progreso_en_log(f"Importando {coleccion}"))
+    except CopiaNoValida as e:
+        raise HTTPException(status_code=400, detail={"error": str(e), "resumen": e.resumen})
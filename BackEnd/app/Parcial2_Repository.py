@@ -1,16 +1,117 @@
-﻿from app.core.database import db
+﻿import asyncio
+from app.core.config import settings
+from app.core.database import db, db_lecturas
 from bson import ObjectId
+from datetime import datetime
+from typing import Optional
+from pymongo import ASCENDING, DESCENDING, InsertOne, UpdateOne, DeleteOne, ReturnDocument
+from pymongo.errors import BulkWriteError
+
+# Orden estable de los listados: primero lo más reciente, _id desempata
+ORDEN_LISTADO = [("fecha", DESCENDING), ("_id", DESCENDING)]
+
+# Búsquedas, mapa, cercanos, streaming y exportación leen de db_lecturas, que
+# puede ir a un secundario (MONGO_LECTURA_LISTADOS) y quedarse atrás lo que
+# tarde la replicación. Las páginas del listado y las estadísticas no: se
+# guardan en caché bajo la versión de su grupo, que se lee del primario, y una
+# lectura atrasada quedaría guardada (y con su ETag) como si fuera la nueva.
+# Esas, las lecturas por id, las comprobaciones previas a escribir y las
+# escrituras usan db (primario).
 
 class Parcial2Repository:
     
     #===================================================
     #               PARCIAL2 REPOSITORY
     #===================================================
-    # ======= Listar todos los Parcial2 ========
+    # ======= Filtro keyset: todo lo que va después de (fecha, _id) ========
+    @staticmethod
+    def _filtro_despues_de(filtro: dict, despues: Optional[tuple[datetime, ObjectId]]):
+        if not despues:
+            return filtro
+        fecha, ultimo_id = despues
+        # Se envuelve en $and para no pisar un posible rango de fechas del filtro original
+        return {"$and": [filtro, {"$or": [
+            {"fecha": {"$lt": fecha}},
+            {"fecha": fecha, "_id": {"$lt": ultimo_id}},
+        ]}]}
+
+    # ======= Listar una página de Parcial2 ========
+    @staticmethod
+    async def listar_todo(filtro: dict, limite: int, despues: Optional[tuple[datetime, ObjectId]] = None, proyeccion: Optional[dict] = None):
+        # Pedimos uno de más para saber si existe una página siguiente
+        cursor = (
+            db.Parcial2.find(Parcial2Repository._filtro_despues_de(filtro, despues), proyeccion)
+            .sort(ORDEN_LISTADO)
+            .limit(limite + 1)
+        )
+        return await cursor.to_list(limite + 1)
+
+    # ======= Iterar Parcial2 sin cargar la lista en memoria ========
+    @staticmethod
+    def iterar(filtro: dict, lote: int, despues: Optional[tuple[datetime, ObjectId]] = None, limite: Optional[int] = None, proyeccion: Optional[dict] = None):
+        cursor = (
+            db_lecturas.Parcial2.find(Parcial2Repository._filtro_despues_de(filtro, despues), proyeccion)
+            .sort(ORDEN_LISTADO)
+            .batch_size(lote)
+        )
+        if limite:
+            cursor = cursor.limit(limite)
+        return cursor
+
+    # ======= Plan de ejecución del listado (diagnóstico) ========
+    @staticmethod
+    async def explicar_listado(filtro: dict, limite: int):
+        cursor = db.Parcial2.find(filtro).sort(ORDEN_LISTADO).limit(limite)
+        return await cursor.explain()
+
+    # ======= Búsqueda de texto completo ordenada por relevancia ========
+    @staticmethod
+    async def buscar_texto(filtro: dict, limite: int):
+        puntuacion = {"$meta": "textScore"}
+        cursor = (
+            db_lecturas.Parcial2.find(filtro, {"puntuacion": puntuacion})
+            .sort([("puntuacion", puntuacion)])
+            .limit(limite)
+        )
+        return await cursor.to_list(limite)
+
+    # ======= Búsqueda por prefijo (autocompletar) ========
+    @staticmethod
+    async def buscar_prefijo(filtro: dict, limite: int):
+        cursor = db_lecturas.Parcial2.find(filtro).sort("nombre_normalizado", ASCENDING).limit(limite)
+        return await cursor.to_list(limite)
+
+    # ======= Cercanos a un punto (ordenados por distancia) ========
+    @staticmethod
+    async def listar_cercanos(filtro: dict, limite: int):
+        return await db_lecturas.Parcial2.find(filtro).limit(limite).to_list(limite)
+
+    # ======= Reseñas dentro de la vista del mapa ========
+    @staticmethod
+    async def listar_en_vista(filtro: dict, limite: int):
+        return await db_lecturas.Parcial2.find(filtro).sort(ORDEN_LISTADO).limit(limite).to_list(limite)
+
+    # ======= Agrupar por celdas de la vista (zoom bajo) ========
     @staticmethod
-    async def listar_todo(filtro: dict):
-        resultados = await db.Parcial2.find(filtro).to_list(100)
-        return resultados
+    async def agrupar_en_vista(filtro: dict, celda: float, limite: int):
+        longitud = {"$arrayElemAt": ["$location.coordinates", 0]}
+        latitud = {"$arrayElemAt": ["$location.coordinates", 1]}
+        pipeline = [
+            {"$match": filtro},
+            {"$group": {
+                "_id": {
+                    "x": {"$floor": {"$divide": [longitud, celda]}},
+                    "y": {"$floor": {"$divide": [latitud, celda]}},
+                },
+                "total": {"$sum": 1},
+                "longitud": {"$avg": longitud},
+                "latitud": {"$avg": latitud},
+                "id": {"$first": "$_id"},
+            }},
+            {"$sort": {"total": -1}},
+            {"$limit": limite},
+        ]
+        return await db_lecturas.Parcial2.aggregate(pipeline).to_list(limite)
 
     # ======= Crear Parcial2 ========
     @staticmethod
@@ -20,10 +121,24 @@ class Parcial2Repository:
 
 
     # ======= Modificar Parcial2 ========
+    # Un único find_one_and_update que devuelve el documento ANTERIOR: con él
+    # se sabe qué fotos sobran y el nuevo se obtiene aplicando los cambios.
+    # Con 'version' solo se modifica si el documento sigue en esa versión
+    # (If-Match); si no existe o no coincide devuelve None
     @staticmethod
-    async def modificar(id: ObjectId, datos: dict):
-        await db.Parcial2.update_one({"_id": id}, {"$set": datos})
-        return await db.Parcial2.find_one({"_id": id})
+    async def modificar(id: ObjectId, datos: dict, version: Optional[int] = None, usuarioId: Optional[str] = None):
+        filtro = {"_id": id}
+        if usuarioId is not None:
+            # Solo el dueño (si la petición viene autenticada)
+            filtro["usuarioId"] = usuarioId
+        if version is not None:
+            # Los documentos anteriores a las versiones no tienen el campo
+            filtro["version"] = version if version else {"$in": [0, None]}
+        return await db.Parcial2.find_one_and_update(
+            filtro,
+            {"$set": datos, "$inc": {"version": 1}},
+            return_document=ReturnDocument.BEFORE,
+        )
 
 
     # ======= Eliminar Parcial2 ========
@@ -38,15 +153,242 @@ class Parcial2Repository:
     async def obtener_por_id(id: ObjectId):
         return await db.Parcial2.find_one({"_id": id})
 
+    # ======= Solo la versión (None si no existe): clave de la caché del documento ========
+    @staticmethod
+    async def obtener_version_documento(id: ObjectId) -> Optional[int]:
+        documento = await db.Parcial2.find_one({"_id": id}, {"version": 1})
+        return documento.get("version", 0) if documento else None
+
+    # ======= Crear en lote (devuelve {posición: error} de los que fallan) ========
+    @staticmethod
+    async def crear_varios(documentos: list[dict]) -> dict[int, str]:
+        if not documentos:
+            return {}
+        try:
+            await db.Parcial2.bulk_write([InsertOne(d) for d in documentos], ordered=False)
+        except BulkWriteError as e:
+            return {error["index"]: error["errmsg"] for error in e.details["writeErrors"]}
+        return {}
+
+    # ======= Exportar: toda una colección (o lo que case) en orden de _id ========
+    # Por _id para no depender de otro índice y no ver dos veces un documento
+    # que se modifique mientras se recorre
+    @staticmethod
+    def iterar_coleccion(coleccion: str, filtro: dict, lote: int):
+        return db_lecturas[coleccion].find(filtro).sort("_id", ASCENDING).batch_size(lote)
+
+    # ======= Importar: un lote sin orden (devuelve {posición: código de error}) ========
+    @staticmethod
+    async def insertar_lote(coleccion: str, documentos: list[dict]) -> dict[int, tuple[int, str]]:
+        if not documentos:
+            return {}
+        try:
+            await db[coleccion].insert_many(documentos, ordered=False)
+        except BulkWriteError as e:
+            return {error["index"]: (error["code"], error["errmsg"]) for error in e.details["writeErrors"]}
+        return {}
+
+    # ======= Obtener varios por id de una vez ========
+    @staticmethod
+    async def obtener_varios(ids: list[ObjectId]) -> dict[ObjectId, dict]:
+        if not ids:
+            return {}
+        return {d["_id"]: d async for d in db.Parcial2.find({"_id": {"$in": ids}})}
+
+    # ======= Modificar en lote condicionado a versión (devuelve los que no casan) ========
+    @staticmethod
+    async def modificar_varios(operaciones: list[tuple[ObjectId, int, dict]]) -> set[ObjectId]:
+        if not operaciones:
+            return set()
+        escrituras = [
+            UpdateOne(
+                {"_id": id, "version": version if version else {"$in": [0, None]}},
+                {"$set": datos, "$inc": {"version": 1}},
+            )
+            for id, version, datos in operaciones
+        ]
+        resultado = await db.Parcial2.bulk_write(escrituras, ordered=False)
+        if resultado.matched_count == len(operaciones):
+            return set()
+        # Caso raro (escritura concurrente): averiguamos cuáles no casaron
+        esperadas = {id: version + 1 for id, version, _ in operaciones}
+        actuales = db.Parcial2.find({"_id": {"$in": list(esperadas)}}, {"version": 1})
+        casaron = {d["_id"] async for d in actuales if d.get("version") == esperadas[d["_id"]]}
+        return set(esperadas) - casaron
+
+    # ======= Eliminar varios por id ========
+    # Uno a uno (con concurrencia acotada) para saber exactamente cuáles ha
+    # borrado esta petición y cómo estaban: un bulk_write solo da el total
+    @staticmethod
+    async def eliminar_varios(ids: list[ObjectId], usuarioId: Optional[str] = None, concurrencia: int = settings.BULK_BORRADO_CONCURRENCIA) -> dict[ObjectId, dict]:
+        semaforo = asyncio.Semaphore(concurrencia)
+
+        async def eliminar(id: ObjectId) -> Optional[dict]:
+            filtro = {"_id": id}
+            if usuarioId is not None:
+                filtro["usuarioId"] = usuarioId
+            async with semaforo:
+                return await db.Parcial2.find_one_and_delete(filtro)
+
+        borrados = await asyncio.gather(*(eliminar(id) for id in ids))
+        return {documento["_id"]: documento for documento in borrados if documento}
+
+    # ======= Resumen por establecimiento (mantenido con $inc) ========
+    # cambios: (clave, nombre, valoracion, +1 al añadir / -1 al quitar)
+    @staticmethod
+    async def actualizar_resumen(cambios: list[tuple[str, str, int, int]]):
+        if not cambios:
+            return
+        operaciones = []
+        for clave, nombre, valoracion, signo in cambios:
+            actualizacion = {"$inc": {"total": signo, "suma": signo * valoracion, f"histograma.{valoracion}": signo}}
+            if signo > 0:
+                actualizacion["$set"] = {"nombre": nombre}
+            operaciones.append(UpdateOne({"_id": clave}, actualizacion, upsert=True))
+        # Los establecimientos que se quedan sin reseñas desaparecen del resumen
+        restados = {clave for clave, _, _, signo in cambios if signo < 0}
+        operaciones += [DeleteOne({"_id": clave, "total": {"$lte": 0}}) for clave in restados]
+        await db.Parcial2Resumen.bulk_write(operaciones, ordered=True)
+
+    # ======= Estadísticas: desde el resumen (sin filtros) ========
+    @staticmethod
+    async def estadisticas_resumen(min_resenas: int, limite: int) -> dict:
+        pipeline = [{"$facet": {
+            "global": [
+                {"$group": {"_id": None, "total": {"$sum": "$total"}, "suma": {"$sum": "$suma"}}},
+                {"$project": {"total": 1, "media": {"$cond": [{"$gt": ["$total", 0]}, {"$divide": ["$suma", "$total"]}, None]}}},
+            ],
+            "histograma": [
+                {"$project": {"h": {"$objectToArray": "$histograma"}}},
+                {"$unwind": "$h"},
+                {"$group": {"_id": "$h.k", "total": {"$sum": "$h.v"}}},
+            ],
+            "top": [
+                {"$match": {"total": {"$gte": max(min_resenas, 1)}}},
+                {"$addFields": {"media": {"$divide": ["$suma", "$total"]}}},
+                {"$sort": {"media": DESCENDING, "total": DESCENDING}},
+                {"$limit": limite},
+            ],
+        }}]
+        return (await db.Parcial2Resumen.aggregate(pipeline).to_list(1))[0]
+
+    # ======= Estadísticas: agregando las reseñas que cumplen el filtro ========
+    @staticmethod
+    async def estadisticas_filtradas(filtro: dict, min_resenas: int, limite: int) -> dict:
+        pipeline = [
+            {"$match": filtro},
+            {"$facet": {
+                "global": [{"$group": {"_id": None, "total": {"$sum": 1}, "media": {"$avg": "$valoracion"}}}],
+                "histograma": [{"$bucket": {
+                    "groupBy": "$valoracion",
+                    "boundaries": [0, 1, 2, 3, 4, 5, 6],
+                    "default": "otros",
+                    "output": {"total": {"$sum": 1}},
+                }}],
+                "top": [
+                    *Parcial2Repository._agrupar_establecimientos(),
+                    {"$match": {"total": {"$gte": min_resenas}}},
+                    {"$sort": {"media": DESCENDING, "total": DESCENDING}},
+                    {"$limit": limite},
+                ],
+            }},
+        ]
+        return (await db.Parcial2.aggregate(pipeline).to_list(1))[0]
+
+    @staticmethod
+    def _agrupar_establecimientos() -> list[dict]:
+        return [{"$group": {
+            # Documentos anteriores a nombre_normalizado: se agrupan por nombre en minúsculas
+            "_id": {"$ifNull": ["$nombre_normalizado", {"$toLower": "$nombre"}]},
+            "nombre": {"$last": "$nombre"},
+            "total": {"$sum": 1},
+            "media": {"$avg": "$valoracion"},
+        }}]
+
+    # ======= Media por establecimiento ========
+    @staticmethod
+    async def establecimientos(filtro: Optional[dict], orden: dict, min_resenas: int, limite: int) -> list[dict]:
+        if filtro is None:
+            coleccion = db.Parcial2Resumen
+            pipeline = [
+                {"$match": {"total": {"$gte": max(min_resenas, 1)}}},
+                {"$addFields": {"media": {"$divide": ["$suma", "$total"]}}},
+            ]
+        else:
+            coleccion = db.Parcial2
+            pipeline = [
+                {"$match": filtro},
+                *Parcial2Repository._agrupar_establecimientos(),
+                {"$match": {"total": {"$gte": min_resenas}}},
+            ]
+        pipeline += [
+            {"$sort": orden},
+            {"$limit": limite},
+        ]
+        return await coleccion.aggregate(pipeline).to_list(limite)
+
+    # ======= Versión de un grupo de listados (global o por usuario) ========
+    @staticmethod
+    async def obtener_version(grupo: str) -> int:
+        documento = await db.Versiones.find_one({"_id": grupo})
+        return documento["version"] if documento else 0
+
+    @staticmethod
+    async def incrementar_versiones(grupos: list[str]):
+        await db.Versiones.bulk_write(
+            [UpdateOne({"_id": g}, {"$inc": {"version": 1}}, upsert=True) for g in grupos],
+            ordered=False,
+        )
+
+    # ======= Subidas firmadas pendientes de su notificación ========
+    @staticmethod
+    async def registrar_subida(datos: dict):
+        await db.SubidasCloudinary.insert_one(datos)
+
+    @staticmethod
+    async def obtener_subida(public_id: str):
+        return await db.SubidasCloudinary.find_one({"_id": public_id})
+
+    @staticmethod
+    async def completar_subida(public_id: str, medio: dict):
+        await db.SubidasCloudinary.update_one({"_id": public_id}, {"$set": {"medio": medio, "subida": datetime.utcnow()}})
+
+    # ======= Añadir una imagen ya subida (si no estaba) ========
+    @staticmethod
+    async def anadir_medio(id: ObjectId, medio: dict):
+        # Pipeline: las reseñas sin fotos tienen medios/enlaces a null y $push fallaría
+        return await db.Parcial2.find_one_and_update(
+            {"_id": id, "medios.public_id": {"$ne": medio["public_id"]}},
+            [{"$set": {
+                "medios": {"$concatArrays": [{"$ifNull": ["$medios", []]}, [{"$literal": medio}]]},
+                "enlaces": {"$concatArrays": [{"$ifNull": ["$enlaces", []]}, [{"$literal": medio["url"]}]]},
+                "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]},
+            }}],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    # ======= Variantes definitivas de una imagen (notificación eager) ========
+    @staticmethod
+    async def actualizar_variantes(public_id: str, variantes: dict):
+        return await db.Parcial2.find_one_and_update(
+            {"medios.public_id": public_id},
+            {"$set": {"medios.$.variantes": variantes}, "$inc": {"version": 1}},
+            return_document=ReturnDocument.AFTER,
+        )
+
     #===================================================
     #               USUARIO REPOSITORY
     #===================================================
 
-    # ======= Listar todos los Usuario ========
+    # ======= Listar una página de Usuario (sin caducados, por _id) ========
     @staticmethod
-    async def listar_todos_usuarios():
-        resultados = await db.Usuario.find().to_list(100)
-        return resultados
+    async def listar_todos_usuarios(ahora: datetime, limite: int, despues: Optional[str] = None):
+        filtro = {"fechaCaducidad": {"$gt": ahora}}
+        if despues is not None:
+            filtro["_id"] = {"$gt": despues}
+        # Uno de más para saber si hay página siguiente
+        cursor = db_lecturas.Usuario.find(filtro).sort("_id", ASCENDING).limit(limite + 1)
+        return await cursor.to_list(limite + 1)
 
     # ======= Crear Usuario ========
     @staticmethod
@@ -58,8 +400,9 @@ class Parcial2Repository:
     # ======= Modificar Usuario ========
     @staticmethod
     async def modificar_usuario(id: ObjectId, datos: dict):
-        await db.Usuario.update_one({"_id": id}, {"$set": datos})
-        return await db.Usuario.find_one({"_id": id})
+        return await db.Usuario.find_one_and_update(
+            {"_id": id}, {"$set": datos}, return_document=ReturnDocument.AFTER
+        )
 
 
     # ======= Eliminar Usuario ========
@@ -72,4 +415,39 @@ class Parcial2Repository:
     # ======= Obtener Usuario por id ========
     @staticmethod
     async def obtener_usuariopor_id(id: ObjectId):
-        return await db.Usuario.find_one({"_id": id})
\ No newline at end of file
+        # El TTL de Mongo pasa cada 60 s y el barrido cada intervalo: un caducado aún no borrado no cuenta
+        return await db.Usuario.find_one({"_id": id, "fechaCaducidad": {"$gt": datetime.utcnow()}})
+
+    # ======= Caducidad: ids de usuarios caducados (como mucho un lote) ========
+    @staticmethod
+    async def usuarios_caducados(ahora: datetime, limite: int) -> list[str]:
+        cursor = db.Usuario.find({"fechaCaducidad": {"$lte": ahora}}, {"_id": 1}).limit(limite)
+        return [usuario["_id"] for usuario in await cursor.to_list(limite)]
+
+    # ======= Caducidad: borrar los que sigan caducados (no los renovados entretanto) ========
+    @staticmethod
+    async def eliminar_usuarios_caducados(ids: list[str], ahora: datetime) -> int:
+        resultado = await db.Usuario.delete_many({"_id": {"$in": ids}, "fechaCaducidad": {"$lte": ahora}})
+        return resultado.deleted_count
+
+    # ======= Alias y foto de varios usuarios de una vez (autor de las reseñas) ========
+    @staticmethod
+    async def perfiles_de_usuarios(ids: list[str]) -> dict[str, dict]:
+        cursor = db.Usuario.find({"_id": {"$in": ids}}, {"alias": 1, "foto": 1})
+        return {u["_id"]: u async for u in cursor}
+
+    # ======= Instantánea del autor en sus reseñas (devuelve las que cambian) ========
+    @staticmethod
+    async def actualizar_autor(usuarioId: str, autor: Optional[dict]) -> list[ObjectId]:
+        # Solo las que tienen otra instantánea: el resto no cambia de versión
+        cursor = db.Parcial2.find({"usuarioId": usuarioId, "autor": {"$ne": autor}}, {"_id": 1})
+        ids = [d["_id"] async for d in cursor]
+        if ids:
+            await db.Parcial2.update_many({"_id": {"$in": ids}}, {"$set": {"autor": autor}, "$inc": {"version": 1}})
+        return ids
+
+    # ======= Ids de las reseñas de un usuario (para la cascada) ========
+    @staticmethod
+    async def ids_de_usuario(usuarioId: str, limite: int) -> list[ObjectId]:
+        cursor = db.Parcial2.find({"usuarioId": usuarioId}, {"_id": 1}).limit(limite)
+        return [documento["_id"] for documento in await cursor.to_list(limite)]
\ No newline at end of file
@@ -1,10 +1,24 @@
-﻿from fastapi import APIRouter, HTTPException, Path, Query, Body
-from app.Parcial2_Schema import Parcial2Respuesta, Parcial2Crear, Parcial2Actualizar, UsuarioActualizar, UsuarioRespuesta, UsuarioCrear
-from typing import Optional
+﻿import re
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Body, Request, Response, Header
+from fastapi.responses import StreamingResponse
+from app.Parcial2_Schema import Parcial2Subida, Parcial2SubidaCrear, Parcial2Respuesta, Parcial2BusquedaRespuesta, Parcial2Mapa, Parcial2Estadisticas, EstadisticaEstablecimiento, Parcial2BulkActualizar, Parcial2BulkRespuesta, Parcial2Crear, Parcial2Actualizar, UsuarioActualizar, UsuarioRespuesta, UsuarioCrear
+from typing import Optional, Literal, Any
 from datetime import date
-from app.Parcial2_Service import Parcial2Service
+from app.Parcial2_Service import Parcial2Service, VersionNoCoincide, SinPermiso, difusor_cambios
+from app.core.media import VARIANTES, NotificacionNoValida
+from app.core.config import settings
+from app.core.etag import etag_documento, coincide, version_de_if_match
+from app.core.serializacion import respuesta_json
+from app.core.limites import limitar_peticiones
+from app.core.auth import usuario_autenticado, administrador
 
-router = APIRouter(prefix="/Parcial2", tags=[])
+# Todas las rutas gastan una ficha del cubo del usuario/IP (429 al agotarse)
+router = APIRouter(prefix="/Parcial2", tags=[], dependencies=[Depends(limitar_peticiones)])
+# Notificaciones de Cloudinary: sin límite por IP (llegan todas desde sus servidores)
+notificaciones = APIRouter(prefix="/Parcial2", tags=["Multimedia"])
+
+# Valores admitidos en ?imagenes=: original o el nombre de una variante
+VARIANTES_LISTADOS = f"^(original|{'|'.join(map(re.escape, VARIANTES))})$"
     
 # ===================================================
 #                  Rutas Parcial2
@@ -15,22 +29,348 @@ router = APIRouter(prefix="/Parcial2", tags=[])
     response_model=list[Parcial2Respuesta],
     status_code=200,
     responses={
-        200: {"description": "Lista obtenida correctamente."},
+        200: {
+            "description": "Lista obtenida correctamente. Si hay más resultados, la cabecera "
+                           "`X-Siguiente-Cursor` trae el cursor de la página siguiente. Con `fields` "
+                           "cada elemento trae solo esos campos.",
+            "content": {"application/x-ndjson": {}},
+        },
+        304: {"description": "La lista no ha cambiado desde la ETag de If-None-Match."},
+        400: {"description": "Cursor no válido o campo desconocido en `fields`."},
         422: {"description": "Error en formato."},
         500: {"description": "Error interno del servidor."},
     },
 )
 async def listar_todo(    
-    nombre: Optional[str] = Query(None, description="Nombre parcial para filtrar (Ej: parcial)"),
+    nombre: Optional[str] = Query(None, max_length=100, description="Comienzo del nombre, sin distinguir tildes ni mayúsculas (Ej: casa)"),
+    numero: Optional[int] = Query(None, description="Número exacto para filtrar (Ej: 22)"),
+    fechaComienzo: Optional[date] = Query(None, description="Fecha de inicio del rango (YYYY-MM-DD)"),
+    fechaFinal: Optional[date] = Query(None, description="Fecha de fin del rango (YYYY-MM-DD)"),
+    booleana: Optional[bool] = Query(None, description="Valor booleano a filtrar (true/false)"),
+    usuarioId: Optional[str] = Query(None, description="UID Firebase del usuario dueño del Parcial2"),
+    limit: Optional[int] = Query(None, ge=1, le=settings.LISTADO_LIMITE_MAXIMO, description="Tamaño de página (por defecto 100; en ndjson sin límite)"),
+    cursor: Optional[str] = Query(None, description="Cursor opaco devuelto en `X-Siguiente-Cursor`"),
+    formato: Literal["json", "ndjson"] = Query("json", description="`ndjson` envía un documento por línea según llegan de la BD"),
+    fields: Optional[str] = Query(None, max_length=500, description="Campos a devolver separados por comas; `_id` va siempre (Ej: nombre,valoracion,coordenadas)"),
+    imagenes: str = Query(settings.CLOUDINARY_VARIANTE_LISTADOS, pattern=VARIANTES_LISTADOS, description="Variante de las imágenes en `enlaces` (`original` = sin cambiar)"),
+    include: Optional[str] = Query(None, pattern="^autor$", description="`autor`: alias y foto del usuario en cada elemento (sin una petición por reseña)"),
+    if_none_match: Optional[str] = Header(None, description="ETag de una respuesta anterior"),
+    ):
+
+    try:
+        if formato == "ndjson":
+            lineas = await Parcial2Service.listar_ndjson(nombre, numero, fechaComienzo, fechaFinal, booleana, usuarioId, limit, cursor, fields)
+            return StreamingResponse(lineas, media_type="application/x-ndjson")
+
+        resultados, siguiente, etag = await Parcial2Service.listar_todo(nombre, numero, fechaComienzo, fechaFinal, booleana, usuarioId, limit, cursor, if_none_match, fields, imagenes, include == "autor")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if resultados is None:
+        return Response(status_code=304, headers={"ETag": etag})
+    cabeceras = {"ETag": etag}
+    if siguiente:
+        cabeceras["X-Siguiente-Cursor"] = siguiente
+    # Ya serializados: response_model solo documenta, no se vuelve a validar
+    return respuesta_json(resultados, headers=cabeceras)
+
+
+
+# ======= Buscar Parcial2 ========
+@router.get(
+    "/buscar", tags=["CRUD"],
+    response_model=list[Parcial2BusquedaRespuesta],
+    status_code=200,
+    responses={
+        200: {"description": "Resultados ordenados por relevancia (texto) o alfabéticamente (prefijo)."},
+        400: {"description": "Búsqueda vacía."},
+        422: {"description": "Error en formato."},
+        500: {"description": "Error interno del servidor."},
+    },
+)
+async def buscar(
+    q: str = Query(..., min_length=1, max_length=100, description="Texto a buscar en nombre y dirección"),
+    modo: Literal["texto", "prefijo"] = Query("texto", description="`texto`: relevancia sobre nombre/dirección; `prefijo`: autocompletar por nombre"),
+    usuarioId: Optional[str] = Query(None, description="UID Firebase del usuario dueño del Parcial2"),
+    limit: Optional[int] = Query(None, ge=1, le=settings.LISTADO_LIMITE_MAXIMO, description="Máximo de resultados (por defecto 100)"),
+    imagenes: str = Query(settings.CLOUDINARY_VARIANTE_LISTADOS, pattern=VARIANTES_LISTADOS, description="Variante de las imágenes en `enlaces` (`original` = sin cambiar)"),
+    ):
+
+    try:
+        return respuesta_json(await Parcial2Service.buscar(q, modo, usuarioId, limit, imagenes))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# ======= Parcial2 cercanos a un punto ========
+@router.get(
+    "/cercanos", tags=["Mapa"],
+    response_model=list[Parcial2Respuesta],
+    status_code=200,
+    responses={
+        200: {"description": "Reseñas dentro del radio, de la más cercana a la más lejana."},
+        422: {"description": "Error en formato."},
+        500: {"description": "Error interno del servidor."},
+    },
+)
+async def listar_cercanos(
+    latitud: float = Query(..., ge=-90, le=90, description="Latitud del centro (Ej: 36.722)"),
+    longitud: float = Query(..., ge=-180, le=180, description="Longitud del centro (Ej: -4.418)"),
+    radio: int = Query(1000, ge=1, le=settings.CERCANOS_RADIO_MAXIMO, description="Radio en metros"),
+    usuarioId: Optional[str] = Query(None, description="UID Firebase del usuario dueño del Parcial2"),
+    limit: Optional[int] = Query(None, ge=1, le=settings.LISTADO_LIMITE_MAXIMO, description="Máximo de resultados (por defecto 100)"),
+    imagenes: str = Query(settings.CLOUDINARY_VARIANTE_LISTADOS, pattern=VARIANTES_LISTADOS, description="Variante de las imágenes en `enlaces` (`original` = sin cambiar)"),
+    ):
+
+    return respuesta_json(await Parcial2Service.listar_cercanos(latitud, longitud, radio, usuarioId, limit, imagenes))
+
+
+# ======= Parcial2 dentro de la vista del mapa ========
+@router.get(
+    "/mapa", tags=["Mapa"],
+    response_model=Parcial2Mapa,
+    status_code=200,
+    responses={
+        200: {"description": "Reseñas de la vista; con zoom bajo vienen agrupadas por celdas."},
+        400: {"description": "Rectángulo no válido."},
+        422: {"description": "Error en formato."},
+        500: {"description": "Error interno del servidor."},
+    },
+)
+async def listar_mapa(
+    sur: float = Query(..., ge=-90, le=90, description="Latitud del borde sur de la vista"),
+    oeste: float = Query(..., ge=-180, le=180, description="Longitud del borde oeste de la vista"),
+    norte: float = Query(..., ge=-90, le=90, description="Latitud del borde norte de la vista"),
+    este: float = Query(..., ge=-180, le=180, description="Longitud del borde este de la vista"),
+    zoom: int = Query(..., ge=0, le=22, description="Nivel de zoom del mapa (Leaflet/Google)"),
+    usuarioId: Optional[str] = Query(None, description="UID Firebase del usuario dueño del Parcial2"),
+    ):
+
+    try:
+        return await Parcial2Service.listar_mapa(sur, oeste, norte, este, zoom, usuarioId)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# ======= Cambios en vivo (Server-Sent Events) ========
+@router.get(
+    "/stream", tags=["Tiempo real"],
+    response_class=StreamingResponse,
+    status_code=200,
+    responses={
+        200: {
+            "description": "Eventos `creado`, `modificado` y `eliminado` con la reseña en `data` y el resume token en `id`. "
+                           "`reinicio`: no se pudo reanudar, hay que recargar el listado. `descartado`: el cliente no leía a tiempo.",
+            "content": {"text/event-stream": {}},
+        },
+        400: {"description": "Vista incompleta o no válida."},
+        503: {"description": "Demasiados clientes conectados a este worker."},
+    },
+)
+async def stream(
+    usuarioId: Optional[str] = Query(None, description="Solo reseñas de este usuario"),
+    sur: Optional[float] = Query(None, ge=-90, le=90, description="Vista del mapa: borde sur"),
+    oeste: Optional[float] = Query(None, ge=-180, le=180, description="Vista del mapa: borde oeste"),
+    norte: Optional[float] = Query(None, ge=-90, le=90, description="Vista del mapa: borde norte"),
+    este: Optional[float] = Query(None, ge=-180, le=180, description="Vista del mapa: borde este"),
+    last_event_id: Optional[str] = Header(None, description="Último `id` recibido (EventSource lo manda solo al reconectar)"),
+    ):
+
+    vista = (sur, oeste, norte, este)
+    if any(v is None for v in vista):
+        if any(v is not None for v in vista):
+            raise HTTPException(status_code=400, detail="La vista necesita sur, oeste, norte y este")
+        vista = None
+    if difusor_cambios.lleno():
+        raise HTTPException(status_code=503, detail="Demasiados clientes conectados", headers={"Retry-After": "10"})
+    try:
+        eventos = Parcial2Service.stream(usuarioId, vista, last_event_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Sin caché ni buffer en proxies (nginx) para que cada evento salga al momento
+    return StreamingResponse(eventos, media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# ======= Estadísticas de valoraciones ========
+# (declaradas antes de /{id} para que "estadisticas" no se tome como un ID)
+@router.get(
+    "/estadisticas", tags=["Estadísticas"],
+    response_model=Parcial2Estadisticas,
+    status_code=200,
+    responses={
+        200: {"description": "Total, media, histograma de valoraciones y establecimientos mejor valorados."},
+        422: {"description": "Error en formato."},
+        500: {"description": "Error interno del servidor."},
+    },
+)
+async def estadisticas(
+    nombre: Optional[str] = Query(None, max_length=100, description="Comienzo del nombre, sin distinguir tildes ni mayúsculas (Ej: casa)"),
     numero: Optional[int] = Query(None, description="Número exacto para filtrar (Ej: 22)"),
     fechaComienzo: Optional[date] = Query(None, description="Fecha de inicio del rango (YYYY-MM-DD)"),
     fechaFinal: Optional[date] = Query(None, description="Fecha de fin del rango (YYYY-MM-DD)"),
     booleana: Optional[bool] = Query(None, description="Valor booleano a filtrar (true/false)"),
     usuarioId: Optional[str] = Query(None, description="UID Firebase del usuario dueño del Parcial2"),
+    min_resenas: int = Query(1, ge=1, description="Reseñas mínimas para entrar en el top"),
+    top: int = Query(10, ge=1, le=100, description="Número de establecimientos del top"),
     ):
 
-    return await Parcial2Service.listar_todo(nombre, numero, fechaComienzo, fechaFinal, booleana, usuarioId)
+    return await Parcial2Service.estadisticas(nombre, numero, fechaComienzo, fechaFinal, booleana, usuarioId, min_resenas, top)
+
 
+# ======= Ranking de establecimientos ========
+@router.get(
+    "/estadisticas/establecimientos", tags=["Estadísticas"],
+    response_model=list[EstadisticaEstablecimiento],
+    status_code=200,
+    responses={
+        200: {"description": "Establecimientos (agrupados por nombre) con su número de reseñas y valoración media."},
+        422: {"description": "Error en formato."},
+        500: {"description": "Error interno del servidor."},
+    },
+)
+async def estadisticas_establecimientos(
+    nombre: Optional[str] = Query(None, max_length=100, description="Comienzo del nombre, sin distinguir tildes ni mayúsculas (Ej: casa)"),
+    numero: Optional[int] = Query(None, description="Número exacto para filtrar (Ej: 22)"),
+    fechaComienzo: Optional[date] = Query(None, description="Fecha de inicio del rango (YYYY-MM-DD)"),
+    fechaFinal: Optional[date] = Query(None, description="Fecha de fin del rango (YYYY-MM-DD)"),
+    booleana: Optional[bool] = Query(None, description="Valor booleano a filtrar (true/false)"),
+    usuarioId: Optional[str] = Query(None, description="UID Firebase del usuario dueño del Parcial2"),
+    orden: Literal["media", "total"] = Query("media", description="`media`: mejor valorados; `total`: con más reseñas"),
+    min_resenas: int = Query(1, ge=1, description="Reseñas mínimas para aparecer"),
+    limit: Optional[int] = Query(None, ge=1, le=settings.LISTADO_LIMITE_MAXIMO, description="Máximo de establecimientos (por defecto 100)"),
+    ):
+
+    return await Parcial2Service.estadisticas_establecimientos(nombre, numero, fechaComienzo, fechaFinal, booleana, usuarioId, orden, min_resenas, limit)
+
+
+# ======= Diagnóstico: plan de ejecución del listado ========
+# (declarada antes de /{id} para que "diagnostico" no se tome como un ID)
+@router.get(
+    "/diagnostico/explain", tags=["Diagnóstico"],
+    status_code=200,
+    dependencies=[Depends(administrador)],
+    responses={
+        200: {"description": "Resumen del plan ganador: etapas, índices usados y documentos examinados."},
+        401: {"description": "Token de Firebase ausente o no válido."},
+        403: {"description": "El usuario no es administrador."},
+        422: {"description": "Error en formato."},
+        500: {"description": "Error interno del servidor."},
+    },
+)
+async def explicar_listado(
+    nombre: Optional[str] = Query(None, max_length=100, description="Comienzo del nombre, sin distinguir tildes ni mayúsculas (Ej: casa)"),
+    numero: Optional[int] = Query(None, description="Número exacto para filtrar (Ej: 22)"),
+    fechaComienzo: Optional[date] = Query(None, description="Fecha de inicio del rango (YYYY-MM-DD)"),
+    fechaFinal: Optional[date] = Query(None, description="Fecha de fin del rango (YYYY-MM-DD)"),
+    booleana: Optional[bool] = Query(None, description="Valor booleano a filtrar (true/false)"),
+    usuarioId: Optional[str] = Query(None, description="UID Firebase del usuario dueño del Parcial2"),
+    ):
+
+    return await Parcial2Service.explicar_listado(nombre, numero, fechaComienzo, fechaFinal, booleana, usuarioId)
+
+
+# ======= Diagnóstico: contadores de la caché ========
+@router.get(
+    "/diagnostico/cache", tags=["Diagnóstico"],
+    status_code=200,
+    dependencies=[Depends(administrador)],
+    responses={
+        200: {"description": "Aciertos, fallos y expulsiones de la caché de lecturas."},
+        401: {"description": "Token de Firebase ausente o no válido."},
+        403: {"description": "El usuario no es administrador."},
+        500: {"description": "Error interno del servidor."},
+    },
+)
+async def estadisticas_cache():
+
+    return Parcial2Service.estadisticas_cache()
+
+
+# ======= Crear Parcial2 en lote ========
+# (las rutas /bulk van antes de /{id} para que "bulk" no se tome como un ID)
+@router.post(
+    "/bulk", tags=["CRUD en lote"],
+    response_model=Parcial2BulkRespuesta,
+    status_code=200,
+    responses={
+        200: {"description": "Resultado por elemento (estado 201, 403, 409 o 422), en el orden recibido."},
+        401: {"description": "Token de Firebase ausente o no válido."},
+        413: {"description": "Demasiados elementos."},
+        500: {"description": "Error interno del servidor."},
+    },
+)
+async def crear_varios(
+    elementos: list[dict[str, Any]] = Body(..., description="Lista de Parcial2Crear; cada uno se valida por separado"),
+    claims: Optional[dict] = Depends(usuario_autenticado),
+):
+    if len(elementos) > settings.BULK_MAX_ELEMENTOS:
+        raise HTTPException(status_code=413, detail=f"Máximo {settings.BULK_MAX_ELEMENTOS} elementos por petición")
+    return await Parcial2Service.crear_varios(elementos, claims)
+
+
+# ======= Modificar Parcial2 en lote ========
+@router.put(
+    "/bulk", tags=["CRUD en lote"],
+    response_model=Parcial2BulkRespuesta,
+    status_code=200,
+    responses={
+        200: {"description": "Resultado por elemento (estado 200, 403, 404, 412 o 422), en el orden recibido."},
+        401: {"description": "Token de Firebase ausente o no válido."},
+        413: {"description": "Demasiados elementos."},
+        422: {"description": "Error de validación en los datos enviados."},
+        500: {"description": "Error interno del servidor."},
+    },
+)
+async def modificar_varios(elementos: list[Parcial2BulkActualizar], claims: Optional[dict] = Depends(usuario_autenticado)):
+    if len(elementos) > settings.BULK_MAX_ELEMENTOS:
+        raise HTTPException(status_code=413, detail=f"Máximo {settings.BULK_MAX_ELEMENTOS} elementos por petición")
+    return await Parcial2Service.modificar_varios(elementos, claims)
+
+
+# ======= Eliminar Parcial2 en lote ========
+@router.delete(
+    "/bulk", tags=["CRUD en lote"],
+    response_model=Parcial2BulkRespuesta,
+    status_code=200,
+    responses={
+        200: {"description": "Resultado por elemento (estado 204, 403, 404 o 422), en el orden recibido."},
+        401: {"description": "Token de Firebase ausente o no válido."},
+        413: {"description": "Demasiados elementos."},
+        500: {"description": "Error interno del servidor."},
+    },
+)
+async def eliminar_varios(
+    ids: list[str] = Body(..., description="IDs (ObjectId de MongoDB) a eliminar"),
+    claims: Optional[dict] = Depends(usuario_autenticado),
+):
+    if len(ids) > settings.BULK_MAX_ELEMENTOS:
+        raise HTTPException(status_code=413, detail=f"Máximo {settings.BULK_MAX_ELEMENTOS} elementos por petición")
+    return await Parcial2Service.eliminar_varios(ids, claims)
+
+
+# ======= Firmar una subida directa a Cloudinary ========
+@router.post(
+    "/subidas", tags=["Multimedia"],
+    response_model=Parcial2Subida,
+    status_code=201,
+    responses={
+        201: {"description": "Parámetros firmados para subir una imagen directamente a Cloudinary."},
+        401: {"description": "Token de Firebase ausente o no válido."},
+        403: {"description": "La reseña es de otro usuario."},
+        404: {"description": "Parcial2 no encontrada."},
+        500: {"description": "Error interno del servidor."},
+    },
+)
+async def firmar_subida(
+    datos: Parcial2SubidaCrear = Body(default_factory=Parcial2SubidaCrear),
+    claims: Optional[dict] = Depends(usuario_autenticado),
+):
+    try:
+        return await Parcial2Service.firmar_subida(datos.parcial2Id, claims)
+    except SinPermiso as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 
 # ======= Crear Parcial2 ========
@@ -40,13 +380,19 @@ async def listar_todo(
     status_code=201,
     responses={
         201: {"description": "creado correctamente."},
+        401: {"description": "Token de Firebase ausente o no válido."},
+        403: {"description": "usuarioId no coincide con el del token."},
         422: {"description": "Error de validación en los datos enviados."},
         500: {"description": "Error interno del servidor."},
     },
 )
-async def crear_comentario(datos: Parcial2Crear):
+async def crear_comentario(datos: Parcial2Crear, response: Response, claims: Optional[dict] = Depends(usuario_autenticado)):
     try:
-        return await Parcial2Service.crear(datos)
+        resultado = await Parcial2Service.crear(datos, claims)
+        response.headers["ETag"] = etag_documento(resultado.id, resultado.version)
+        return resultado
+    except SinPermiso as e:
+        raise HTTPException(status_code=403, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
@@ -58,20 +404,32 @@ async def crear_comentario(datos: Parcial2Crear):
     status_code=200,
     responses={
         200: {"description": "Actualizado correctamente."},
+        401: {"description": "Token de Firebase ausente o no válido."},
+        403: {"description": "La reseña es de otro usuario."},
         404: {"description": "Parcial2 no encontrada."},
+        412: {"description": "If-Match no coincide con la versión actual."},
         422: {"description": "Error de validación en los datos enviados."},
         500: {"description": "Error interno del servidor."},
     },
 )
 async def modificar(
     datos: Parcial2Actualizar,
+    response: Response,
     id: str = Path(
         description="El ID (ObjectId de MongoDB) de la Parcial2 a modificar.",
         example="70fa1a01fee6ad04b5737208",
     ),
+    if_match: Optional[str] = Header(None, description="ETag leída antes de editar (concurrencia optimista)"),
+    claims: Optional[dict] = Depends(usuario_autenticado),
 ):
     try:
-        return await Parcial2Service.modificar(id, datos)
+        resultado = await Parcial2Service.modificar(id, datos, version_de_if_match(if_match, id), claims)
+        response.headers["ETag"] = etag_documento(resultado.id, resultado.version)
+        return resultado
+    except SinPermiso as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except VersionNoCoincide as e:
+        raise HTTPException(status_code=412, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
@@ -82,6 +440,8 @@ async def modificar(
     status_code=204,  # No Content
     responses={
         204: {"description": "Parcial2 eliminado correctamente."},
+        401: {"description": "Token de Firebase ausente o no válido."},
+        403: {"description": "La reseña es de otro usuario."},
         404: {"description": "Parcial2 no encontrado."},
         422: {"description": "ID con formato inválido."},
         500: {"description": "Error interno del servidor."},
@@ -91,12 +451,15 @@ async def eliminar_por_id(
     id: str = Path(
         description="El ID (ObjectId de MongoDB) de la Parcial2 a eliminar.",
         example="70fa1a01fee6ad04b5737208",
-    )
+    ),
+    claims: Optional[dict] = Depends(usuario_autenticado),
 ):
     try:
-        await Parcial2Service.eliminar_por_id(id)
+        await Parcial2Service.eliminar_por_id(id, claims)
         # No devolvemos contenido, cumple con el 204
         return None
+    except SinPermiso as e:
+        raise HTTPException(status_code=403, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
@@ -108,22 +471,31 @@ async def eliminar_por_id(
     status_code=200,
     responses={
         200: {"description": "Parcial2 encontrado correctamente."},
+        304: {"description": "No ha cambiado desde la ETag de If-None-Match."},
         404: {"description": "Parcial2 no encontrado."},
         422: {"description": "ID con formato inválido."},
         500: {"description": "Error interno del servidor."},
     },
 )
 async def obtener_por_id(
+    response: Response,
     id: str = Path(
         description="El ID (ObjectId de MongoDB) de la Parcial2 a buscar.",
         example="70fa1a01fee6ad04b5737202",
-    )
+    ),
+    include: Optional[str] = Query(None, pattern="^autor$", description="`autor`: alias y foto del usuario que la escribió"),
+    if_none_match: Optional[str] = Header(None, description="ETag de una respuesta anterior"),
 ):
     try:
-        return await Parcial2Service.obtener_por_id(id)
+        resultado, etag = await Parcial2Service.obtener_por_id(id, include == "autor")
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+    if coincide(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return resultado
+
 
 # ===================================================
 #                  Rutas Usuario
@@ -135,14 +507,24 @@ async def obtener_por_id(
     response_model=list[UsuarioRespuesta],
     status_code=200,
     responses={
-        200: {"description": "Lista obtenida correctamente."},
+        200: {
+            "description": "Página de usuarios no caducados, ordenada por id.",
+            "headers": {"X-Siguiente-Cursor": {"description": "Cursor de la página siguiente (si la hay)"}},
+        },
+        400: {"description": "Cursor no válido."},
         422: {"description": "Error en formato."},
         500: {"description": "Error interno del servidor."},
     },
 )
-async def listar_todo_usuarios():
-
-    return await Parcial2Service.listar_todo_usuarios()
+async def listar_todo_usuarios(
+    limit: Optional[int] = Query(None, ge=1, le=settings.LISTADO_LIMITE_MAXIMO, description="Tamaño de página (por defecto 100)"),
+    cursor: Optional[str] = Query(None, description="Cursor opaco devuelto en `X-Siguiente-Cursor`"),
+):
+    try:
+        resultados, siguiente = await Parcial2Service.listar_todo_usuarios(limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return respuesta_json(resultados, headers={"X-Siguiente-Cursor": siguiente} if siguiente else None)
 
 
 
@@ -153,13 +535,17 @@ async def listar_todo_usuarios():
     status_code=201,
     responses={
         201: {"description": "creado correctamente."},
+        401: {"description": "Token de Firebase ausente o no válido."},
+        403: {"description": "El _id no coincide con el del token."},
         422: {"description": "Error de validación en los datos enviados."},
         500: {"description": "Error interno del servidor."},
     },
 )
-async def crear_usuario(datos: UsuarioCrear):
+async def crear_usuario(datos: UsuarioCrear, claims: Optional[dict] = Depends(usuario_autenticado)):
     try:
-        return await Parcial2Service.crear_usuario(datos)
+        return await Parcial2Service.crear_usuario(datos, claims)
+    except SinPermiso as e:
+        raise HTTPException(status_code=403, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
@@ -171,6 +557,8 @@ async def crear_usuario(datos: UsuarioCrear):
     status_code=200,
     responses={
         200: {"description": "Actualizado correctamente."},
+        401: {"description": "Token de Firebase ausente o no válido."},
+        403: {"description": "El usuario es otro."},
         404: {"description": "Usuario no encontrada."},
         422: {"description": "Error de validación en los datos enviados."},
         500: {"description": "Error interno del servidor."},
@@ -182,9 +570,12 @@ async def modificar_usuario(
         description="El ID (ObjectId de MongoDB) del Usuario a modificar.",
         example="70fa1a01fee6ad04b5737208",
     ),
+    claims: Optional[dict] = Depends(usuario_autenticado),
 ):
     try:
-        return await Parcial2Service.modificar_usuario(id, datos)
+        return await Parcial2Service.modificar_usuario(id, datos, claims)
+    except SinPermiso as e:
+        raise HTTPException(status_code=403, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
@@ -195,6 +586,8 @@ async def modificar_usuario(
     status_code=204,  # No Content
     responses={
         204: {"description": "Usuario eliminado correctamente."},
+        401: {"description": "Token de Firebase ausente o no válido."},
+        403: {"description": "El usuario es otro."},
         404: {"description": "Usuario no encontrado."},
         422: {"description": "ID con formato inválido."},
         500: {"description": "Error interno del servidor."},
@@ -204,12 +597,15 @@ async def eliminar_usuario_por_id(
     id: str = Path(
         description="El ID (ObjectId de MongoDB) del Usuario a eliminar.",
         example="70fa1a01fee6ad04b5737208",
-    )
+    ),
+    claims: Optional[dict] = Depends(usuario_autenticado),
 ):
     try:
-        await Parcial2Service.eliminar_usuario_por_id(id)
+        await Parcial2Service.eliminar_usuario_por_id(id, claims)
         # No devolvemos contenido, cumple con el 204
         return None
+    except SinPermiso as e:
+        raise HTTPException(status_code=403, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
@@ -237,3 +633,28 @@ async def obtener_usuario_por_id(
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+
+# ===================================================
+#          Notificaciones de Cloudinary
+# ===================================================
+# ======= Webhook: subida terminada o variantes generadas ========
+@notificaciones.post(
+    "/cloudinary/notificaciones",
+    status_code=200,
+    responses={
+        200: {"description": "Notificación procesada (o ignorada si la subida no se firmó aquí)."},
+        401: {"description": "Firma de Cloudinary ausente, no válida o caducada."},
+        500: {"description": "Error interno del servidor."},
+    },
+)
+async def notificacion_cloudinary(
+    request: Request,
+    x_cld_timestamp: Optional[str] = Header(None),
+    x_cld_signature: Optional[str] = Header(None),
+):
+    # La firma se calcula sobre el cuerpo tal cual llega: no se deja a FastAPI parsearlo
+    try:
+        resultado = await Parcial2Service.notificacion_cloudinary(await request.body(), x_cld_timestamp, x_cld_signature)
+    except NotificacionNoValida as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    return {"resultado": resultado}
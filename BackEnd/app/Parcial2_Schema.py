@@ -1,5 +1,6 @@
 ﻿from datetime import datetime
-from pydantic import BaseModel, Field, model_validator
+from functools import lru_cache
+from pydantic import BaseModel, Field, create_model, model_validator
 from bson import ObjectId
 from typing import Optional
 
@@ -10,6 +11,21 @@ class Coordenada(BaseModel):
     latitud: str
     longitud: str
 
+class Medio(BaseModel):
+    # Datos que devuelve Cloudinary al subir; public_id evita tener que adivinarlo de la URL
+    url: str
+    public_id: Optional[str] = None
+    ancho: Optional[int] = None
+    alto: Optional[int] = None
+    bytes: Optional[int] = None
+    # URLs de las variantes generadas al subir ({"miniatura": ..., "media": ...})
+    variantes: Optional[dict[str, str]] = None
+
+class Autor(BaseModel):
+    # Instantánea del perfil del usuario guardada en cada reseña
+    alias: Optional[str] = None
+    foto: Optional[str] = None
+
 # ===============================================
 #  USUARIOS
 # ===============================================
@@ -66,14 +82,17 @@ class Parcial2Crear(BaseModel):
     # Coordenadas y Enlaces opcionales
     coordenadas: Optional[list[Coordenada]] = None
     enlaces: Optional[list[str]] = None 
+    # Si viene, sustituye a 'enlaces' (que se rellena con sus URLs)
+    medios: Optional[list[Medio]] = None
     
-    # --- Datos de Autoría/Token ---
-    # CAMBIO: Usamos str para evitar errores de validación con el formato de Firebase
+    # --- Datos de Autoría ---
+    # Con token (cabecera Authorization) se toman de sus claims
     autor_email: str
     autor_nombre: str
-    token_id: str        
-    token_emision: str   
-    token_caducidad: str
+    # Obsoletos: se aceptan por compatibilidad pero no se guardan
+    token_id: Optional[str] = None
+    token_emision: Optional[str] = None
+    token_caducidad: Optional[str] = None
 
     model_config = {
         "json_schema_extra": {
@@ -84,10 +103,7 @@ class Parcial2Crear(BaseModel):
                 "valoracion": 4,
                 "coordenadas": [{"latitud": "36.722", "longitud": "-4.418"}],
                 "autor_email": "pepe@gmail.com",
-                "autor_nombre": "Pepe",
-                "token_id": "eyJhbGciOi...",
-                "token_emision": "Fri, 12 Dec 2025...",
-                "token_caducidad": "Fri, 12 Dec 2025..."
+                "autor_nombre": "Pepe"
             }
         }
     }
@@ -98,6 +114,7 @@ class Parcial2Actualizar(BaseModel):
     valoracion: Optional[int] = Field(None, ge=0, le=5)
     coordenadas: Optional[list[Coordenada]] = None
     enlaces: Optional[list[str]] = None
+    medios: Optional[list[Medio]] = None
     
     model_config = {
         "json_schema_extra": {
@@ -108,6 +125,24 @@ class Parcial2Actualizar(BaseModel):
         }
     }
 
+class Parcial2BulkActualizar(BaseModel):
+    id: str
+    datos: Parcial2Actualizar
+    # Opcional: versión leída (como If-Match pero por elemento)
+    version: Optional[int] = None
+
+class Parcial2BulkResultado(BaseModel):
+    indice: int
+    id: Optional[str] = None
+    # Código HTTP que habría dado la operación individual
+    estado: int
+    error: Optional[str] = None
+
+class Parcial2BulkRespuesta(BaseModel):
+    correctos: int
+    errores: int
+    resultados: list[Parcial2BulkResultado]
+
 class Parcial2Respuesta(BaseModel):
     id: str = Field(alias="_id")
     usuarioId: str
@@ -118,13 +153,19 @@ class Parcial2Respuesta(BaseModel):
     fecha: datetime
     coordenadas: Optional[list[Coordenada]]
     enlaces: Optional[list[str]]
+    medios: Optional[list[Medio]] = None
+    # Cambia con cada escritura; es la base de la ETag
+    version: int = 0
+    # Se refresca en segundo plano al cambiar el perfil; con include=autor
+    # se completa también en reseñas que aún no la tienen
+    autor: Optional[Autor] = None
     
-    # Datos Token (Como string para visualizarlos tal cual vienen)
     autor_email: str
     autor_nombre: str
-    token_id: str
-    token_emision: str
-    token_caducidad: str
+    # Solo en reseñas antiguas sin migrar (ver migración "tokens")
+    token_id: Optional[str] = None
+    token_emision: Optional[str] = None
+    token_caducidad: Optional[str] = None
 
     @model_validator(mode="before")
     def convertir_id_a_str(cls, values):
@@ -134,4 +175,77 @@ class Parcial2Respuesta(BaseModel):
 
     model_config = {
         "populate_by_name": True
-    }
\ No newline at end of file
+    }
+
+# ======= Respuesta con solo algunos campos (?fields=) ========
+# Se construye un modelo por combinación de campos y se reutiliza: la clave es
+# la tupla ordenada de campos, así "nombre,_id" y "_id,nombre" comparten modelo
+@lru_cache(maxsize=128)
+def modelo_parcial2_con(campos: tuple[str, ...]) -> type[BaseModel]:
+    definiciones = {}
+    for nombre, campo in Parcial2Respuesta.model_fields.items():
+        if (campo.alias or nombre) in campos:
+            definiciones[nombre] = (campo.annotation, campo)
+    return create_model(
+        f"Parcial2Respuesta_{'_'.join(c.strip('_') for c in campos)}",
+        __config__={"populate_by_name": True},
+        **definiciones,
+    )
+
+class Parcial2BusquedaRespuesta(Parcial2Respuesta):
+    # Relevancia de $text (solo en modo texto)
+    puntuacion: Optional[float] = None
+
+
+# ===============================================
+#  MAPA
+# ===============================================
+class Parcial2Grupo(BaseModel):
+    # Centroide de las reseñas de una celda
+    latitud: float
+    longitud: float
+    total: int
+    # Con total == 1 es la propia reseña y el cliente puede pintarla como pin
+    id: Optional[str] = None
+
+    @model_validator(mode="before")
+    def convertir_id_a_str(cls, values):
+        if "id" in values and isinstance(values["id"], ObjectId):
+            values["id"] = str(values["id"])
+        return values
+
+class Parcial2Mapa(BaseModel):
+    agrupado: bool
+    elementos: list[Parcial2Respuesta] = []
+    grupos: list[Parcial2Grupo] = []
+
+
+# ===============================================
+#  ESTADÍSTICAS
+# ===============================================
+class EstadisticaEstablecimiento(BaseModel):
+    nombre: str
+    total: int
+    media: float
+
+class Parcial2Estadisticas(BaseModel):
+    total: int
+    media: Optional[float] = None
+    # Número de reseñas por valoración ("0" a "5")
+    histograma: dict[str, int]
+    top: list[EstadisticaEstablecimiento]
+
+
+# ===============================================
+#  SUBIDAS DIRECTAS A CLOUDINARY
+# ===============================================
+class Parcial2SubidaCrear(BaseModel):
+    # Si viene, la imagen se añade a esa reseña cuando Cloudinary avise al webhook
+    parcial2Id: Optional[str] = None
+
+class Parcial2Subida(BaseModel):
+    # El navegador hace POST multipart a `url` con `campos` y el fichero en "file"
+    url: str
+    campos: dict[str, str | int]
+    public_id: str
+    caduca: datetime
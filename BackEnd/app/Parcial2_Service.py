@@ -1,81 +1,204 @@
 ﻿from typing import Optional
-from datetime import datetime, date
+import asyncio
+from datetime import datetime, date, timedelta
+from functools import lru_cache
 from zoneinfo import ZoneInfo
+import base64
+import json
+import uuid
 from app.Parcial2_Repository import Parcial2Repository
-from app.Parcial2_Schema import Parcial2Crear, Parcial2Actualizar, Parcial2Respuesta, UsuarioActualizar, UsuarioRespuesta, UsuarioCrear 
+from app.Parcial2_Schema import modelo_parcial2_con, Parcial2Crear, Parcial2Actualizar, Parcial2Respuesta, Parcial2BusquedaRespuesta, Parcial2Mapa, Parcial2Estadisticas, Parcial2BulkActualizar, UsuarioActualizar, UsuarioRespuesta, UsuarioCrear 
 from bson import ObjectId
+from pydantic import ValidationError
 from app.core.config import settings
+from app.core.indices import resumir_explain
+from app.core.texto import normalizar, regex_prefijo, escapar_busqueda_texto
+from app.core.geo import coordenadas_a_location, filtro_rectangulo, tamano_celda, dentro_de_rectangulo
+from app.core.media import cola_borrado, sincronizar_medios, public_ids_de, firmar_subida, verificar_notificacion, medio_desde_notificacion, variantes_de_notificacion, con_variantes
+from app.core.cache import cache, obtener_o_cargar, CacheMemoria
+from app.core.coalescencia import crear_coalescedor
+from app.core.auth import referencia_token
+from app.core.etag import etag_lista, etag_documento, coincide
+from app.core.serializacion import SerializadorLectura, a_bytes
+from app.core.caducidad import BarrenderoUsuarios
+from app.core.cambios import DifusorCambios
+from app.core.tareas import en_segundo_plano
+from app.core import exportacion
+from app.core.metricas import USUARIOS_CADUCADOS, RESENAS_CASCADA
 
-# --- IMPORTAMOS CLOUDINARY ---
-import cloudinary
-import cloudinary.uploader
-import os
+# Lecturas: documentos de Mongo -> JSON sin validar otra vez (ver app/core/serializacion.py)
+serializador_parcial2 = SerializadorLectura(Parcial2Respuesta)
+serializador_busqueda = SerializadorLectura(Parcial2BusquedaRespuesta)
+serializador_usuario = SerializadorLectura(UsuarioRespuesta)
 
-# Configuramos Cloudinary usando las variables de entorno (o hardcodeado si tienes prisa, pero mejor .env)
-# Nota: Para el examen, si no te carga el .env rápido, puedes poner los strings directos aquí.
-cloudinary.config( 
-  cloud_name = os.getenv("CLOUDINARY_CLOUD_NAME"), 
-  api_key = os.getenv("CLOUDINARY_API_KEY"), 
-  api_secret = os.getenv("CLOUDINARY_API_SECRET"),
-  secure = True
-)
+# Listados idénticos a la vez comparten una única consulta (ver app/core/coalescencia.py)
+coalescedor = crear_coalescedor(cache)
+
+# Alias y foto de los autores por worker; los que no existen se guardan como {}
+cache_autores = CacheMemoria(max_entradas=settings.AUTORES_CACHE_MAX, ttl=settings.AUTORES_CACHE_TTL)
+
+# Cambios en vivo para /Parcial2/stream (ver app/core/cambios.py)
+difusor_cambios = DifusorCambios(lambda documento: a_bytes(serializador_parcial2.documento(documento)))
+
+@lru_cache(maxsize=128)
+def serializador_con(campos: Optional[tuple[str, ...]]) -> SerializadorLectura:
+    return SerializadorLectura(modelo_parcial2_con(campos)) if campos else serializador_parcial2
+
+# Versión (en Versiones) de la caché de perfiles de Usuario
+GRUPO_PERFILES = "perfiles"
+
+# If-Match no coincide con la versión actual del documento (HTTP 412)
+class VersionNoCoincide(Exception):
+    pass
+
+# El token es de otro usuario que el dueño de la reseña (HTTP 403)
+class SinPermiso(Exception):
+    pass
 
 class Parcial2Service():
 
+    #===================================================
+    #               PARCIAL2 SERVICE
+    #===================================================
+    
     # ================================================================
-    #   HELPER: Función para borrar foto de Cloudinary dado su URL
+    #   HELPERS: cursor opaco de paginación (fecha, _id)
     # ================================================================
     @staticmethod
-    def borrar_foto_cloudinary(url: str):
+    def codificar_cursor(documento: dict) -> str:
+        crudo = json.dumps([documento["fecha"].isoformat(), str(documento["_id"])])
+        return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def decodificar_cursor(cursor: str) -> tuple[datetime, ObjectId]:
         try:
-            # La URL es tipo: https://res.cloudinary.com/demo/image/upload/v123456/carpeta/mi_foto.jpg
-            # El Public ID es lo que está después de 'upload/vxxxxx/' y sin la extensión.
-            # Ejemplo simplificado: "carpeta/mi_foto"
-            
-            if "cloudinary" not in url:
-                return # No es de cloudinary
-
-            # Extraer el public_id es un poco truculento, esta es una forma rápida:
-            # Rompemos la URL por partes y cogemos la última parte (nombre.jpg)
-            partes = url.split("/")
-            nombre_con_extension = partes[-1]
-            public_id = nombre_con_extension.split(".")[0] # Quitamos .jpg
-            
-            # Si usas carpetas en cloudinary, el public_id incluye la carpeta. 
-            # Una forma más robusta suele ser necesaria si usas carpetas, 
-            # pero para subidas simples a la raíz, esto suele valer.
-            
-            # NOTA: Si usaste un 'upload_preset' que mete las fotos en una carpeta, 
-            # el public_id debe incluir esa carpeta.
-            # Truco rápido: Cloudinary devuelve el public_id al subir, lo ideal sería guardarlo en la BBDD.
-            # Como solo guardamos la URL, intentaremos borrar usando el nombre de archivo.
-            
-            print(f"Intentando borrar imagen en Cloudinary: {public_id}")
-            cloudinary.uploader.destroy(public_id)
-            
-        except Exception as e:
-            print(f"Error borrando imagen de Cloudinary: {e}")
+            relleno = "=" * (-len(cursor) % 4)
+            fecha, ultimo_id = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+            return datetime.fromisoformat(fecha), ObjectId(ultimo_id)
+        except Exception:
+            raise ValueError("Cursor no válido")
+
+    # ================================================================
+    #   HELPERS: caché de lecturas (ver app/core/cache.py)
+    # ================================================================
+    @staticmethod
+    def a_json(documento: dict) -> dict:
+        # Lo que se guarda en caché: el documento ya serializable
+        return serializador_parcial2.documento(documento)
 
+    @staticmethod
+    def grupo_lista(usuarioId: Optional[str]) -> str:
+        # Las listas de un usuario solo dependen de su versión; las demás, de la global
+        return f"usuario:{usuarioId}" if usuarioId else "parcial2"
 
-    #===================================================
-    #               PARCIAL2 SERVICE
-    #===================================================
-    
-    # ... (LISTAR_TODO SE MANTIENE IGUAL) ...
     @staticmethod
-    async def listar_todo(
+    async def invalidar(*documentos: dict):
+        # Tras escribir: nueva versión para sus listados (la clave y la ETag de
+        # los listados llevan esa versión). Los documentos no hace falta
+        # borrarlos: su clave lleva su propia versión, que la escritura ya ha
+        # subido, y así ningún worker sirve la anterior
+        usuarios = {f"usuario:{d['usuarioId']}" for d in documentos if d.get("usuarioId")}
+        await Parcial2Repository.incrementar_versiones(["parcial2", *usuarios])
+
+    # ================================================================
+    #   HELPERS: resumen por establecimiento (colección Parcial2Resumen)
+    # ================================================================
+    # Cada reseña suma 1 a su establecimiento (clave = nombre normalizado) y su
+    # valoración a la suma y al histograma; las escrituras lo mantienen con $inc
+    @staticmethod
+    def _entrada_resumen(documento: dict, signo: int) -> tuple[str, str, int, int]:
+        clave = documento.get("nombre_normalizado") or normalizar(documento.get("nombre") or "")
+        return clave, documento.get("nombre"), documento.get("valoracion") or 0, signo
+
+    @staticmethod
+    async def actualizar_resumen(quitados: list[dict] = (), anadidos: list[dict] = ()):
+        cambios = [Parcial2Service._entrada_resumen(d, -1) for d in quitados]
+        cambios += [Parcial2Service._entrada_resumen(d, +1) for d in anadidos]
+        await Parcial2Repository.actualizar_resumen(cambios)
+
+    # ================================================================
+    #   HELPERS: autor (alias/foto del Usuario) de cada reseña
+    # ================================================================
+    # Cada reseña guarda una instantánea que se refresca en segundo plano al
+    # cambiar el perfil; con include=autor las que aún no la tienen se
+    # completan con una sola consulta $in por página
+    @staticmethod
+    async def autores_de(ids) -> dict[str, Optional[dict]]:
+        autores, pendientes = {}, []
+        for usuarioId in set(ids):
+            autor = await cache_autores.obtener(f"autor:{usuarioId}")
+            if autor is None:
+                pendientes.append(usuarioId)
+            else:
+                autores[usuarioId] = autor or None
+        if pendientes:
+            perfiles = await Parcial2Repository.perfiles_de_usuarios(pendientes)
+            for usuarioId in pendientes:
+                perfil = perfiles.get(usuarioId)
+                autor = {"alias": perfil.get("alias"), "foto": perfil.get("foto")} if perfil else None
+                await cache_autores.guardar(f"autor:{usuarioId}", autor or {})
+                autores[usuarioId] = autor
+        return autores
+
+    @staticmethod
+    async def resolver_autores(documentos: list[dict]) -> list[dict]:
+        # Copias: los documentos pueden venir de la caché en memoria
+        sin_autor = {d.get("usuarioId") for d in documentos if d.get("autor") is None and d.get("usuarioId")}
+        if not sin_autor:
+            return documentos
+        autores = await Parcial2Service.autores_de(sin_autor)
+        return [
+            {**d, "autor": autores.get(d.get("usuarioId"))} if d.get("autor") is None else d
+            for d in documentos
+        ]
+
+    @staticmethod
+    async def refrescar_autor(usuarioId: str):
+        # Se lee el perfil actual: si llegan dos cambios seguidos gana el último
+        await cache_autores.borrar(f"autor:{usuarioId}")
+        autor = (await Parcial2Service.autores_de([usuarioId])).get(usuarioId)
+        ids = await Parcial2Repository.actualizar_autor(usuarioId, autor)
+        if ids:
+            await Parcial2Repository.incrementar_versiones(["parcial2", f"usuario:{usuarioId}"])
+
+    # ======= ?fields= -> campos pedidos (ordenados) y proyección de Mongo ========
+    @staticmethod
+    def campos_de(fields: Optional[str], autor: bool = False) -> Optional[tuple[str, ...]]:
+        if not fields:
+            return None
+        validos = {campo.alias or nombre for nombre, campo in Parcial2Respuesta.model_fields.items()}
+        pedidos = {"_id" if c.strip() == "id" else c.strip() for c in fields.split(",") if c.strip()}
+        desconocidos = pedidos - validos
+        if desconocidos:
+            raise ValueError(f"Campos desconocidos: {', '.join(sorted(desconocidos))}")
+        # _id siempre: es la clave del elemento en el cliente
+        if autor:
+            pedidos.add("autor")
+        return tuple(sorted(pedidos | {"_id"}))
+
+    @staticmethod
+    def proyeccion_de(campos: Optional[tuple[str, ...]]) -> Optional[dict]:
+        if not campos:
+            return None
+        # fecha hace falta para el cursor y usuarioId para completar el autor aunque no se devuelvan
+        return {**{c: 1 for c in campos}, "fecha": 1, "usuarioId": 1}
+
+    # ======= Construir el filtro de Mongo a partir de los parámetros ========
+    @staticmethod
+    def construir_filtro(
             nombre: Optional[str] = None,
             numero: Optional[int] = None,
             fechaComienzo: Optional[date] = None,
             fechaFinal: Optional[date] = None,
             booleana: Optional[bool] = None,
             usuarioId: Optional[str] = None,
-        ):
+        ) -> dict:
         filtro = {}
         if usuarioId:
             filtro["usuarioId"] = usuarioId
         if nombre:
-            filtro["nombre"] = {"$regex": nombre, "$options": "i"}
+            # Prefijo anclado sobre el campo normalizado: usa índice y no admite regex del usuario
+            filtro["nombre_normalizado"] = regex_prefijo(nombre)
         if numero is not None:
             filtro["numero"] = numero
         if booleana is not None:
@@ -86,56 +209,348 @@ class Parcial2Service():
                 filtro["fecha"]["$gte"] = datetime.combine(fechaComienzo, datetime.min.time(), tzinfo=ZoneInfo("Europe/Madrid"))
             if fechaFinal:
                 filtro["fecha"]["$lte"] = datetime.combine(fechaFinal, datetime.max.time(), tzinfo=ZoneInfo("Europe/Madrid"))
-    
-        return await Parcial2Repository.listar_todo(filtro)
+        return filtro
+
+    # ======= Listar una página (devuelve documentos, cursor siguiente y ETag) ========
+    # Si If-None-Match coincide con la ETag no se consulta nada y los
+    # documentos vuelven como None (304)
+    @staticmethod
+    async def listar_todo(
+            nombre: Optional[str] = None,
+            numero: Optional[int] = None,
+            fechaComienzo: Optional[date] = None,
+            fechaFinal: Optional[date] = None,
+            booleana: Optional[bool] = None,
+            usuarioId: Optional[str] = None,
+            limite: Optional[int] = None,
+            cursor: Optional[str] = None,
+            if_none_match: Optional[str] = None,
+            fields: Optional[str] = None,
+            imagenes: str = settings.CLOUDINARY_VARIANTE_LISTADOS,
+            autor: bool = False,
+        ) -> tuple[Optional[list[dict]], Optional[str], str]:
+        filtro = Parcial2Service.construir_filtro(nombre, numero, fechaComienzo, fechaFinal, booleana, usuarioId)
+        despues = Parcial2Service.decodificar_cursor(cursor) if cursor else None
+        limite = limite or settings.LISTADO_LIMITE_DEFECTO
+        campos = Parcial2Service.campos_de(fields, autor)
+
+        grupo = Parcial2Service.grupo_lista(usuarioId)
+        version = await Parcial2Repository.obtener_version(grupo)
+        etag = etag_lista(grupo, version, nombre, numero, fechaComienzo, fechaFinal, booleana, limite, cursor, campos, imagenes, autor)
+        if coincide(if_none_match, etag):
+            return None, None, etag
+
+        async def cargar():
+            resultados = await Parcial2Repository.listar_todo(filtro, limite, despues, Parcial2Service.proyeccion_de(campos))
+            siguiente = None
+            if len(resultados) > limite:
+                resultados = resultados[:limite]
+                siguiente = Parcial2Service.codificar_cursor(resultados[-1])
+            if autor:
+                resultados = await Parcial2Service.resolver_autores(resultados)
+            return {"resultados": con_variantes(serializador_con(campos).lista(resultados), imagenes), "siguiente": siguiente}
+
+        # La ETag identifica filtro, página y versión: misma ETag, misma consulta
+        clave = f"lista:{etag}"
+        pagina = await coalescedor.ejecutar(clave, lambda: obtener_o_cargar(cache, clave, cargar))
+        return pagina["resultados"], pagina["siguiente"], etag
+
+    # ======= Listar en streaming NDJSON (un documento por línea) ========
+    @staticmethod
+    async def listar_ndjson(
+            nombre: Optional[str] = None,
+            numero: Optional[int] = None,
+            fechaComienzo: Optional[date] = None,
+            fechaFinal: Optional[date] = None,
+            booleana: Optional[bool] = None,
+            usuarioId: Optional[str] = None,
+            limite: Optional[int] = None,
+            cursor: Optional[str] = None,
+            fields: Optional[str] = None,
+        ):
+        filtro = Parcial2Service.construir_filtro(nombre, numero, fechaComienzo, fechaFinal, booleana, usuarioId)
+        despues = Parcial2Service.decodificar_cursor(cursor) if cursor else None
+        campos = Parcial2Service.campos_de(fields)
+        documentos = Parcial2Repository.iterar(filtro, settings.LISTADO_LOTE_STREAM, despues, limite, Parcial2Service.proyeccion_de(campos))
+        serializador = serializador_con(campos)
+
+        async def generar():
+            async for documento in documentos:
+                yield a_bytes(serializador.documento(documento)) + b"\n"
+
+        return generar()
+
+
+    # ======= Diagnóstico: explain() del filtro de listado ========
+    @staticmethod
+    async def explicar_listado(
+            nombre: Optional[str] = None,
+            numero: Optional[int] = None,
+            fechaComienzo: Optional[date] = None,
+            fechaFinal: Optional[date] = None,
+            booleana: Optional[bool] = None,
+            usuarioId: Optional[str] = None,
+        ) -> dict:
+        filtro = Parcial2Service.construir_filtro(nombre, numero, fechaComienzo, fechaFinal, booleana, usuarioId)
+        explain = await Parcial2Repository.explicar_listado(filtro, settings.LISTADO_LIMITE_DEFECTO)
+        return {"filtro": repr(filtro), **resumir_explain(explain)}
+
+
+    # ======= Buscar por texto (relevancia) o por prefijo (autocompletar) ========
+    @staticmethod
+    async def buscar(q: str, modo: str = "texto", usuarioId: Optional[str] = None, limite: Optional[int] = None, imagenes: str = settings.CLOUDINARY_VARIANTE_LISTADOS):
+        limite = limite or settings.LISTADO_LIMITE_DEFECTO
+        filtro = {"usuarioId": usuarioId} if usuarioId else {}
+        if modo == "prefijo":
+            if not normalizar(q):
+                raise ValueError("Búsqueda vacía")
+            filtro["nombre_normalizado"] = regex_prefijo(q)
+            return con_variantes(serializador_busqueda.lista(await Parcial2Repository.buscar_prefijo(filtro, limite)), imagenes)
+        filtro["$text"] = {"$search": escapar_busqueda_texto(q)}
+        return con_variantes(serializador_busqueda.lista(await Parcial2Repository.buscar_texto(filtro, limite)), imagenes)
+
+
+    # ======= Reseñas en un radio (metros) alrededor de un punto ========
+    @staticmethod
+    async def listar_cercanos(latitud: float, longitud: float, radio: int, usuarioId: Optional[str] = None, limite: Optional[int] = None, imagenes: str = settings.CLOUDINARY_VARIANTE_LISTADOS):
+        filtro = {"location": {"$nearSphere": {
+            "$geometry": {"type": "Point", "coordinates": [longitud, latitud]},
+            "$maxDistance": radio,
+        }}}
+        if usuarioId:
+            filtro["usuarioId"] = usuarioId
+        resultados = serializador_parcial2.lista(await Parcial2Repository.listar_cercanos(filtro, limite or settings.LISTADO_LIMITE_DEFECTO))
+        return con_variantes(resultados, imagenes)
+
+    # ======= Reseñas de la vista del mapa, agrupadas si el zoom es bajo ========
+    @staticmethod
+    async def listar_mapa(sur: float, oeste: float, norte: float, este: float, zoom: int, usuarioId: Optional[str] = None):
+        if sur > norte:
+            raise ValueError("El límite sur no puede estar por encima del norte")
+        filtro = filtro_rectangulo(sur, oeste, norte, este)
+        if usuarioId:
+            filtro = {"$and": [filtro, {"usuarioId": usuarioId}]}
+
+        if zoom < settings.MAPA_ZOOM_AGRUPAR:
+            celda = tamano_celda(zoom, settings.MAPA_CELDAS_POR_TESELA)
+            grupos = await Parcial2Repository.agrupar_en_vista(filtro, celda, settings.MAPA_LIMITE)
+            return Parcial2Mapa(agrupado=True, grupos=grupos)
+
+        elementos = await Parcial2Repository.listar_en_vista(filtro, settings.MAPA_LIMITE)
+        return Parcial2Mapa(agrupado=False, elementos=elementos)
+
+
+    # ======= Cambios en vivo (SSE) filtrados por usuario y/o vista del mapa ========
+    @staticmethod
+    def stream(usuarioId: Optional[str] = None, vista: Optional[tuple[float, float, float, float]] = None, desde: Optional[str] = None):
+        if vista and vista[0] > vista[2]:
+            raise ValueError("El límite sur no puede estar por encima del norte")
+
+        def filtro(campos: dict) -> bool:
+            if usuarioId and campos["usuarioId"] != usuarioId:
+                return False
+            return not vista or dentro_de_rectangulo(campos["location"], *vista)
+
+        return difusor_cambios.eventos(filtro, desde)
+
+
+    # ======= Estadísticas globales: media, histograma y mejor valorados ========
+    # Sin filtros se leen del resumen; con filtros se agregan las reseñas que
+    # cumplen el filtro. En ambos casos se cachean con la versión del listado.
+    @staticmethod
+    async def estadisticas(
+            nombre: Optional[str] = None,
+            numero: Optional[int] = None,
+            fechaComienzo: Optional[date] = None,
+            fechaFinal: Optional[date] = None,
+            booleana: Optional[bool] = None,
+            usuarioId: Optional[str] = None,
+            min_resenas: int = 1,
+            limite: int = 10,
+        ) -> Parcial2Estadisticas:
+        filtro = Parcial2Service.construir_filtro(nombre, numero, fechaComienzo, fechaFinal, booleana, usuarioId)
+        grupo = Parcial2Service.grupo_lista(usuarioId)
+        version = await Parcial2Repository.obtener_version(grupo)
+        clave = etag_lista(grupo, version, "estadisticas", nombre, numero, fechaComienzo, fechaFinal, booleana, min_resenas, limite)
+
+        async def cargar():
+            if filtro:
+                crudo = await Parcial2Repository.estadisticas_filtradas(filtro, min_resenas, limite)
+            else:
+                crudo = await Parcial2Repository.estadisticas_resumen(min_resenas, limite)
+            total = crudo["global"][0] if crudo["global"] else {"total": 0, "media": None}
+            histograma = {str(valor): 0 for valor in range(6)}
+            for cubeta in crudo["histograma"]:
+                if str(cubeta["_id"]) in histograma:
+                    histograma[str(cubeta["_id"])] = cubeta["total"]
+            return Parcial2Estadisticas(
+                total=total["total"], media=total["media"], histograma=histograma, top=crudo["top"],
+            ).model_dump(mode="json")
+
+        return Parcial2Estadisticas(**await obtener_o_cargar(cache, f"estadisticas:{clave}", cargar))
+
+    # ======= Ranking de establecimientos por media o por número de reseñas ========
+    @staticmethod
+    async def estadisticas_establecimientos(
+            nombre: Optional[str] = None,
+            numero: Optional[int] = None,
+            fechaComienzo: Optional[date] = None,
+            fechaFinal: Optional[date] = None,
+            booleana: Optional[bool] = None,
+            usuarioId: Optional[str] = None,
+            orden: str = "media",
+            min_resenas: int = 1,
+            limite: Optional[int] = None,
+        ) -> list[dict]:
+        filtro = Parcial2Service.construir_filtro(nombre, numero, fechaComienzo, fechaFinal, booleana, usuarioId)
+        limite = limite or settings.LISTADO_LIMITE_DEFECTO
+        grupo = Parcial2Service.grupo_lista(usuarioId)
+        version = await Parcial2Repository.obtener_version(grupo)
+        clave = etag_lista(grupo, version, "establecimientos", nombre, numero, fechaComienzo, fechaFinal, booleana, orden, min_resenas, limite)
+        secundario = "total" if orden == "media" else "media"
+        criterio = {orden: -1, secundario: -1, "_id": 1}
+
+        async def cargar():
+            filas = await Parcial2Repository.establecimientos(filtro or None, criterio, min_resenas, limite)
+            return [{"nombre": f["nombre"], "total": f["total"], "media": f["media"]} for f in filas]
+
+        return await obtener_o_cargar(cache, f"estadisticas:{clave}", cargar)
+
+
+    # ======= Diagnóstico: contadores de la caché ========
+    @staticmethod
+    def estadisticas_cache() -> dict:
+        return cache.estadisticas()
+
+
+    # ================================================================
+    #   HELPERS: campos derivados que se guardan con cada escritura
+    # ================================================================
+    @staticmethod
+    def preparar_nuevo(datos: Parcial2Crear, claims: Optional[dict] = None) -> dict:
+        # Los JWT que aún manden los clientes antiguos no se guardan
+        datos_dict = datos.model_dump(exclude={"token_id", "token_emision", "token_caducidad"})
+        if claims:
+            if datos.usuarioId != claims["sub"]:
+                raise SinPermiso("No se puede crear una reseña a nombre de otro usuario")
+            datos_dict["autor_email"] = claims.get("email") or datos_dict["autor_email"]
+            datos_dict["autor_nombre"] = claims.get("name") or datos_dict["autor_nombre"]
+            datos_dict["token_ref"] = referencia_token(claims)
+        datos_dict["nombre_normalizado"] = normalizar(datos_dict["nombre"])
+        datos_dict["version"] = 1
+        datos_dict["location"] = coordenadas_a_location(datos_dict.get("coordenadas"))
+        sincronizar_medios(datos_dict)
+        return datos_dict
+
+    @staticmethod
+    def comprobar_dueno(documento: dict, claims: Optional[dict]):
+        if claims and documento.get("usuarioId") != claims["sub"]:
+            raise SinPermiso("La reseña es de otro usuario")
+
+    @staticmethod
+    def comprobar_perfil(id: str, claims: Optional[dict]):
+        # El perfil (alias y foto) se copia en todas sus reseñas: solo lo toca su dueño
+        if claims and id != claims["sub"]:
+            raise SinPermiso("El perfil es de otro usuario")
+
+    @staticmethod
+    def preparar_cambios(datos: Parcial2Actualizar, original: Optional[dict] = None) -> tuple[dict, set[str]]:
+        # Devuelve el $set y, si se conoce el original, los public_id que dejan de usarse
+        datos_dict = {k: v for k, v in datos.model_dump().items() if v is not None}
+
+        if not datos_dict:
+            raise ValueError("No hay datos para actualizar")
+
+        if "nombre" in datos_dict:
+            datos_dict["nombre_normalizado"] = normalizar(datos_dict["nombre"])
+        if "coordenadas" in datos_dict:
+            datos_dict["location"] = coordenadas_a_location(datos_dict["coordenadas"])
+
+        # Detectar si han cambiado las fotos
+        # Si en los nuevos datos vienen 'medios' o 'enlaces', comparamos por public_id
+        fotos_borradas = set()
+        if "medios" in datos_dict or "enlaces" in datos_dict:
+            sincronizar_medios(datos_dict, (original or {}).get("medios"))
+            if original:
+                fotos_borradas = public_ids_de(original) - public_ids_de(datos_dict)
+        return datos_dict, fotos_borradas
 
 
     # ... (CREAR SE MANTIENE IGUAL) ...
     @staticmethod
-    async def crear(datos: Parcial2Crear):
-        datos_dict = datos.model_dump()
+    async def crear(datos: Parcial2Crear, claims: Optional[dict] = None):
+        datos_dict = Parcial2Service.preparar_nuevo(datos, claims)
+        datos_dict["autor"] = (await Parcial2Service.autores_de([datos_dict["usuarioId"]])).get(datos_dict["usuarioId"])
         resultadoId = await Parcial2Repository.crear(datos_dict)
         datosRespuesta = {"_id": resultadoId, **datos_dict}
+        await Parcial2Service.actualizar_resumen(anadidos=[datosRespuesta])
+        await Parcial2Service.invalidar(datosRespuesta)
         return Parcial2Respuesta(**datosRespuesta)
 
 
     # ======= Modificar Parcial2 (CON BORRADO DE FOTO ANTIGUA) ========
     @staticmethod
-    async def modificar(id: str, datos: Parcial2Actualizar):
+    async def modificar(id: str, datos: Parcial2Actualizar, version_esperada: Optional[int] = None, claims: Optional[dict] = None):
         try:
             objetoId = ObjectId(id)
         except:
             raise ValueError("ID no válida")
 
-        # 1. Obtenemos el objeto ORIGINAL antes de cambiarlo
-        original = await Parcial2Repository.obtener_por_id(objetoId)
-        if not original:
-            raise ValueError("Elemento no encontrado")
+        # 1. Cambios a guardar. Si llegan 'enlaces' sin 'medios' (el FrontEnd
+        # manda las URLs en cada edición) hace falta el documento guardado
+        # para conservar los metadatos y las variantes de las URLs que siguen
+        usuarioId = claims["sub"] if claims else None
+        if datos.enlaces is not None and datos.medios is None:
+            original, datos_dict = await Parcial2Service._modificar_enlaces(objetoId, datos, version_esperada, usuarioId)
+        else:
+            datos_dict, _ = Parcial2Service.preparar_cambios(datos)
+            # 2. Un solo viaje: se actualiza y Mongo devuelve el documento ANTERIOR
+            original = await Parcial2Repository.modificar(objetoId, datos_dict, version_esperada, usuarioId)
+        if original is None:
+            # Solo en el camino de error se lee el documento para distinguir 404, 403 y 412
+            actual = await Parcial2Repository.obtener_por_id(objetoId)
+            if not actual:
+                raise ValueError("Elemento no encontrado")
+            Parcial2Service.comprobar_dueno(actual, claims)
+            raise VersionNoCoincide("El elemento ha cambiado desde que se leyó")
 
-        datos_dict = {k: v for k, v in datos.model_dump().items() if v is not None}
+        # El documento nuevo es el anterior con el $set y el $inc aplicados
+        resultado = {**original, **datos_dict, "version": original.get("version", 0) + 1}
+        if "nombre" in datos_dict or "valoracion" in datos_dict:
+            await Parcial2Service.actualizar_resumen([original], [resultado])
+        await Parcial2Service.invalidar(original)
 
-        if not datos_dict:
-            raise ValueError("No hay datos para actualizar")
-
-        # 2. Detectar si han cambiado las fotos
-        # Si en los nuevos datos viene 'enlaces' y es diferente al original
-        if "enlaces" in datos_dict:
-            fotos_nuevas = datos_dict["enlaces"] or []
-            fotos_viejas = original.get("enlaces", []) or []
+        # 3. Las fotos que estaban antes y ya no están se encolan para borrarlas
+        # en segundo plano (ver app/core/media.py)
+        if "medios" in datos_dict:
+            await cola_borrado.encolar(public_ids_de(original) - public_ids_de(resultado))
+        return Parcial2Respuesta(**resultado)
 
-            # Buscamos qué fotos estaban antes y ya no están ahora
-            for foto_vieja in fotos_viejas:
-                if foto_vieja not in fotos_nuevas:
-                    # Si la foto vieja no está en la lista nueva, la borramos
-                    Parcial2Service.borrar_foto_cloudinary(foto_vieja)
 
-        resultado = await Parcial2Repository.modificar(objetoId, datos_dict)
-        return Parcial2Respuesta(**resultado)
+    # Leer, fusionar medios y escribir condicionado a la versión leída: si el
+    # webhook añade una foto o sus variantes entre medias, la versión cambia y
+    # se repite con el documento nuevo (con If-Match del cliente, 412)
+    @staticmethod
+    async def _modificar_enlaces(objetoId: ObjectId, datos: Parcial2Actualizar, version_esperada: Optional[int], usuarioId: Optional[str], intentos: int = 3) -> tuple[Optional[dict], dict]:
+        datos_dict = {}
+        for _ in range(intentos):
+            actual = await Parcial2Repository.obtener_por_id(objetoId)
+            if not actual:
+                break
+            version = actual.get("version", 0)
+            # 403 y 412 los distingue modificar en su camino de error
+            if (usuarioId is not None and actual.get("usuarioId") != usuarioId) or (version_esperada is not None and version != version_esperada):
+                break
+            datos_dict, _ = Parcial2Service.preparar_cambios(datos, actual)
+            original = await Parcial2Repository.modificar(objetoId, datos_dict, version, usuarioId)
+            if original is not None or version_esperada is not None:
+                return original, datos_dict
+        return None, datos_dict
 
 
     # ======= Eliminar Parcial2 (CON BORRADO DE TODAS LAS FOTOS) ========
     @staticmethod
-    async def eliminar_por_id(id: str):
+    async def eliminar_por_id(id: str, claims: Optional[dict] = None):
         try:
             objetoId = ObjectId(id)
         except:
@@ -145,59 +560,466 @@ class Parcial2Service():
         elemento = await Parcial2Repository.obtener_por_id(objetoId)
         if not elemento:
             raise ValueError("No encontrado")
+        Parcial2Service.comprobar_dueno(elemento, claims)
 
-        # 2. Borrar las fotos de Cloudinary
-        fotos = elemento.get("enlaces", [])
-        if fotos:
-            for foto in fotos:
-                Parcial2Service.borrar_foto_cloudinary(foto)
-
-        # 3. Borrar de la base de datos
+        # 2. Borrar de la base de datos
         eliminado = await Parcial2Repository.eliminar_por_id(objetoId)
         if not eliminado:
             raise ValueError("No se pudo eliminar de la BD")
+        await Parcial2Service.actualizar_resumen(quitados=[elemento])
+        await Parcial2Service.invalidar(elemento)
+
+        # 3. Encolar el borrado de las fotos de Cloudinary (no esperamos a la API)
+        await cola_borrado.encolar(public_ids_de(elemento))
+
+
+    # ================================================================
+    #   OPERACIONES EN LOTE (bulk_write desordenado, resultado por elemento)
+    # ================================================================
+    @staticmethod
+    def _ids_validos(ids: list[str], resultados: list[dict]) -> dict[int, ObjectId]:
+        validos = {}
+        for indice, id in enumerate(ids):
+            try:
+                validos[indice] = ObjectId(id)
+            except Exception:
+                resultados[indice] = {"indice": indice, "id": id, "estado": 422, "error": "ID no válida"}
+        return validos
+
+    @staticmethod
+    def _resumen(resultados: list[dict]) -> dict:
+        correctos = sum(1 for r in resultados if r["estado"] < 400)
+        return {"correctos": correctos, "errores": len(resultados) - correctos, "resultados": resultados}
+
+    # ======= Crear en lote ========
+    @staticmethod
+    async def crear_varios(elementos: list[dict], claims: Optional[dict] = None) -> dict:
+        resultados = [None] * len(elementos)
+        documentos, indices = [], []
+        for indice, elemento in enumerate(elementos):
+            try:
+                datos_dict = Parcial2Service.preparar_nuevo(Parcial2Crear.model_validate(elemento), claims)
+            except ValidationError as e:
+                resultados[indice] = {"indice": indice, "estado": 422, "error": str(e)}
+                continue
+            except SinPermiso as e:
+                resultados[indice] = {"indice": indice, "estado": 403, "error": str(e)}
+                continue
+            # _id generado aquí para poder devolverlo por elemento
+            datos_dict["_id"] = ObjectId()
+            documentos.append(datos_dict)
+            indices.append(indice)
+
+        # Instantánea del autor: una consulta para todo el lote
+        autores = await Parcial2Service.autores_de(d["usuarioId"] for d in documentos)
+        for documento in documentos:
+            documento["autor"] = autores.get(documento["usuarioId"])
+
+        errores = await Parcial2Repository.crear_varios(documentos)
+        for posicion, (indice, documento) in enumerate(zip(indices, documentos)):
+            if posicion in errores:
+                resultados[indice] = {"indice": indice, "estado": 409, "error": errores[posicion]}
+            else:
+                resultados[indice] = {"indice": indice, "id": str(documento["_id"]), "estado": 201}
+
+        creados = [d for p, d in enumerate(documentos) if p not in errores]
+        if creados:
+            await Parcial2Service.actualizar_resumen(anadidos=creados)
+            await Parcial2Service.invalidar(*creados)
+        return Parcial2Service._resumen(resultados)
+
+    # ======= Modificar en lote ========
+    @staticmethod
+    async def modificar_varios(elementos: list[Parcial2BulkActualizar], claims: Optional[dict] = None) -> dict:
+        resultados = [None] * len(elementos)
+        validos = Parcial2Service._ids_validos([e.id for e in elementos], resultados)
+        originales = await Parcial2Repository.obtener_varios(list(validos.values()))
+
+        operaciones, pendientes = [], []
+        vistos = set()
+        for indice, objetoId in validos.items():
+            elemento = elementos[indice]
+            # Una sola operación por documento: la segunda casaría con la
+            # misma versión y el resumen se aplicaría dos veces
+            if objetoId in vistos:
+                resultados[indice] = {"indice": indice, "id": elemento.id, "estado": 422, "error": "ID repetida en la petición"}
+                continue
+            vistos.add(objetoId)
+            original = originales.get(objetoId)
+            if not original:
+                resultados[indice] = {"indice": indice, "id": elemento.id, "estado": 404, "error": "No encontrado"}
+                continue
+            if claims and original.get("usuarioId") != claims["sub"]:
+                resultados[indice] = {"indice": indice, "id": elemento.id, "estado": 403, "error": "La reseña es de otro usuario"}
+                continue
+            version = original.get("version", 0)
+            if elemento.version is not None and elemento.version != version:
+                resultados[indice] = {"indice": indice, "id": elemento.id, "estado": 412, "error": "Versión distinta"}
+                continue
+            try:
+                datos_dict, borradas = Parcial2Service.preparar_cambios(elemento.datos, original)
+            except ValueError as e:
+                resultados[indice] = {"indice": indice, "id": elemento.id, "estado": 422, "error": str(e)}
+                continue
+            # Se condiciona a la versión leída: si alguien escribe entre medias, conflicto
+            operaciones.append((objetoId, version, datos_dict))
+            pendientes.append((indice, original, datos_dict, borradas))
+
+        fallidos = await Parcial2Repository.modificar_varios(operaciones)
+        fotos_borradas, modificados, nuevos = set(), [], []
+        for indice, original, datos_dict, borradas in pendientes:
+            if original["_id"] in fallidos:
+                resultados[indice] = {"indice": indice, "id": str(original["_id"]), "estado": 412, "error": "El elemento ha cambiado"}
+                continue
+            resultados[indice] = {"indice": indice, "id": str(original["_id"]), "estado": 200}
+            # Solo se borran las fotos de los que sí se han modificado
+            fotos_borradas |= borradas
+            modificados.append(original)
+            nuevos.append({**original, **datos_dict})
+
+        if modificados:
+            await Parcial2Service.actualizar_resumen(modificados, nuevos)
+            await Parcial2Service.invalidar(*modificados)
+        await cola_borrado.encolar(fotos_borradas)
+        return Parcial2Service._resumen(resultados)
+
+    # ======= Eliminar en lote (un único encolado de fotos) ========
+    @staticmethod
+    async def eliminar_varios(ids: list[str], claims: Optional[dict] = None) -> dict:
+        resultados = [None] * len(ids)
+        validos = Parcial2Service._ids_validos(ids, resultados)
+        originales = await Parcial2Repository.obtener_varios(list(validos.values()))
+
+        pendientes, vistos = {}, set()
+        for indice, objetoId in validos.items():
+            original = originales.get(objetoId)
+            if objetoId in vistos:
+                resultados[indice] = {"indice": indice, "id": ids[indice], "estado": 422, "error": "ID repetida en la petición"}
+            elif not original:
+                resultados[indice] = {"indice": indice, "id": ids[indice], "estado": 404, "error": "No encontrado"}
+            elif claims and original.get("usuarioId") != claims["sub"]:
+                resultados[indice] = {"indice": indice, "id": ids[indice], "estado": 403, "error": "La reseña es de otro usuario"}
+            else:
+                pendientes[indice] = objetoId
+            vistos.add(objetoId)
+
+        # El resumen, la caché y las fotos salen de lo que de verdad se ha
+        # borrado (tal como estaba): si otra petición lo borra o lo modifica
+        # entre la lectura y el borrado no se descuenta dos veces ni mal
+        borrados = await Parcial2Repository.eliminar_varios(list(pendientes.values()), claims["sub"] if claims else None)
+        for indice, objetoId in pendientes.items():
+            if objetoId in borrados:
+                resultados[indice] = {"indice": indice, "id": ids[indice], "estado": 204}
+            else:
+                resultados[indice] = {"indice": indice, "id": ids[indice], "estado": 404, "error": "No encontrado"}
+
+        if borrados:
+            await Parcial2Service.actualizar_resumen(quitados=list(borrados.values()))
+            await Parcial2Service.invalidar(*borrados.values())
+            fotos = set()
+            for borrado in borrados.values():
+                fotos |= public_ids_de(borrado)
+            await cola_borrado.encolar(fotos)
+        return Parcial2Service._resumen(resultados)
+
+
+    # ================================================================
+    #   Subidas directas a Cloudinary (ver app/core/media.py)
+    # ================================================================
+    @staticmethod
+    async def firmar_subida(parcial2Id: Optional[str] = None, claims: Optional[dict] = None) -> dict:
+        objetoId = None
+        if parcial2Id:
+            try:
+                objetoId = ObjectId(parcial2Id)
+            except:
+                raise ValueError("ID no válida")
+            documento = await Parcial2Repository.obtener_por_id(objetoId)
+            if not documento:
+                raise ValueError("Elemento no encontrado")
+            Parcial2Service.comprobar_dueno(documento, claims)
+
+        carpeta = f"{settings.CLOUDINARY_CARPETA}/" if settings.CLOUDINARY_CARPETA else ""
+        public_id = f"{carpeta}parcial2/{uuid.uuid4().hex}"
+        firmada = firmar_subida(public_id)
+        caduca = datetime.utcnow() + timedelta(seconds=settings.CLOUDINARY_SUBIDA_VALIDEZ)
+        await Parcial2Repository.registrar_subida({
+            "_id": public_id,
+            "parcial2Id": objetoId,
+            "usuarioId": claims["sub"] if claims else None,
+            "caduca": caduca,
+            # Las variantes pueden avisar bastante después de la subida
+            "olvidar": caduca + timedelta(days=1),
+        })
+        return {**firmada, "public_id": public_id, "caduca": caduca}
+
+    # ======= Webhook de Cloudinary: subida terminada o variantes listas ========
+    @staticmethod
+    async def notificacion_cloudinary(cuerpo: bytes, marca: Optional[str], firma: Optional[str]) -> str:
+        carga = verificar_notificacion(cuerpo, marca, firma)
+        public_id = carga.get("public_id")
+        subida = await Parcial2Repository.obtener_subida(public_id) if public_id else None
+        if not subida:
+            # No la firmamos nosotros (o hace tiempo): no se toca ninguna reseña
+            return "ignorada"
+
+        tipo = carga.get("notification_type")
+        if tipo == "upload":
+            creada = datetime.fromisoformat(carga["created_at"].replace("Z", "+00:00")).replace(tzinfo=None) if carga.get("created_at") else datetime.utcnow()
+            if creada > subida["caduca"]:
+                # Cloudinary acepta firmas de hasta una hora: la validez corta la imponemos aquí
+                await cola_borrado.encolar([public_id])
+                return "caducada"
+            medio = medio_desde_notificacion(carga)
+            await Parcial2Repository.completar_subida(public_id, medio)
+            if subida.get("parcial2Id"):
+                documento = await Parcial2Repository.anadir_medio(subida["parcial2Id"], medio)
+                if documento:
+                    await Parcial2Service.invalidar(documento)
+            return "guardada"
+
+        if tipo == "eager":
+            documento = await Parcial2Repository.actualizar_variantes(public_id, variantes_de_notificacion(carga))
+            if documento:
+                await Parcial2Service.invalidar(documento)
+            return "variantes"
+        return "ignorada"
 
 
     # ... (EL RESTO DEL ARCHIVO SE MANTIENE IGUAL: OBTENER_POR_ID Y USUARIOS) ...
     @staticmethod
-    async def obtener_por_id(id: ObjectId):
+    async def obtener_por_id(id: ObjectId, autor: bool = False):
         try:
             objetoId = ObjectId(id)
         except:
             raise ValueError("ID no válido")
-        resultado = await Parcial2Repository.obtener_por_id(objetoId)
+
+        # Con varios workers cada uno tiene su caché en memoria: la clave lleva
+        # la versión del documento (una lectura por _id solo de ese campo) y
+        # tras una escritura nadie encuentra la entrada anterior
+        version = await Parcial2Repository.obtener_version_documento(objetoId)
+        if version is None:
+            raise ValueError("No encontrada")
+
+        async def cargar():
+            resultado = await Parcial2Repository.obtener_por_id(objetoId)
+            return Parcial2Service.a_json(resultado) if resultado else None
+
+        resultado = await obtener_o_cargar(cache, f"parcial2:{objetoId}:{version}", cargar)
         if not resultado:
             raise ValueError("No encontrada")
-        return Parcial2Respuesta(**resultado)
+        etag = etag_documento(objetoId, version)
+        if autor:
+            # El alias y la foto cambian sin tocar la reseña: la ETag lleva
+            # también la versión de los perfiles (leída antes que ellos)
+            etag = etag_documento(objetoId, version, f"autor{await Parcial2Repository.obtener_version(GRUPO_PERFILES)}")
+            resultado, = await Parcial2Service.resolver_autores([resultado])
+        return Parcial2Respuesta(**resultado), etag
 
     @staticmethod
-    async def listar_todo_usuarios():
-        return await Parcial2Repository.listar_todos_usuarios()
+    async def listar_todo_usuarios(limite: Optional[int] = None, cursor: Optional[str] = None):
+        # El cursor de usuarios es su _id (UID de Firebase) en base64
+        try:
+            despues = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode() if cursor else None
+        except Exception:
+            raise ValueError("Cursor no válido")
+        limite = limite or settings.USUARIOS_LIMITE_DEFECTO
+        resultados = await Parcial2Repository.listar_todos_usuarios(datetime.utcnow(), limite, despues)
+        siguiente = None
+        if len(resultados) > limite:
+            resultados = resultados[:limite]
+            siguiente = base64.urlsafe_b64encode(resultados[-1]["_id"].encode()).decode().rstrip("=")
+        return serializador_usuario.lista(resultados), siguiente
     
     @staticmethod
-    async def crear_usuario(datos: UsuarioCrear):
+    async def crear_usuario(datos: UsuarioCrear, claims: Optional[dict] = None):
+        Parcial2Service.comprobar_perfil(datos.id, claims)
         datos_dict = datos.model_dump(by_alias=True)
         resultadoId = await Parcial2Repository.crear_usuario(datos_dict)
         datosRespuesta = {"_id": resultadoId, **datos_dict}
+        # Reseñas creadas antes que el usuario (sin alias ni foto aún)
+        en_segundo_plano(Parcial2Service.refrescar_autor(resultadoId), f"autor {resultadoId}")
         return UsuarioRespuesta(**datosRespuesta)
 
     @staticmethod
-    async def modificar_usuario(id: str, datos: UsuarioActualizar):
+    async def modificar_usuario(id: str, datos: UsuarioActualizar, claims: Optional[dict] = None):
+        Parcial2Service.comprobar_perfil(id, claims)
         datos_dict = {k: v for k, v in datos.model_dump().items() if v is not None} 
         if not datos_dict:
             raise ValueError("Datos vacíos") 
         resultado = await Parcial2Repository.modificar_usuario(id, datos_dict)
+        if not resultado:
+            raise ValueError("No encontrado")
+        await Parcial2Repository.incrementar_versiones([GRUPO_PERFILES])
+        if "alias" in datos_dict or "foto" in datos_dict:
+            # La respuesta no espera a reescribir todas sus reseñas
+            en_segundo_plano(Parcial2Service.refrescar_autor(id), f"autor {id}")
         return UsuarioRespuesta(**resultado)
 
     @staticmethod
-    async def eliminar_usuario_por_id(id: str):
+    async def eliminar_usuario_por_id(id: str, claims: Optional[dict] = None):
+        Parcial2Service.comprobar_perfil(id, claims)
         eliminado = await Parcial2Repository.eliminar_usuario_por_id(id)
         if not eliminado:
             raise ValueError("No eliminado")
+        await Parcial2Repository.incrementar_versiones([GRUPO_PERFILES])
+        en_segundo_plano(Parcial2Service.refrescar_autor(id), f"autor {id}")
 
     @staticmethod
     async def obtener_usuario_por_id(id: ObjectId):
-        resultado = await Parcial2Repository.obtener_usuariopor_id(id)
+        # Como los documentos de Parcial2: la versión en la clave vale para
+        # todos los workers (un grupo para todos los usuarios, que cambian poco)
+        version = await Parcial2Repository.obtener_version(GRUPO_PERFILES)
+
+        async def cargar():
+            resultado = await Parcial2Repository.obtener_usuariopor_id(id)
+            return UsuarioRespuesta(**resultado).model_dump(mode="json", by_alias=True) if resultado else None
+
+        resultado = await obtener_o_cargar(cache, f"usuario:{id}:{version}", cargar)
         if not resultado:
             raise ValueError("No encontrado")
-        return UsuarioRespuesta(**resultado)
\ No newline at end of file
+        return UsuarioRespuesta(**resultado)
+
+    # ================================================================
+    #   Exportación e importación completas (ver app/core/exportacion.py)
+    # ================================================================
+    # Sin límite ni páginas: el cursor va entregando lotes y cada uno sale
+    # comprimido antes de pedir el siguiente
+    @staticmethod
+    def exportar(
+            coleccion: str,
+            formato: str,
+            nombre: Optional[str] = None,
+            fechaComienzo: Optional[date] = None,
+            fechaFinal: Optional[date] = None,
+            usuarioId: Optional[str] = None,
+            lote: int = settings.EXPORTACION_LOTE,
+        ):
+        filtro = {}
+        if coleccion == "Parcial2":
+            filtro = Parcial2Service.construir_filtro(nombre, None, fechaComienzo, fechaFinal, None, usuarioId)
+        documentos = Parcial2Repository.iterar_coleccion(coleccion, filtro, lote)
+        return exportacion.exportar(documentos, coleccion, formato, lote)
+
+    # Cada documento pasa por el mismo esquema que al crearlo por la API (con
+    # sus conversiones: "4" -> 4); los campos que el esquema no conoce (_id,
+    # version, location, autor...) se conservan tal cual
+    @staticmethod
+    def _validar_importado(coleccion: str, documento: dict) -> dict:
+        if coleccion == "Parcial2":
+            validado = Parcial2Crear.model_validate(documento)
+            # Como en POST: los campos obsoletos del token no se guardan
+            campos = validado.model_dump(exclude={"token_id", "token_emision", "token_caducidad"})
+            documento = {k: v for k, v in documento.items() if k not in ("token_id", "token_emision", "token_caducidad")}
+            documento = {**documento, **campos}
+            Parcial2Service._completar_importado(documento)
+            return documento
+        validado = UsuarioCrear.model_validate(documento)
+        return {**documento, **validado.model_dump(by_alias=True)}
+
+    @staticmethod
+    def _completar_importado(documento: dict):
+        # Copias antiguas o hechas a mano: los campos derivados se recalculan
+        if documento.get("nombre") and not documento.get("nombre_normalizado"):
+            documento["nombre_normalizado"] = normalizar(documento["nombre"])
+        if documento.get("location") is None:
+            documento["location"] = coordenadas_a_location(documento.get("coordenadas"))
+        if not documento.get("version"):
+            documento["version"] = 1
+
+    @staticmethod
+    def _anotar_error(resumen: dict, linea: int, error: str):
+        resumen["errores"] += 1
+        if len(resumen["ejemplos"]) < 10:
+            resumen["ejemplos"].append({"linea": linea, "error": error})
+
+    @staticmethod
+    async def _importar_lote(coleccion: str, documentos: list[dict], resumen: dict, lineas: list[int]):
+        errores = await Parcial2Repository.insertar_lote(coleccion, documentos)
+        for posicion, (codigo, mensaje) in errores.items():
+            if codigo == 11000:
+                resumen["duplicados"] += 1
+            else:
+                Parcial2Service._anotar_error(resumen, lineas[posicion], mensaje)
+        insertados = [d for p, d in enumerate(documentos) if p not in errores]
+        resumen["insertados"] += len(insertados)
+        if not insertados:
+            return
+        if coleccion == "Parcial2":
+            # Como POST /bulk: resumen por establecimiento y nuevas versiones
+            # de los listados (un $inc por lote, no por documento)
+            await Parcial2Service.actualizar_resumen(anadidos=insertados)
+            usuarios = {f"usuario:{d['usuarioId']}" for d in insertados if d.get("usuarioId")}
+            await Parcial2Repository.incrementar_versiones(["parcial2", *usuarios])
+        else:
+            await Parcial2Repository.incrementar_versiones([GRUPO_PERFILES])
+
+    # Los documentos que ya existen (mismo _id) se cuentan como duplicados y
+    # no se tocan: importar dos veces el mismo fichero no duplica nada
+    @staticmethod
+    async def importar(coleccion: str, formato: str, trozos, progreso=None, lote: int = settings.EXPORTACION_LOTE) -> dict:
+        resumen = {"leidos": 0, "insertados": 0, "duplicados": 0, "errores": 0, "ejemplos": []}
+        documentos, lineas = [], []
+        try:
+            async for linea, documento, error in exportacion.documentos(trozos, coleccion, formato):
+                resumen["leidos"] += 1
+                if error:
+                    Parcial2Service._anotar_error(resumen, linea, error)
+                    continue
+                try:
+                    documento = Parcial2Service._validar_importado(coleccion, documento)
+                except ValidationError as e:
+                    Parcial2Service._anotar_error(resumen, linea, str(e))
+                    continue
+                documentos.append(documento)
+                lineas.append(linea)
+                if len(documentos) >= lote:
+                    await Parcial2Service._importar_lote(coleccion, documentos, resumen, lineas)
+                    documentos, lineas = [], []
+                    if progreso:
+                        progreso(resumen)
+        except exportacion.CopiaNoValida as e:
+            # Lo leído antes del fallo se guarda y se informa de hasta dónde se llegó
+            await Parcial2Service._importar_lote(coleccion, documentos, resumen, lineas)
+            raise exportacion.CopiaNoValida(str(e), resumen)
+        await Parcial2Service._importar_lote(coleccion, documentos, resumen, lineas)
+        return resumen
+
+    # ================================================================
+    #   Caducidad: un lote de usuarios caducados (ver app/core/caducidad.py)
+    # ================================================================
+    @staticmethod
+    async def barrer_usuarios_caducados(lote: int = settings.USUARIOS_BARRIDO_LOTE, cascada: bool = settings.USUARIOS_CASCADA) -> int:
+        ahora = datetime.utcnow()
+        ids = await Parcial2Repository.usuarios_caducados(ahora, lote)
+        if not ids:
+            return 0
+        semaforo = asyncio.Semaphore(settings.USUARIOS_CASCADA_CONCURRENCIA)
+
+        if cascada:
+            # Primero las reseñas: si el proceso cae a medias, el usuario sigue
+            # caducado y la próxima pasada termina el trabajo
+            async def borrar_resenas(usuarioId: str):
+                async with semaforo:
+                    while resenas := await Parcial2Repository.ids_de_usuario(usuarioId, lote):
+                        # Mismo camino que DELETE /bulk: resumen, versiones, caché y Cloudinary
+                        resultado = await Parcial2Service.eliminar_varios([str(i) for i in resenas])
+                        RESENAS_CASCADA.inc(resultado["correctos"])
+
+            await asyncio.gather(*(borrar_resenas(usuarioId) for usuarioId in ids))
+
+        borrados = await Parcial2Repository.eliminar_usuarios_caducados(ids, ahora)
+        await Parcial2Repository.incrementar_versiones([GRUPO_PERFILES])
+        if not cascada:
+            # Sus reseñas se quedan: sin alias ni foto. refrescar_autor lee el
+            # perfil actual, así que quien renovó entre medias conserva el suyo
+            async def refrescar(usuarioId: str):
+                async with semaforo:
+                    await Parcial2Service.refrescar_autor(usuarioId)
+
+            await asyncio.gather(*(refrescar(usuarioId) for usuarioId in ids))
+        USUARIOS_CADUCADOS.inc(borrados)
+        return borrados
+
+
+barrendero_usuarios = BarrenderoUsuarios(Parcial2Service.barrer_usuarios_caducados)
\ No newline at end of file
@@ -0,0 +1,55 @@
+import asyncio
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, Response
+from app.core.config import settings
+from app.core.database import db, monitor_pool
+from app.core.metricas import exponer
+
+router = APIRouter(tags=["Sistema"])
+
+
+# ======= Vivo: el proceso responde (no toca la BD) ========
+@router.get(
+    "/health/live",
+    status_code=200,
+    responses={200: {"description": "El worker atiende peticiones."}},
+)
+async def vivo():
+    return {"estado": "ok"}
+
+
+# ======= Listo: la BD responde y el pool no está saturado ========
+# El balanceador deja de enviar tráfico a este worker mientras dé 503
+@router.get(
+    "/health/ready",
+    status_code=200,
+    responses={
+        200: {"description": "Listo para recibir tráfico; incluye el estado del pool de conexiones."},
+        503: {"description": "MongoDB no responde o el pool de conexiones está saturado."},
+    },
+)
+async def listo():
+    pool = monitor_pool.estado()
+    try:
+        await asyncio.wait_for(db.command("ping"), timeout=settings.MONGO_SELECCION_SERVIDOR_MS / 1000)
+        mongo = True
+    except Exception:
+        mongo = False
+
+    saturado = pool["saturacion"] >= settings.SALUD_SATURACION_MAXIMA or pool["esperando"] > 0
+    listo = mongo and not saturado
+    return JSONResponse(
+        {"estado": "ok" if listo else "no_listo", "mongo": mongo, "pool": pool},
+        status_code=200 if listo else 503,
+    )
+
+
+# ======= Métricas en formato Prometheus ========
+@router.get(
+    "/metrics",
+    status_code=200,
+    responses={200: {"description": "Latencias por ruta y por comando de MongoDB, documentos devueltos, bytes y llamadas a Cloudinary."}},
+)
+async def metricas():
+    contenido, tipo = exponer()
+    return Response(contenido, media_type=tipo)
@@ -0,0 +1,211 @@
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from datetime import datetime
+from typing import Optional
+import httpx
+import jwt
+from fastapi import Depends, Header, HTTPException
+from app.core.cache import CacheMemoria
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TokenNoValido(Exception):
+    pass
+
+
+# No se han podido descargar las claves y no hay ninguna anterior que usar:
+# no se sabe si el token es válido (HTTP 503, no 401)
+class ClavesNoDisponibles(Exception):
+    pass
+
+
+# ===============================================
+#  Claves públicas de Firebase (JWKS) en caché
+# ===============================================
+# Google indica con Cache-Control cuánto valen las claves. Se recargan en
+# segundo plano antes de que caduquen, así ninguna petición espera a la red;
+# si llega un token con un kid desconocido (rotación) se fuerza una recarga,
+# como mucho una por minuto. Si una recarga falla se siguen usando las
+# últimas claves buenas (y se reintenta al minuto) en vez de fallar todas
+# las peticiones con token mientras Google no responde.
+class ClavesFirebase:
+
+    def __init__(self, url: str = settings.FIREBASE_JWKS_URL, reloj=time.monotonic, cliente: Optional[httpx.AsyncClient] = None):
+        self.url = url
+        self.reloj = reloj
+        self.cliente = cliente
+        self.claves: dict[str, jwt.PyJWK] = {}
+        self.caduca = 0.0
+        self._ultima_forzada = float("-inf")
+        self._bloqueo = asyncio.Lock()
+        self._tarea: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def max_age(cache_control: Optional[str]) -> float:
+        coincidencia = re.search(r"max-age=(\d+)", cache_control or "")
+        return float(coincidencia.group(1)) if coincidencia else 3600.0
+
+    async def cargar(self):
+        cliente = self.cliente or httpx.AsyncClient(timeout=10)
+        try:
+            respuesta = await cliente.get(self.url)
+            respuesta.raise_for_status()
+            claves = {k["kid"]: jwt.PyJWK(k, algorithm="RS256") for k in respuesta.json()["keys"]}
+        except (httpx.HTTPError, ValueError, KeyError, TypeError, jwt.PyJWTError) as e:
+            raise ClavesNoDisponibles(f"No se pudieron cargar las claves de Firebase: {e!r}")
+        finally:
+            if cliente is not self.cliente:
+                await cliente.aclose()
+        self.claves = claves
+        self.caduca = self.reloj() + self.max_age(respuesta.headers.get("cache-control"))
+
+    async def _recargar(self):
+        try:
+            await self.cargar()
+        except ClavesNoDisponibles as e:
+            if not self.claves:
+                raise
+            logger.warning("%s; se siguen usando las anteriores", e)
+            self.caduca = self.reloj() + 60.0
+
+    async def obtener(self, kid: str) -> Optional[jwt.PyJWK]:
+        if self.reloj() >= self.caduca:
+            async with self._bloqueo:
+                # Otra petición pudo recargarlas mientras esperábamos
+                if self.reloj() >= self.caduca:
+                    await self._recargar()
+        clave = self.claves.get(kid)
+        if clave is None and self.reloj() - self._ultima_forzada > 60:
+            self._ultima_forzada = self.reloj()
+            async with self._bloqueo:
+                await self._recargar()
+            clave = self.claves.get(kid)
+        return clave
+
+    # ======= Recarga en segundo plano (lifespan) ========
+    def iniciar(self):
+        self._tarea = asyncio.create_task(self._bucle())
+
+    async def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            self._tarea = None
+
+    async def _bucle(self):
+        while True:
+            try:
+                async with self._bloqueo:
+                    await self.cargar()
+                # Se recargan al 90 % de su vida
+                espera = max(60.0, (self.caduca - self.reloj()) * 0.9)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("No se pudieron cargar las claves de Firebase: %s", e)
+                espera = 60.0
+            await asyncio.sleep(espera)
+
+
+# ===============================================
+#  Verificación local de ID tokens de Firebase
+# ===============================================
+# Las claims verificadas se guardan por huella (sha256) del token hasta que
+# caduca: un mismo token no se vuelve a comprobar en cada petición.
+class VerificadorFirebase:
+
+    def __init__(self, proyecto: str, claves: ClavesFirebase, cache=None, reloj=time.time, margen: int = 60):
+        self.proyecto = proyecto
+        self.claves = claves
+        self.cache = cache or CacheMemoria(max_entradas=settings.AUTH_MAX_TOKENS)
+        self.reloj = reloj
+        self.margen = margen
+
+    async def verificar(self, token: str) -> dict:
+        huella = hashlib.sha256(token.encode()).hexdigest()
+        claims = await self.cache.obtener(f"token:{huella}")
+        if claims is not None and claims["exp"] > self.reloj():
+            return claims
+
+        try:
+            cabecera = jwt.get_unverified_header(token)
+        except jwt.PyJWTError:
+            raise TokenNoValido("Token mal formado")
+        if cabecera.get("alg") != "RS256" or not cabecera.get("kid"):
+            raise TokenNoValido("Algoritmo o clave no admitidos")
+        clave = await self.claves.obtener(cabecera["kid"])
+        if clave is None:
+            raise TokenNoValido("Clave de firma desconocida")
+
+        try:
+            claims = jwt.decode(
+                token, clave.key, algorithms=["RS256"],
+                audience=self.proyecto,
+                issuer=f"https://securetoken.google.com/{self.proyecto}",
+                options={"require": ["exp", "iat", "sub", "aud", "iss"]},
+                leeway=self.margen,
+            )
+        except jwt.PyJWTError as e:
+            raise TokenNoValido(str(e))
+        if not claims["sub"] or claims.get("auth_time", 0) > self.reloj() + self.margen:
+            raise TokenNoValido("Token sin usuario o con auth_time en el futuro")
+
+        await self.cache.guardar(f"token:{huella}", claims, ttl=max(1, claims["exp"] - self.reloj()))
+        return claims
+
+
+claves_firebase = ClavesFirebase()
+# Sin FIREBASE_PROYECTO no hay verificación (desarrollo local)
+verificador = VerificadorFirebase(settings.FIREBASE_PROYECTO, claves_firebase) if settings.FIREBASE_PROYECTO else None
+if settings.AUTH_OBLIGATORIA and verificador is None:
+    raise RuntimeError("AUTH_OBLIGATORIA necesita FIREBASE_PROYECTO")
+
+
+# ======= Lo que se guarda del token en la reseña (en vez del JWT entero) ========
+def referencia_token(claims: dict) -> dict:
+    return {
+        "emision": datetime.utcfromtimestamp(claims["iat"]),
+        "caducidad": datetime.utcfromtimestamp(claims["exp"]),
+        "proveedor": (claims.get("firebase") or {}).get("sign_in_provider"),
+    }
+
+
+# ======= Dependencia: claims del usuario (None si no se exige y no viene) ========
+async def usuario_autenticado(authorization: Optional[str] = Header(None, description="Bearer <ID token de Firebase>")) -> Optional[dict]:
+    no_autorizado = {"WWW-Authenticate": "Bearer"}
+    if not authorization:
+        if settings.AUTH_OBLIGATORIA:
+            raise HTTPException(status_code=401, detail="Falta el token", headers=no_autorizado)
+        return None
+    if verificador is None:
+        return None
+
+    esquema, _, token = authorization.partition(" ")
+    if esquema.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Se esperaba 'Bearer <token>'", headers=no_autorizado)
+    try:
+        return await verificador.verificar(token.strip())
+    except TokenNoValido as e:
+        raise HTTPException(status_code=401, detail=f"Token no válido: {e}", headers=no_autorizado)
+    except ClavesNoDisponibles as e:
+        logger.warning("%s", e)
+        raise HTTPException(status_code=503, detail="No se puede verificar el token ahora mismo", headers={"Retry-After": "60"})
+
+
+# ======= Dependencia: solo administradores (claim admin=true o uid en ADMIN_UIDS) ========
+ADMINISTRADORES = {uid.strip() for uid in settings.ADMIN_UIDS.split(",") if uid.strip()}
+
+
+async def administrador(claims: Optional[dict] = Depends(usuario_autenticado)) -> dict:
+    # Sin verificación de tokens no hay forma de saber quién es administrador
+    if verificador is None:
+        raise HTTPException(status_code=403, detail="Las rutas de administración necesitan FIREBASE_PROYECTO")
+    if claims is None:
+        raise HTTPException(status_code=401, detail="Falta el token", headers={"WWW-Authenticate": "Bearer"})
+    if claims.get("admin") is not True and claims["sub"] not in ADMINISTRADORES:
+        raise HTTPException(status_code=403, detail="Solo para administradores")
+    return claims
@@ -0,0 +1,140 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+from app.core.config import settings
+
+
+# ===============================================
+#  Backend en memoria: LRU + TTL por entrada
+# ===============================================
+class CacheMemoria:
+
+    def __init__(self, max_entradas: int = settings.CACHE_MAX_ENTRADAS, ttl: float = settings.CACHE_TTL, reloj=time.monotonic):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.reloj = reloj
+        self._datos: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+
+    async def obtener(self, clave: str, contar: bool = True):
+        entrada = self._datos.get(clave)
+        if entrada is not None and entrada[0] <= self.reloj():
+            del self._datos[clave]
+            self.expulsiones += 1
+            entrada = None
+        if entrada is None:
+            self.fallos += contar
+            return None
+        self._datos.move_to_end(clave)
+        self.aciertos += contar
+        return entrada[1]
+
+    async def guardar(self, clave: str, valor, ttl: Optional[float] = None):
+        self._datos[clave] = (self.reloj() + (ttl or self.ttl), valor)
+        self._datos.move_to_end(clave)
+        while len(self._datos) > self.max_entradas:
+            self._datos.popitem(last=False)
+            self.expulsiones += 1
+
+    async def borrar(self, *claves: str):
+        for clave in claves:
+            self._datos.pop(clave, None)
+
+    def estadisticas(self) -> dict:
+        return {
+            "backend": "memoria",
+            "entradas": len(self._datos),
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "expulsiones": self.expulsiones,
+        }
+
+
+# ===============================================
+#  Backend Redis (o cualquier servidor con su protocolo)
+# ===============================================
+# Compartido entre workers. Los valores viajan como JSON; el cliente se puede
+# inyectar para usar un sustituto local en pruebas (p. ej. fakeredis).
+class CacheRedis:
+
+    def __init__(self, url: str = settings.CACHE_REDIS_URL, ttl: float = settings.CACHE_TTL, cliente=None, prefijo: str = "parcial2:"):
+        if cliente is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError("CACHE_BACKEND=redis necesita el paquete 'redis'")
+            cliente = redis.from_url(url)
+        self.cliente = cliente
+        self.ttl = ttl
+        self.prefijo = prefijo
+        self.aciertos = 0
+        self.fallos = 0
+        # Redis expulsa por su cuenta; aquí no lo vemos
+        self.expulsiones = 0
+
+    async def obtener(self, clave: str, contar: bool = True):
+        crudo = await self.cliente.get(self.prefijo + clave)
+        if crudo is None:
+            self.fallos += contar
+            return None
+        self.aciertos += contar
+        return json.loads(crudo)
+
+    async def guardar(self, clave: str, valor, ttl: Optional[float] = None):
+        await self.cliente.set(self.prefijo + clave, json.dumps(valor), px=int((ttl or self.ttl) * 1000))
+
+    async def borrar(self, *claves: str):
+        if claves:
+            await self.cliente.delete(*(self.prefijo + c for c in claves))
+
+    def estadisticas(self) -> dict:
+        return {
+            "backend": "redis",
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "expulsiones": self.expulsiones,
+        }
+
+
+# ===============================================
+#  Sin caché (CACHE_BACKEND=ninguno)
+# ===============================================
+class CacheNula:
+    aciertos = fallos = expulsiones = 0
+
+    async def obtener(self, clave: str, contar: bool = True):
+        return None
+
+    async def guardar(self, clave: str, valor, ttl: Optional[float] = None):
+        pass
+
+    async def borrar(self, *claves: str):
+        pass
+
+    def estadisticas(self) -> dict:
+        return {"backend": "ninguno"}
+
+
+# ======= Leer de caché o cargar y guardar ========
+async def obtener_o_cargar(cache, clave: str, cargar: Callable[[], Awaitable[Any]], ttl: Optional[float] = None):
+    valor = await cache.obtener(clave)
+    if valor is not None:
+        return valor
+    valor = await cargar()
+    if valor is not None:
+        await cache.guardar(clave, valor, ttl)
+    return valor
+
+
+def crear_cache():
+    if settings.CACHE_BACKEND == "redis":
+        return CacheRedis()
+    if settings.CACHE_BACKEND == "ninguno":
+        return CacheNula()
+    return CacheMemoria()
+
+
+cache = crear_cache()
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+from app.core.config import settings
+from app.core.database import tomar_turno
+from app.core.metricas import BARRIDOS
+
+logger = logging.getLogger(__name__)
+
+
+# ================================================================
+#   Barrido de usuarios caducados (USUARIOS_CADUCIDAD_MODO=barrido)
+# ================================================================
+# Cada pasada borra como mucho un lote; mientras los lotes salgan llenos
+# quedan más caducados y se encadenan pasadas sin esperar al intervalo. El
+# borrado en sí (y la cascada de reseñas) lo hace `barrer`, que devuelve
+# cuántos usuarios ha borrado.
+class BarrenderoUsuarios:
+
+    def __init__(
+            self,
+            barrer: Callable[[int], Awaitable[int]],
+            modo: str = settings.USUARIOS_CADUCIDAD_MODO,
+            intervalo: float = settings.USUARIOS_BARRIDO_INTERVALO,
+            lote: int = settings.USUARIOS_BARRIDO_LOTE,
+        ):
+        self.barrer = barrer
+        self.modo = modo
+        self.intervalo = intervalo
+        self.lote = lote
+        self._tarea: Optional[asyncio.Task] = None
+
+    def iniciar(self):
+        if self.modo == "ttl" and settings.USUARIOS_CASCADA:
+            logger.warning("USUARIOS_CASCADA no tiene efecto con USUARIOS_CADUCIDAD_MODO=ttl")
+        # Con el índice TTL borra Mongo; intervalo 0 = desactivado
+        if self.modo == "barrido" and self.intervalo > 0:
+            self._tarea = asyncio.create_task(self._bucle())
+
+    async def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            self._tarea = None
+
+    async def pasada(self) -> int:
+        inicio = time.perf_counter()
+        resultado = "ok"
+        try:
+            return await self.barrer(self.lote)
+        except Exception:
+            resultado = "error"
+            raise
+        finally:
+            BARRIDOS.labels(resultado).observe(time.perf_counter() - inicio)
+
+    async def _bucle(self):
+        while True:
+            try:
+                if await tomar_turno("barrido_usuarios", self.intervalo):
+                    total = 0
+                    while True:
+                        borrados = await self.pasada()
+                        total += borrados
+                        if borrados < self.lote:
+                            break
+                    if total:
+                        logger.info("Barrido de usuarios: %s caducados borrados", total)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Barrido de usuarios fallido: %s", e)
+            await asyncio.sleep(self.intervalo)
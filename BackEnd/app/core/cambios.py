@@ -0,0 +1,184 @@
+import asyncio
+import logging
+from collections import deque
+from typing import AsyncIterator, Callable, Optional
+from pymongo.errors import OperationFailure, PyMongoError
+from app.core.config import settings
+from app.core.database import db
+from app.core.metricas import STREAM_SUSCRIPTORES, STREAM_DESCARTADOS
+
+logger = logging.getLogger(__name__)
+
+# Solo interesan los cambios de documentos (no drop, rename, invalidate...)
+_PIPELINE = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+_TIPOS = {"insert": b"creado", "update": b"modificado", "replace": b"modificado", "delete": b"eliminado"}
+# El oplog ya no llega hasta el resume token guardado
+_HISTORIAL_PERDIDO = {260, 280, 286}
+
+
+class DemasiadosSuscriptores(Exception):
+    pass
+
+
+class Suscripcion:
+
+    def __init__(self, filtro: Callable[[dict], bool], tamano: int):
+        self.filtro = filtro
+        self.cola: asyncio.Queue = asyncio.Queue(maxsize=tamano)
+
+
+# ===============================================
+#  Un change stream por worker, repartido a N clientes
+# ===============================================
+# El consumidor se abre con el primer suscriptor y se cierra con el último.
+# Cada cliente tiene una cola acotada: si no la vacía a tiempo se le corta
+# (recibe "descartado" y el navegador reconecta) en vez de acumular memoria.
+# Los últimos eventos se recuerdan con su resume token para que un cliente
+# que reconecta con Last-Event-ID reciba lo que se perdió; si su token ya no
+# está (o reconecta a otro worker) recibe "reinicio" y debe recargar el listado.
+class DifusorCambios:
+
+    def __init__(
+            self,
+            serializar: Callable[[dict], bytes],
+            tamano_cola: int = settings.STREAM_COLA,
+            max_suscriptores: int = settings.STREAM_MAX_SUSCRIPTORES,
+            historial: int = settings.STREAM_HISTORIAL,
+            latido: float = settings.STREAM_LATIDO,
+            reintento: float = settings.STREAM_REINTENTO,
+            coleccion=lambda: db.Parcial2,
+        ):
+        self.serializar = serializar
+        self.tamano_cola = tamano_cola
+        self.max_suscriptores = max_suscriptores
+        self.latido = latido
+        self.reintento = reintento
+        self.coleccion = coleccion
+        self._suscripciones: set[Suscripcion] = set()
+        # (token, campos para filtrar o None si no hay documento, evento SSE)
+        self._historial: deque[tuple[str, Optional[dict], bytes]] = deque(maxlen=historial)
+        self._ultimo_token: Optional[dict] = None
+        self._tarea: Optional[asyncio.Task] = None
+
+    def lleno(self) -> bool:
+        return len(self._suscripciones) >= self.max_suscriptores
+
+    # ======= Alta y baja de clientes ========
+    def suscribir(self, filtro: Callable[[dict], bool], desde: Optional[str] = None) -> tuple[Suscripcion, bool]:
+        # Devuelve la suscripción y si se ha podido reanudar desde `desde`
+        if self.lleno():
+            raise DemasiadosSuscriptores("Demasiados clientes conectados")
+        suscripcion = Suscripcion(filtro, self.tamano_cola)
+        reanudada = desde is None
+        if desde is not None:
+            tokens = [token for token, _, _ in self._historial]
+            if desde in tokens:
+                reanudada = True
+                # Sin await entre el repaso y el alta: no se pierde ni se repite ningún evento
+                for _, campos, evento in list(self._historial)[tokens.index(desde) + 1:]:
+                    if campos is not None and not filtro(campos):
+                        continue
+                    if suscripcion.cola.full():
+                        reanudada = False
+                        break
+                    suscripcion.cola.put_nowait(evento)
+        self._suscripciones.add(suscripcion)
+        STREAM_SUSCRIPTORES.inc()
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._consumir())
+        return suscripcion, reanudada
+
+    def cancelar(self, suscripcion: Suscripcion):
+        if suscripcion in self._suscripciones:
+            self._suscripciones.discard(suscripcion)
+            STREAM_SUSCRIPTORES.dec()
+        if not self._suscripciones and self._tarea:
+            self._parar_consumidor()
+
+    async def detener(self):
+        for suscripcion in list(self._suscripciones):
+            self._descartar(suscripcion)
+        if self._tarea:
+            self._parar_consumidor()
+
+    def _parar_consumidor(self):
+        # Sin nadie escuchando no se sigue el change stream: el próximo
+        # suscriptor empieza desde ahora (no recibe como nuevo lo escrito
+        # mientras tanto) y el historial ya no cubre ese hueco, así que quien
+        # reconecte con Last-Event-ID recibe "reinicio"
+        self._tarea.cancel()
+        self._tarea = None
+        self._ultimo_token = None
+        self._historial.clear()
+
+    def _descartar(self, suscripcion: Suscripcion):
+        self.cancelar(suscripcion)
+        while not suscripcion.cola.empty():
+            suscripcion.cola.get_nowait()
+        # None: fin de la conexión
+        suscripcion.cola.put_nowait(None)
+
+    # ======= Eventos SSE de un cliente ========
+    async def eventos(self, filtro: Callable[[dict], bool], desde: Optional[str] = None) -> AsyncIterator[bytes]:
+        suscripcion, reanudada = self.suscribir(filtro, desde)
+        try:
+            yield b"retry: 3000\n\n"
+            if not reanudada:
+                yield b"event: reinicio\ndata: {}\n\n"
+            while True:
+                try:
+                    evento = await asyncio.wait_for(suscripcion.cola.get(), self.latido)
+                except asyncio.TimeoutError:
+                    # Comentario SSE: mantiene abierta la conexión a través de proxies
+                    yield b": latido\n\n"
+                    continue
+                if evento is None:
+                    yield b"event: descartado\ndata: {}\n\n"
+                    return
+                yield evento
+        finally:
+            self.cancelar(suscripcion)
+
+    # ======= Consumidor del change stream ========
+    async def _consumir(self):
+        while True:
+            try:
+                async with self.coleccion().watch(
+                    _PIPELINE, full_document="updateLookup", resume_after=self._ultimo_token,
+                ) as flujo:
+                    async for cambio in flujo:
+                        self._difundir(cambio)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code in _HISTORIAL_PERDIDO:
+                    # Se empieza de cero: quien reconecte con un token viejo recibirá "reinicio"
+                    self._ultimo_token = None
+                    self._historial.clear()
+                logger.warning("Change stream de Parcial2 interrumpido: %s", e)
+            except PyMongoError as e:
+                logger.warning("Change stream de Parcial2 interrumpido: %s", e)
+            await asyncio.sleep(self.reintento)
+
+    def _difundir(self, cambio: dict):
+        self._ultimo_token = cambio["_id"]
+        token = cambio["_id"]["_data"]
+        documento = cambio.get("fullDocument")
+        if documento is not None:
+            campos = {"usuarioId": documento.get("usuarioId"), "location": documento.get("location")}
+            datos = self.serializar(documento)
+        else:
+            # Borrado (o borrado antes de leerlo): solo se conoce el _id y va a todos
+            campos = None
+            datos = b'{"_id":"' + str(cambio["documentKey"]["_id"]).encode() + b'"}'
+        evento = b"id: " + token.encode() + b"\nevent: " + _TIPOS[cambio["operationType"]] + b"\ndata: " + datos + b"\n\n"
+        self._historial.append((token, campos, evento))
+
+        for suscripcion in list(self._suscripciones):
+            if campos is not None and not suscripcion.filtro(campos):
+                continue
+            try:
+                suscripcion.cola.put_nowait(evento)
+            except asyncio.QueueFull:
+                STREAM_DESCARTADOS.inc()
+                self._descartar(suscripcion)
@@ -0,0 +1,93 @@
+import asyncio
+import uuid
+from typing import Any, Awaitable, Callable
+from app.core.config import settings
+from app.core.metricas import COALESCIDAS
+
+
+# ===============================================
+#  En memoria: una consulta en vuelo por clave y proceso
+# ===============================================
+# Las peticiones idénticas que llegan mientras la primera está consultando
+# esperan a su resultado en lugar de lanzar otra consulta a Mongo.
+class CoalescedorMemoria:
+
+    def __init__(self):
+        self._en_vuelo: dict[str, asyncio.Task] = {}
+
+    async def ejecutar(self, clave: str, cargar: Callable[[], Awaitable[Any]]):
+        tarea = self._en_vuelo.get(clave)
+        if tarea is None:
+            tarea = asyncio.ensure_future(cargar())
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda _: self._en_vuelo.pop(clave, None))
+        else:
+            COALESCIDAS.inc()
+        # shield: si una petición se cancela (el cliente cierra), las demás siguen esperando
+        return await asyncio.shield(tarea)
+
+
+# ===============================================
+#  Redis: una consulta en vuelo por clave entre todos los workers
+# ===============================================
+# El primero toma un cerrojo con SET NX y carga (dejando el resultado en la
+# caché compartida); los demás esperan a que aparezca en la caché. Si el
+# cerrojo caduca o el resultado no llega a tiempo, cargan ellos mismos.
+# Solo tiene sentido con CACHE_BACKEND=redis.
+class CoalescedorRedis:
+
+    def __init__(self, cache, url: str = settings.CACHE_REDIS_URL, espera: float = settings.COALESCENCIA_ESPERA, cliente=None, intervalo: float = 0.02):
+        if cliente is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError("COALESCENCIA_BACKEND=redis necesita el paquete 'redis'")
+            cliente = redis.from_url(url)
+        self.cliente = cliente
+        self.cache = cache
+        self.espera = espera
+        self.intervalo = intervalo
+        self.local = CoalescedorMemoria()
+
+    async def ejecutar(self, clave: str, cargar: Callable[[], Awaitable[Any]]):
+        # Dentro del proceso se agrupan antes de tocar Redis
+        return await self.local.ejecutar(clave, lambda: self._entre_procesos(clave, cargar))
+
+    async def _entre_procesos(self, clave: str, cargar: Callable[[], Awaitable[Any]]):
+        cerrojo = f"parcial2:vuelo:{clave}"
+        marca = uuid.uuid4().hex
+        if await self.cliente.set(cerrojo, marca, nx=True, px=int(self.espera * 1000)):
+            try:
+                return await cargar()
+            finally:
+                # Solo se borra si sigue siendo nuestro
+                if await self.cliente.get(cerrojo) == marca.encode():
+                    await self.cliente.delete(cerrojo)
+
+        COALESCIDAS.inc()
+        limite = asyncio.get_running_loop().time() + self.espera
+        while asyncio.get_running_loop().time() < limite:
+            valor = await self.cache.obtener(clave, contar=False)
+            if valor is not None:
+                return valor
+            if not await self.cliente.exists(cerrojo):
+                break
+            await asyncio.sleep(self.intervalo)
+        return await cargar()
+
+
+# ===============================================
+#  Sin agrupar (COALESCENCIA_BACKEND=ninguno)
+# ===============================================
+class CoalescedorNulo:
+
+    async def ejecutar(self, clave: str, cargar: Callable[[], Awaitable[Any]]):
+        return await cargar()
+
+
+def crear_coalescedor(cache):
+    if settings.COALESCENCIA_BACKEND == "redis":
+        return CoalescedorRedis(cache)
+    if settings.COALESCENCIA_BACKEND == "ninguno":
+        return CoalescedorNulo()
+    return CoalescedorMemoria()
@@ -0,0 +1,227 @@
+import asyncio
+import gzip
+import zlib
+from typing import Optional
+from app.core.cache import CacheMemoria
+from app.core.config import settings
+from app.core.metricas import COMPRESION_BYTES, COMPRESION_CACHE
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# ===============================================
+#  Algoritmos: de una vez (cuerpo completo) y en flujo
+# ===============================================
+def comprimir(datos: bytes, codificacion: str, nivel: int) -> bytes:
+    if codificacion == "zstd":
+        return zstandard.ZstdCompressor(level=nivel).compress(datos)
+    if codificacion == "br":
+        return brotli.compress(datos, quality=nivel)
+    # mtime=0: mismo cuerpo, mismos bytes
+    return gzip.compress(datos, compresslevel=nivel, mtime=0)
+
+
+class CompresorFlujo:
+    # Cada trozo sale comprimido en cuanto llega (flush): las respuestas en
+    # streaming (ndjson) no se retienen hasta el final
+
+    def __init__(self, codificacion: str, nivel: int):
+        self.codificacion = codificacion
+        if codificacion == "zstd":
+            self._compresor = zstandard.ZstdCompressor(level=nivel).compressobj()
+        elif codificacion == "br":
+            self._compresor = brotli.Compressor(quality=nivel)
+        else:
+            self._compresor = zlib.compressobj(nivel, zlib.DEFLATED, 31)
+
+    def trozo(self, datos: bytes) -> bytes:
+        if self.codificacion == "zstd":
+            return self._compresor.compress(datos) + self._compresor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        if self.codificacion == "br":
+            return self._compresor.process(datos) + self._compresor.flush()
+        return self._compresor.compress(datos) + self._compresor.flush(zlib.Z_SYNC_FLUSH)
+
+    def terminar(self) -> bytes:
+        if self.codificacion == "br":
+            return self._compresor.finish()
+        return self._compresor.flush()
+
+
+_INSTALADOS = {"zstd": zstandard is not None, "br": brotli is not None, "gzip": True}
+NIVELES = {"zstd": settings.COMPRESION_NIVEL_ZSTD, "br": settings.COMPRESION_NIVEL_BR, "gzip": settings.COMPRESION_NIVEL_GZIP}
+DISPONIBLES = tuple(c for c in (a.strip() for a in settings.COMPRESION_ALGORITMOS.split(",")) if _INSTALADOS.get(c))
+
+
+# ======= Accept-Encoding -> codificación (None = sin comprimir) ========
+# Gana la q más alta; a igual q, la preferencia del servidor. q=0 la excluye
+# aunque venga "*".
+def elegir_codificacion(cabecera: Optional[str], disponibles: tuple[str, ...] = DISPONIBLES) -> Optional[str]:
+    if not cabecera:
+        return None
+    pesos = {}
+    for parte in cabecera.split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        q = 1.0
+        for parametro in parametros.split(";"):
+            clave, _, valor = parametro.strip().partition("=")
+            if clave.strip() == "q":
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        pesos[nombre.strip().lower()] = q
+    mejor, mejor_q = None, 0.0
+    for codificacion in disponibles:
+        q = pesos.get(codificacion, pesos.get("*", 0.0))
+        if q > mejor_q:
+            mejor, mejor_q = codificacion, q
+    return mejor
+
+
+# text/event-stream no: cada evento tiene que salir en cuanto se produce
+_COMPRIMIBLES = ("application/json", "application/x-ndjson", "application/problem+json", "text/plain", "text/html", "text/csv")
+
+
+def comprimible(tipo: str) -> bool:
+    return tipo.split(";")[0].strip().lower() in _COMPRIMIBLES
+
+
+# Respuestas con ETag ya comprimidas (por worker)
+cache_compresion = CacheMemoria(max_entradas=settings.COMPRESION_CACHE_MAX, ttl=settings.COMPRESION_CACHE_TTL) if settings.COMPRESION_CACHE_MAX else None
+
+
+# ===============================================
+#  Middleware ASGI de compresión
+# ===============================================
+# Las respuestas con ETag (listados y documentos) se guardan ya comprimidas:
+# la misma ETag en la misma URL es el mismo cuerpo, así que un listado
+# caliente se comprime una vez por codificación y no en cada acierto. La
+# ETag pasa a débil (W/): sigue valiendo para If-None-Match e If-Match
+# (ver app/core/etag.py) pero ya no promete los mismos bytes.
+class MiddlewareCompresion:
+
+    def __init__(
+            self,
+            app,
+            minimo: int = settings.COMPRESION_MINIMO,
+            niveles: dict = NIVELES,
+            cache: Optional[CacheMemoria] = cache_compresion,
+            hilo_minimo: int = settings.COMPRESION_HILO_MINIMO,
+            cache_max_bytes: int = settings.COMPRESION_CACHE_MAX_BYTES,
+        ):
+        self.app = app
+        self.minimo = minimo
+        self.niveles = niveles
+        self.hilo_minimo = hilo_minimo
+        self.cache_max_bytes = cache_max_bytes
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        cabeceras = dict(scope["headers"])
+        codificacion = elegir_codificacion(cabeceras.get(b"accept-encoding", b"").decode("latin-1"))
+        if codificacion is None:
+            return await self.app(scope, receive, send)
+
+        inicio = None
+        flujo: Optional[CompresorFlujo] = None
+        # None: aún no se sabe; False: la respuesta pasa tal cual
+        comprimiendo = None
+
+        async def enviar(mensaje):
+            nonlocal inicio, flujo, comprimiendo
+            if mensaje["type"] == "http.response.start":
+                # Se retiene hasta ver el primer trozo del cuerpo
+                inicio = mensaje
+                return
+            if mensaje["type"] != "http.response.body":
+                return await send(mensaje)
+
+            cuerpo = mensaje.get("body", b"")
+            mas = mensaje.get("more_body", False)
+            if comprimiendo is None:
+                comprimiendo = self._decidir(inicio, cuerpo, mas)
+                if not comprimiendo:
+                    await send(inicio)
+                    return await send(mensaje)
+                if not mas:
+                    # Cuerpo completo: de una vez (o de la caché)
+                    comprimido = await self._comprimir_completo(scope, inicio, cuerpo, codificacion)
+                    await send(self._inicio_comprimido(inicio, codificacion, len(comprimido)))
+                    return await send({"type": "http.response.body", "body": comprimido})
+                flujo = CompresorFlujo(codificacion, self.niveles[codificacion])
+                await send(self._inicio_comprimido(inicio, codificacion, None))
+            elif not comprimiendo:
+                return await send(mensaje)
+
+            salida = flujo.trozo(cuerpo) if cuerpo else b""
+            if not mas:
+                salida += flujo.terminar()
+            COMPRESION_BYTES.labels(codificacion, "original").inc(len(cuerpo))
+            COMPRESION_BYTES.labels(codificacion, "comprimido").inc(len(salida))
+            await send({"type": "http.response.body", "body": salida, "more_body": mas})
+
+        await self.app(scope, receive, enviar)
+
+    def _decidir(self, inicio: dict, cuerpo: bytes, mas: bool) -> bool:
+        cabeceras = {k.lower(): v for k, v in inicio["headers"]}
+        if b"content-encoding" in cabeceras or not comprimible(cabeceras.get(b"content-type", b"").decode("latin-1")):
+            return False
+        if inicio["status"] < 200 or inicio["status"] in (204, 304):
+            return False
+        # En streaming no se conoce el total: se comprime siempre
+        return mas or len(cuerpo) >= self.minimo
+
+    async def _comprimir_completo(self, scope, inicio: dict, cuerpo: bytes, codificacion: str) -> bytes:
+        etag = dict(inicio["headers"]).get(b"etag")
+        clave = None
+        if etag and self.cache is not None and len(cuerpo) <= self.cache_max_bytes:
+            clave = f"{codificacion}:{scope['path']}?{scope['query_string'].decode('latin-1')}:{etag.decode('latin-1')}"
+            comprimido = await self.cache.obtener(clave)
+            if comprimido is not None:
+                COMPRESION_CACHE.labels("acierto").inc()
+                COMPRESION_BYTES.labels(codificacion, "original").inc(len(cuerpo))
+                COMPRESION_BYTES.labels(codificacion, "comprimido").inc(len(comprimido))
+                return comprimido
+
+        nivel = self.niveles[codificacion]
+        if len(cuerpo) >= self.hilo_minimo:
+            # zlib, brotli y zstandard sueltan el GIL mientras comprimen
+            comprimido = await asyncio.to_thread(comprimir, cuerpo, codificacion, nivel)
+        else:
+            comprimido = comprimir(cuerpo, codificacion, nivel)
+        COMPRESION_BYTES.labels(codificacion, "original").inc(len(cuerpo))
+        COMPRESION_BYTES.labels(codificacion, "comprimido").inc(len(comprimido))
+        if clave:
+            COMPRESION_CACHE.labels("fallo").inc()
+            await self.cache.guardar(clave, comprimido)
+        return comprimido
+
+    @staticmethod
+    def _inicio_comprimido(inicio: dict, codificacion: str, longitud: Optional[int]) -> dict:
+        cabeceras = []
+        vary = None
+        for clave, valor in inicio["headers"]:
+            nombre = clave.lower()
+            if nombre == b"content-length":
+                continue
+            if nombre == b"etag" and not valor.startswith(b"W/"):
+                valor = b"W/" + valor
+            if nombre == b"vary":
+                vary = valor
+                continue
+            cabeceras.append((clave, valor))
+        cabeceras.append((b"content-encoding", codificacion.encode()))
+        cabeceras.append((b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"))
+        if longitud is not None:
+            cabeceras.append((b"content-length", str(longitud).encode()))
+        return {**inicio, "headers": cabeceras}
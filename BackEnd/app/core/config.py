@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 from environs import Env
 
@@ -9,4 +10,146 @@ class Settings(BaseSettings):
     CLASE1_URL: str = env('CLASE1_URL')
     DB_NAME: str = "Parcial2_2025"
 
+    # --- Conexión a MongoDB (por worker) ---
+    MONGO_POOL_MIN: int = env.int('MONGO_POOL_MIN', 0)
+    MONGO_POOL_MAX: int = env.int('MONGO_POOL_MAX', 100)
+    # Espera máxima por una conexión libre del pool antes de fallar
+    MONGO_ESPERA_POOL_MS: int = env.int('MONGO_ESPERA_POOL_MS', 2_000)
+    MONGO_SELECCION_SERVIDOR_MS: int = env.int('MONGO_SELECCION_SERVIDOR_MS', 5_000)
+    MONGO_CONEXION_MS: int = env.int('MONGO_CONEXION_MS', 5_000)
+    # Compresores en orden de preferencia; los que no estén instalados se ignoran
+    MONGO_COMPRESORES: str = env('MONGO_COMPRESORES', 'zstd,snappy,zlib')
+    # Preferencia de lectura de búsquedas, mapa, cercanos, streaming NDJSON,
+    # exportación y listado de usuarios. Las páginas del listado, las
+    # estadísticas (cacheadas por versión), las lecturas por id y las
+    # escrituras van siempre al primario
+    MONGO_LECTURA_LISTADOS: str = env('MONGO_LECTURA_LISTADOS', 'secondaryPreferred')
+    # Registrar en el log los comandos que tarden más (ms; 0 = desactivado)
+    MONGO_CONSULTA_LENTA_MS: int = env.int('MONGO_CONSULTA_LENTA_MS', 0)
+    # /health/ready responde 503 por encima de esta fracción del pool en uso
+    SALUD_SATURACION_MAXIMA: float = env.float('SALUD_SATURACION_MAXIMA', 0.9)
+
+    # --- Listados paginados ---
+    LISTADO_LIMITE_DEFECTO: int = env.int('LISTADO_LIMITE_DEFECTO', 100)
+    LISTADO_LIMITE_MAXIMO: int = env.int('LISTADO_LIMITE_MAXIMO', 1000)
+    LISTADO_LOTE_STREAM: int = env.int('LISTADO_LOTE_STREAM', 500)
+    # Máximo de elementos por petición en /Parcial2/bulk
+    BULK_MAX_ELEMENTOS: int = env.int('BULK_MAX_ELEMENTOS', 10_000)
+    # Borrados simultáneos en DELETE /Parcial2/bulk (uno por documento)
+    BULK_BORRADO_CONCURRENCIA: int = env.int('BULK_BORRADO_CONCURRENCIA', 32)
+
+    # --- Mapa y búsqueda por cercanía ---
+    MAPA_LIMITE: int = env.int('MAPA_LIMITE', 500)
+    MAPA_ZOOM_AGRUPAR: int = env.int('MAPA_ZOOM_AGRUPAR', 12)
+    MAPA_CELDAS_POR_TESELA: int = env.int('MAPA_CELDAS_POR_TESELA', 4)
+    CERCANOS_RADIO_MAXIMO: int = env.int('CERCANOS_RADIO_MAXIMO', 50_000)
+
+    # --- Cloudinary ---
+    # Permite apuntar la SDK a un stub local (p. ej. http://localhost:9000)
+    CLOUDINARY_CLOUD_NAME: Optional[str] = env('CLOUDINARY_CLOUD_NAME', None)
+    CLOUDINARY_API_KEY: Optional[str] = env('CLOUDINARY_API_KEY', None)
+    CLOUDINARY_API_SECRET: Optional[str] = env('CLOUDINARY_API_SECRET', None)
+    CLOUDINARY_UPLOAD_PREFIX: Optional[str] = env('CLOUDINARY_UPLOAD_PREFIX', None)
+    CLOUDINARY_BORRADO_CONCURRENCIA: int = env.int('CLOUDINARY_BORRADO_CONCURRENCIA', 4)
+    CLOUDINARY_BORRADO_MAX_INTENTOS: int = env.int('CLOUDINARY_BORRADO_MAX_INTENTOS', 6)
+    CLOUDINARY_BORRADO_ESPERA_BASE: float = env.float('CLOUDINARY_BORRADO_ESPERA_BASE', 2.0)
+    CLOUDINARY_BORRADO_INTERVALO: float = env.float('CLOUDINARY_BORRADO_INTERVALO', 30.0)
+    CLOUDINARY_BORRADO_BLOQUEO: float = env.float('CLOUDINARY_BORRADO_BLOQUEO', 300.0)
+    CLOUDINARY_BORRADO_LOTE: int = env.int('CLOUDINARY_BORRADO_LOTE', 100)
+    CLOUDINARY_CARPETA: Optional[str] = env('CLOUDINARY_CARPETA', None)
+    # Segundos entre reconciliaciones de imágenes huérfanas (0 = desactivado;
+    # también sin CLOUDINARY_CARPETA, para no recorrer la cuenta entera)
+    CLOUDINARY_RECONCILIACION_INTERVALO: float = env.float('CLOUDINARY_RECONCILIACION_INTERVALO', 0)
+    CLOUDINARY_RECONCILIACION_GRACIA: float = env.float('CLOUDINARY_RECONCILIACION_GRACIA', 86_400)
+    # Subidas firmadas directas del navegador a Cloudinary
+    # Segundos que valen los parámetros firmados (Cloudinary acepta como mucho 1 h)
+    CLOUDINARY_SUBIDA_VALIDEZ: int = env.int('CLOUDINARY_SUBIDA_VALIDEZ', 600)
+    # URL pública de POST /Parcial2/cloudinary/notificaciones (sin ella no hay webhook)
+    CLOUDINARY_NOTIFICACION_URL: Optional[str] = env('CLOUDINARY_NOTIFICACION_URL', None)
+    # Variantes que Cloudinary genera al subir: nombre:transformación separadas por |
+    CLOUDINARY_VARIANTES: str = env('CLOUDINARY_VARIANTES', 'miniatura:c_fill,g_auto,w_200,h_200,q_auto|media:c_limit,w_800,q_auto')
+    # Variante que llevan por defecto los 'enlaces' de los listados (original = sin cambiar)
+    CLOUDINARY_VARIANTE_LISTADOS: str = env('CLOUDINARY_VARIANTE_LISTADOS', 'media')
+
+    # --- Caché de lecturas ---
+    # memoria | redis | ninguno
+    CACHE_BACKEND: str = env('CACHE_BACKEND', 'memoria')
+    CACHE_REDIS_URL: str = env('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    CACHE_TTL: float = env.float('CACHE_TTL', 60)
+    CACHE_TTL_GENERACION: float = env.float('CACHE_TTL_GENERACION', 3600)
+    CACHE_MAX_ENTRADAS: int = env.int('CACHE_MAX_ENTRADAS', 10_000)
+
+    # --- Autor (alias/foto) en las reseñas (?include=autor) ---
+    # Caché por worker de perfiles de usuario para las reseñas sin instantánea
+    AUTORES_CACHE_TTL: float = env.float('AUTORES_CACHE_TTL', 30)
+    AUTORES_CACHE_MAX: int = env.int('AUTORES_CACHE_MAX', 10_000)
+
+    # --- Autenticación con ID tokens de Firebase ---
+    # Sin proyecto no se verifica nada; con AUTH_OBLIGATORIA las escrituras sin token dan 401
+    FIREBASE_PROYECTO: Optional[str] = env('FIREBASE_PROYECTO', None)
+    FIREBASE_JWKS_URL: str = env('FIREBASE_JWKS_URL', 'https://www.googleapis.com/service_accounts/v1/jwk/securetoken@system.gserviceaccount.com')
+    AUTH_OBLIGATORIA: bool = env.bool('AUTH_OBLIGATORIA', False)
+    # Tokens verificados que se recuerdan (por worker) hasta su caducidad
+    AUTH_MAX_TOKENS: int = env.int('AUTH_MAX_TOKENS', 10_000)
+    # UIDs con acceso a /admin (separados por comas), además de la claim admin=true
+    ADMIN_UIDS: str = env('ADMIN_UIDS', '')
+
+    # --- Reseñas en tiempo real (GET /Parcial2/stream, SSE) ---
+    # Eventos que se guardan por cliente antes de darlo por lento y cortarlo
+    STREAM_COLA: int = env.int('STREAM_COLA', 100)
+    STREAM_MAX_SUSCRIPTORES: int = env.int('STREAM_MAX_SUSCRIPTORES', 1000)
+    # Últimos eventos que se recuerdan para reanudar con Last-Event-ID
+    STREAM_HISTORIAL: int = env.int('STREAM_HISTORIAL', 1000)
+    STREAM_LATIDO: float = env.float('STREAM_LATIDO', 15.0)
+    STREAM_REINTENTO: float = env.float('STREAM_REINTENTO', 5.0)
+
+    # --- Caducidad de usuarios (fechaCaducidad) ---
+    # ttl: índice TTL, Mongo los borra solo (sin cascada)
+    # barrido: tarea en segundo plano que los borra por lotes (admite cascada)
+    USUARIOS_CADUCIDAD_MODO: str = env('USUARIOS_CADUCIDAD_MODO', 'ttl')
+    USUARIOS_BARRIDO_INTERVALO: float = env.float('USUARIOS_BARRIDO_INTERVALO', 300)
+    USUARIOS_BARRIDO_LOTE: int = env.int('USUARIOS_BARRIDO_LOTE', 500)
+    # Borrar también las reseñas de los usuarios caducados (solo en modo barrido)
+    USUARIOS_CASCADA: bool = env.bool('USUARIOS_CASCADA', False)
+    USUARIOS_CASCADA_CONCURRENCIA: int = env.int('USUARIOS_CASCADA_CONCURRENCIA', 4)
+    USUARIOS_LIMITE_DEFECTO: int = env.int('USUARIOS_LIMITE_DEFECTO', 100)
+
+    # --- Listados idénticos concurrentes: una sola consulta ---
+    # memoria (por worker) | redis (entre workers; requiere CACHE_BACKEND=redis) | ninguno
+    COALESCENCIA_BACKEND: str = env('COALESCENCIA_BACKEND', 'memoria')
+    # Segundos que se espera al resultado de otro worker antes de consultar
+    COALESCENCIA_ESPERA: float = env.float('COALESCENCIA_ESPERA', 5.0)
+
+    # --- Límite de peticiones por usuario/IP (token bucket) ---
+    # memoria | redis | ninguno
+    LIMITE_BACKEND: str = env('LIMITE_BACKEND', 'memoria')
+    # Ráfaga máxima y fichas recuperadas por segundo
+    LIMITE_CAPACIDAD: float = env.float('LIMITE_CAPACIDAD', 60)
+    LIMITE_RECARGA: float = env.float('LIMITE_RECARGA', 2)
+    LIMITE_MAX_CLAVES: int = env.int('LIMITE_MAX_CLAVES', 100_000)
+    # Proxies de confianza (IPs separadas por comas o *): solo de ellos se cree
+    # X-Forwarded-For. La misma variable es forwarded_allow_ips en gunicorn.conf.py
+    SERVIDOR_PROXIES: str = env('SERVIDOR_PROXIES', '127.0.0.1')
+
+    # --- Compresión de respuestas (Accept-Encoding) ---
+    # Preferencia del servidor; las que no estén instaladas se ignoran
+    COMPRESION_ALGORITMOS: str = env('COMPRESION_ALGORITMOS', 'zstd,br,gzip')
+    # Por debajo de este tamaño (bytes) no compensa comprimir
+    COMPRESION_MINIMO: int = env.int('COMPRESION_MINIMO', 1024)
+    COMPRESION_NIVEL_GZIP: int = env.int('COMPRESION_NIVEL_GZIP', 6)
+    COMPRESION_NIVEL_BR: int = env.int('COMPRESION_NIVEL_BR', 5)
+    COMPRESION_NIVEL_ZSTD: int = env.int('COMPRESION_NIVEL_ZSTD', 3)
+    # Cuerpos más grandes se comprimen en un hilo para no parar el bucle
+    COMPRESION_HILO_MINIMO: int = env.int('COMPRESION_HILO_MINIMO', 256 * 1024)
+    # Respuestas con ETag ya comprimidas, por worker (0 = sin caché)
+    COMPRESION_CACHE_MAX: int = env.int('COMPRESION_CACHE_MAX', 512)
+    COMPRESION_CACHE_TTL: float = env.float('COMPRESION_CACHE_TTL', 600)
+    # Cuerpos mayores no se guardan (se comprimen en cada petición)
+    COMPRESION_CACHE_MAX_BYTES: int = env.int('COMPRESION_CACHE_MAX_BYTES', 4 * 1024 * 1024)
+
+    # --- Exportación e importación (rutas /admin y python -m app.core.exportacion) ---
+    # Documentos por lote: del cursor al exportar, por insert_many al importar
+    EXPORTACION_LOTE: int = env.int('EXPORTACION_LOTE', 1000)
+    EXPORTACION_NIVEL_GZIP: int = env.int('EXPORTACION_NIVEL_GZIP', 6)
+
 settings = Settings()
\ No newline at end of file
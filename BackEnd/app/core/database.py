@@ -1,5 +1,138 @@
-﻿from motor.motor_asyncio import AsyncIOMotorClient
+﻿from datetime import datetime, timedelta
+from typing import Optional
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from pymongo.errors import DuplicateKeyError
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
 from app.core.config import settings
+from app.core.metricas import monitor_comandos
 
-client = AsyncIOMotorClient(settings.MONGO_URI)
-db = client[settings.DB_NAME]
\ No newline at end of file
+
+# ===============================================
+#  Uso del pool de conexiones (para /health/ready)
+# ===============================================
+class MonitorPool(monitoring.ConnectionPoolListener):
+
+    def __init__(self):
+        # Por servidor: conexiones prestadas ahora mismo
+        self.en_uso: dict = {}
+        self.esperando = 0
+        self.tiempos_agotados = 0
+
+    def connection_check_out_started(self, event):
+        self.esperando += 1
+
+    def connection_checked_out(self, event):
+        self.esperando -= 1
+        self.en_uso[event.address] = self.en_uso.get(event.address, 0) + 1
+
+    def connection_check_out_failed(self, event):
+        self.esperando -= 1
+        if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+            self.tiempos_agotados += 1
+
+    def connection_checked_in(self, event):
+        self.en_uso[event.address] = max(0, self.en_uso.get(event.address, 0) - 1)
+
+    def pool_cleared(self, event):
+        self.en_uso.pop(event.address, None)
+
+    def pool_closed(self, event):
+        self.en_uso.pop(event.address, None)
+
+    # Eventos que no nos interesan
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def connection_created(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): pass
+
+    def estado(self) -> dict:
+        en_uso = max(self.en_uso.values(), default=0)
+        return {
+            "en_uso": en_uso,
+            "maximo": settings.MONGO_POOL_MAX,
+            "esperando": max(0, self.esperando),
+            "saturacion": en_uso / settings.MONGO_POOL_MAX if settings.MONGO_POOL_MAX else 0,
+            "tiempos_agotados": self.tiempos_agotados,
+        }
+
+
+monitor_pool = MonitorPool()
+
+
+# ===============================================
+#  Cliente: se abre y se cierra en el lifespan
+# ===============================================
+client: Optional[AsyncIOMotorClient] = None
+# Base de datos por preferencia de lectura (False = primario, True = listados)
+_bases: dict[bool, object] = {}
+
+
+def conectar() -> AsyncIOMotorClient:
+    global client
+    if client is None:
+        client = AsyncIOMotorClient(
+            settings.MONGO_URI,
+            minPoolSize=settings.MONGO_POOL_MIN,
+            maxPoolSize=settings.MONGO_POOL_MAX,
+            waitQueueTimeoutMS=settings.MONGO_ESPERA_POOL_MS,
+            serverSelectionTimeoutMS=settings.MONGO_SELECCION_SERVIDOR_MS,
+            connectTimeoutMS=settings.MONGO_CONEXION_MS,
+            compressors=settings.MONGO_COMPRESORES or None,
+            event_listeners=[monitor_pool, monitor_comandos],
+        )
+        preferencia = make_read_preference(read_pref_mode_from_name(settings.MONGO_LECTURA_LISTADOS), None)
+        _bases[False] = client[settings.DB_NAME]
+        _bases[True] = client.get_database(settings.DB_NAME, read_preference=preferencia)
+    return client
+
+
+def desconectar():
+    global client
+    if client is not None:
+        client.close()
+        client = None
+        _bases.clear()
+
+
+def get_db(lecturas: bool = False):
+    # Scripts y benchmarks que no pasan por el lifespan se conectan al primer uso
+    if client is None:
+        conectar()
+    return _bases[lecturas]
+
+
+# `db` y `db_lecturas` se pueden importar al cargar los módulos: resuelven el
+# cliente vigente en cada acceso, así sobreviven a un cierre y reapertura
+class _BaseDatosActual:
+
+    def __init__(self, lecturas: bool = False):
+        self._lecturas = lecturas
+
+    def __getattr__(self, nombre: str):
+        return getattr(get_db(self._lecturas), nombre)
+
+    def __getitem__(self, nombre: str):
+        return get_db(self._lecturas)[nombre]
+
+
+db = _BaseDatosActual()
+# Búsquedas, mapa, streaming y exportación: pueden ir a secundarios (MONGO_LECTURA_LISTADOS)
+db_lecturas = _BaseDatosActual(lecturas=True)
+
+
+# ======= Tareas periódicas: solo un proceso por intervalo ========
+# Quien consigue adelantar `hasta` tiene el turno; si el documento existe y su
+# turno no ha vencido, el upsert choca con el _id y lo tiene otro proceso.
+async def tomar_turno(tarea: str, segundos: float) -> bool:
+    ahora = datetime.utcnow()
+    try:
+        await db.Tareas.find_one_and_update(
+            {"_id": tarea, "hasta": {"$lte": ahora}},
+            {"$set": {"hasta": ahora + timedelta(seconds=segundos)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False
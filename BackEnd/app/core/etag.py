@@ -0,0 +1,38 @@
+import hashlib
+import json
+from typing import Optional
+
+
+# ======= ETag de un documento: su id y su versión ========
+# `variante` distingue representaciones del mismo documento (p. ej. con el
+# autor incluido, que cambia sin que cambie la versión de la reseña)
+def etag_documento(id, version: int, variante: Optional[str] = None) -> str:
+    return f'"{id}-{version}.{variante}"' if variante else f'"{id}-{version}"'
+
+
+# ======= ETag de un listado: versión del grupo + parámetros de la consulta ========
+def etag_lista(grupo: str, version: int, *parametros) -> str:
+    huella = hashlib.sha1(json.dumps(parametros, default=str).encode()).hexdigest()[:16]
+    return f'"{grupo}-{version}-{huella}"'
+
+
+# ======= ¿Alguna de las ETags de la cabecera coincide? ========
+def coincide(cabecera: Optional[str], etag: str) -> bool:
+    if not cabecera:
+        return False
+    candidatas = {c.strip().removeprefix("W/") for c in cabecera.split(",")}
+    return "*" in candidatas or etag in candidatas
+
+
+# ======= Versión que pide If-Match (None si no aplica) ========
+def version_de_if_match(cabecera: Optional[str], id: str) -> Optional[int]:
+    if not cabecera or cabecera.strip() == "*":
+        return None
+    etag = cabecera.split(",")[0].strip().removeprefix("W/").strip('"')
+    id_etag, _, version = etag.rpartition("-")
+    # Cualquier variante del documento sirve: solo cuenta su versión
+    version = version.partition(".")[0]
+    if id_etag != id or not version.isdigit():
+        # Una ETag de otro documento nunca puede coincidir
+        return -1
+    return int(version)
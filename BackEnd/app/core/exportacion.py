@@ -0,0 +1,354 @@
+"""
+Exportación e importación de Parcial2 y Usuario como NDJSON o CSV con gzip.
+
+NDJSON (Extended JSON de MongoDB, una línea por documento) es la copia
+exacta: conserva ObjectId, fechas y cualquier campo. CSV tiene columnas
+fijas por colección (para hojas de cálculo); los campos anidados van como
+JSON dentro de la celda y una celda vacía es null (como guarda la API los
+campos opcionales sin valor).
+
+Desde la API (rutas /admin, ver app/Admin_Routes.py) o a mano:
+
+    python -m app.core.exportacion exportar Parcial2 --salida parcial2.ndjson.gz
+    python -m app.core.exportacion exportar Usuario --formato csv --salida usuarios.csv.gz
+    python -m app.core.exportacion importar Parcial2 parcial2.ndjson.gz
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import logging
+import sys
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Optional
+from bson import ObjectId, json_util
+from app.core.config import settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Columnas del CSV por colección: (campo, tipo para leerlo al importar)
+COLUMNAS = {
+    "Parcial2": [
+        ("_id", "oid"), ("usuarioId", "str"), ("nombre", "str"), ("nombre_normalizado", "str"),
+        ("direccion", "str"), ("valoracion", "int"), ("fecha", "fecha"), ("coordenadas", "json"),
+        ("location", "json"), ("enlaces", "json"), ("medios", "json"), ("version", "int"),
+        ("autor", "json"), ("autor_email", "str"), ("autor_nombre", "str"), ("token_ref", "json"),
+    ],
+    "Usuario": [
+        ("_id", "str"), ("email", "str"), ("fechaLogueo", "fecha"), ("fechaCaducidad", "fecha"),
+        ("alias", "str"), ("foto", "str"),
+    ],
+}
+FORMATOS = ("ndjson", "csv")
+
+
+class RegistroNoValido(Exception):
+    pass
+
+
+# El fichero entero no se puede seguir leyendo (gzip corrupto o cortado);
+# lleva el resumen de lo importado hasta ese punto
+class CopiaNoValida(Exception):
+
+    def __init__(self, mensaje: str, resumen: Optional[dict] = None):
+        super().__init__(mensaje)
+        self.resumen = resumen
+
+
+# ===============================================
+#  Extended JSON (relaxed): {"$oid": ...}, {"$date": ...}
+# ===============================================
+def _fecha_iso(valor: datetime) -> str:
+    # Motor devuelve las fechas en UTC sin zona
+    texto = valor.isoformat(timespec="milliseconds")
+    return texto + "Z" if valor.tzinfo is None else texto
+
+
+if orjson is not None:
+    def _tipo_bson(valor):
+        if isinstance(valor, ObjectId):
+            return {"$oid": str(valor)}
+        if isinstance(valor, datetime):
+            return {"$date": _fecha_iso(valor)}
+        raise TypeError(type(valor).__name__)
+
+    def a_ejson(valor: Any) -> str:
+        return orjson.dumps(valor, default=_tipo_bson, option=orjson.OPT_PASSTHROUGH_DATETIME).decode()
+else:
+    def a_ejson(valor: Any) -> str:
+        return json_util.dumps(valor, json_options=json_util.RELAXED_JSON_OPTIONS, ensure_ascii=False, separators=(",", ":"))
+
+
+# Lo que escribe a_ejson se lee aquí directamente (json_util parsea las
+# fechas con strptime, que es lo más lento de importar); cualquier otro
+# objeto que empiece por $ pasa por json_util y el resto se queda como está
+def _objeto_bson(objeto: dict) -> Any:
+    clave = next(iter(objeto), "")
+    if clave[:1] != "$":
+        return objeto
+    valor = objeto[clave]
+    if len(objeto) == 1 and isinstance(valor, str):
+        if clave == "$oid":
+            return ObjectId(valor)
+        if clave == "$date":
+            fecha = datetime.fromisoformat(valor.removesuffix("Z"))
+            # Como las devuelve Motor: UTC sin zona
+            return fecha.astimezone(timezone.utc).replace(tzinfo=None) if fecha.tzinfo else fecha
+    return json_util.object_hook(objeto)
+
+
+# json.loads con object_hook crea un decodificador en cada llamada
+_decodificador = json.JSONDecoder(object_hook=_objeto_bson)
+
+
+def desde_ejson(texto: str) -> Any:
+    return _decodificador.decode(texto)
+
+
+# ===============================================
+#  Un documento <-> una línea (NDJSON) o una fila (CSV)
+# ===============================================
+def _celda(valor: Any) -> str:
+    if isinstance(valor, str):
+        return valor
+    if valor is None:
+        return ""
+    if isinstance(valor, (dict, list)):
+        return a_ejson(valor)
+    if isinstance(valor, datetime):
+        return _fecha_iso(valor)
+    if isinstance(valor, bool):
+        return "true" if valor else "false"
+    return str(valor)
+
+
+def _leer_celda(texto: str, tipo: str) -> Any:
+    if tipo == "oid":
+        return ObjectId(texto)
+    if tipo == "int":
+        return int(texto)
+    if tipo == "fecha":
+        return datetime.fromisoformat(texto.removesuffix("Z"))
+    if tipo == "json":
+        return desde_ejson(texto)
+    return texto
+
+
+def desde_fila(fila: list[str], cabecera: list[str], tipos: dict[str, str]) -> dict:
+    if len(fila) != len(cabecera):
+        raise RegistroNoValido(f"{len(fila)} columnas, se esperaban {len(cabecera)}")
+    documento = {}
+    for campo, texto in zip(cabecera, fila):
+        if texto == "":
+            # Sin _id, Mongo le asigna uno al insertar
+            if campo != "_id":
+                documento[campo] = None
+            continue
+        try:
+            documento[campo] = _leer_celda(texto, tipos.get(campo, "str"))
+        except (ValueError, TypeError) as e:
+            raise RegistroNoValido(f"{campo}: {e}")
+    return documento
+
+
+# ===============================================
+#  Exportar: documentos -> trozos gzip (memoria constante)
+# ===============================================
+# Se codifica y comprime por lotes del tamaño del lote del cursor: en memoria
+# solo hay un lote de documentos y lo que zlib aún no ha soltado
+async def exportar(
+        documentos: AsyncIterator[dict],
+        coleccion: str,
+        formato: str,
+        lote: int = settings.EXPORTACION_LOTE,
+        nivel: int = settings.EXPORTACION_NIVEL_GZIP,
+    ) -> AsyncIterator[bytes]:
+    compresor = zlib.compressobj(nivel, zlib.DEFLATED, 31)
+    buffer = io.StringIO()
+    columnas = [campo for campo, _ in COLUMNAS[coleccion]]
+    escritor = csv.writer(buffer, lineterminator="\n")
+    if formato == "csv":
+        escritor.writerow(columnas)
+
+    pendientes = 0
+    async for documento in documentos:
+        if formato == "csv":
+            escritor.writerow([_celda(documento.get(campo)) for campo in columnas])
+        else:
+            buffer.write(a_ejson(documento))
+            buffer.write("\n")
+        pendientes += 1
+        if pendientes >= lote:
+            salida = compresor.compress(buffer.getvalue().encode())
+            buffer.seek(0)
+            buffer.truncate()
+            pendientes = 0
+            if salida:
+                yield salida
+    yield compresor.compress(buffer.getvalue().encode()) + compresor.flush()
+
+
+# ===============================================
+#  Importar: trozos (gzip o no) -> (línea, documento, error)
+# ===============================================
+# Las líneas salen sin decodificar: un UTF-8 no válido es un error de esa
+# línea, no de toda la importación
+async def _lineas(trozos: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    descompresor = None
+    resto = b""
+    primero = True
+    async for trozo in trozos:
+        if primero and trozo:
+            primero = False
+            # gzip se reconoce por su cabecera: da igual cómo lo mande el cliente
+            if trozo[:2] == b"\x1f\x8b":
+                descompresor = zlib.decompressobj(47)
+        if descompresor is not None:
+            try:
+                trozo = descompresor.decompress(trozo)
+            except zlib.error as e:
+                raise CopiaNoValida(f"gzip no válido: {e}")
+        lineas = (resto + trozo).split(b"\n")
+        resto = lineas.pop()
+        for linea in lineas:
+            yield linea + b"\n"
+    if descompresor is not None:
+        resto += descompresor.flush()
+        if not descompresor.eof:
+            raise CopiaNoValida("gzip incompleto: el fichero está cortado")
+    if resto.strip():
+        yield resto
+
+
+async def documentos(trozos: AsyncIterator[bytes], coleccion: str, formato: str) -> AsyncIterator[tuple[int, Optional[dict], Optional[str]]]:
+    numero = 0
+    if formato == "ndjson":
+        async for linea in _lineas(trozos):
+            numero += 1
+            if not linea.strip():
+                continue
+            try:
+                # UnicodeDecodeError también es un ValueError
+                documento = desde_ejson(linea.decode("utf-8"))
+            except ValueError as e:
+                yield numero, None, str(e)
+                continue
+            if not isinstance(documento, dict):
+                yield numero, None, "Se esperaba un objeto JSON"
+                continue
+            yield numero, documento, None
+        return
+
+    # CSV: un registro puede ocupar varias líneas (comillas con saltos de
+    # línea); termina cuando el número de comillas acumulado es par
+    tipos = dict(COLUMNAS[coleccion])
+    cabecera = None
+    registro, comillas = "", 0
+    async for linea in _lineas(trozos):
+        numero += 1
+        try:
+            linea = linea.decode("utf-8")
+        except UnicodeDecodeError as e:
+            # Se descarta el registro en curso: no se puede saber dónde acaba
+            registro, comillas = "", 0
+            yield numero, None, str(e)
+            continue
+        registro += linea
+        comillas += linea.count('"')
+        if comillas % 2:
+            continue
+        texto, registro, comillas = registro, "", 0
+        if not texto.strip():
+            continue
+        fila = next(csv.reader([texto]))
+        if cabecera is None:
+            cabecera = fila
+            continue
+        try:
+            yield numero, desde_fila(fila, cabecera, tipos), None
+        except RegistroNoValido as e:
+            yield numero, None, str(e)
+
+
+# ======= Progreso: en el log como mucho cada `cada` segundos ========
+def progreso_en_log(etiqueta: str, cada: float = 5.0) -> Callable[[dict], None]:
+    ultimo = time.monotonic()
+
+    def informar(resumen: dict):
+        nonlocal ultimo
+        if time.monotonic() - ultimo >= cada:
+            ultimo = time.monotonic()
+            logger.info("%s: %s", etiqueta, {k: v for k, v in resumen.items() if k != "ejemplos"})
+
+    return informar
+
+
+# ===============================================
+#  Línea de comandos
+# ===============================================
+# 64 KiB de gzip son ~1 MB de texto: eso es lo que se descomprime de una vez
+async def leer_fichero(ruta: str, tamano: int = 64 * 1024) -> AsyncIterator[bytes]:
+    with open(ruta, "rb") as fichero:
+        while trozo := fichero.read(tamano):
+            yield trozo
+
+
+async def _ejecutar(args):
+    # El mismo servicio que las rutas /admin: filtros, lotes, resumen y versiones
+    from app.Parcial2_Service import Parcial2Service
+    from app.core.database import desconectar
+    try:
+        if args.orden == "exportar":
+            salida = open(args.salida, "wb") if args.salida else sys.stdout.buffer
+            try:
+                async for trozo in Parcial2Service.exportar(args.coleccion, args.formato, usuarioId=args.usuarioId):
+                    salida.write(trozo)
+            finally:
+                if args.salida:
+                    salida.close()
+            return
+
+        formato = args.formato or ("csv" if ".csv" in args.fichero else "ndjson")
+        inicio = time.perf_counter()
+
+        def progreso(resumen: dict):
+            segundos = time.perf_counter() - inicio
+            print(f"\r{resumen['leidos']} leídos, {resumen['insertados']} insertados, "
+                  f"{resumen['duplicados']} duplicados, {resumen['errores']} errores "
+                  f"({resumen['leidos'] / segundos:.0f} docs/s)", end="", file=sys.stderr)
+
+        try:
+            resumen = await Parcial2Service.importar(args.coleccion, formato, leer_fichero(args.fichero), progreso)
+        except CopiaNoValida as e:
+            resumen = e.resumen
+            print(f"\nImportación interrumpida: {e}", file=sys.stderr)
+        progreso(resumen)
+        print(file=sys.stderr)
+        for ejemplo in resumen["ejemplos"]:
+            print(f"  {ejemplo}", file=sys.stderr)
+    finally:
+        desconectar()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(prog="python -m app.core.exportacion")
+    ordenes = parser.add_subparsers(dest="orden", required=True)
+    exportar_ = ordenes.add_parser("exportar")
+    exportar_.add_argument("coleccion", choices=list(COLUMNAS))
+    exportar_.add_argument("--formato", choices=FORMATOS, default="ndjson")
+    exportar_.add_argument("--salida", help="Fichero .gz (por defecto, la salida estándar)")
+    exportar_.add_argument("--usuarioId", help="Solo las reseñas de este usuario")
+    importar_ = ordenes.add_parser("importar")
+    importar_.add_argument("coleccion", choices=list(COLUMNAS))
+    importar_.add_argument("fichero", help="NDJSON o CSV, con o sin gzip")
+    importar_.add_argument("--formato", choices=FORMATOS, help="Por defecto, según la extensión")
+    asyncio.run(_ejecutar(parser.parse_args()))
@@ -0,0 +1,64 @@
+from typing import Optional
+
+# Mongo necesita este CRS para polígonos de más de un hemisferio (zoom muy bajo)
+CRS_ESTRICTO = {"type": "name", "properties": {"name": "urn:x-mongodb:crs:strictwinding:EPSG:4326"}}
+
+# Separación máxima entre vértices del rectángulo, en grados de longitud:
+# los lados son geodésicas y con tramos largos dejarían de seguir el paralelo
+PASO_MAXIMO = 90
+
+
+# ======= Coordenadas de la reseña -> punto GeoJSON ========
+def coordenadas_a_location(coordenadas: Optional[list]) -> Optional[dict]:
+    # Coordenada guarda strings; nos quedamos con la primera que sea un punto válido
+    for coordenada in coordenadas or []:
+        try:
+            latitud = float(coordenada["latitud"])
+            longitud = float(coordenada["longitud"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if -90 <= latitud <= 90 and -180 <= longitud <= 180:
+            return {"type": "Point", "coordinates": [longitud, latitud]}
+    return None
+
+
+# ======= Rectángulo (sur, oeste, norte, este) -> polígono GeoJSON ========
+def _poligono(sur: float, oeste: float, norte: float, este: float) -> dict:
+    tramos = max(1, int((este - oeste) // PASO_MAXIMO) + 1)
+    paso = (este - oeste) / tramos
+    borde_sur = [[oeste + paso * i, sur] for i in range(tramos + 1)]
+    borde_norte = [[este - paso * i, norte] for i in range(tramos + 1)]
+    # Sentido antihorario: el interior es el rectángulo y no el resto del globo
+    anillo = borde_sur + borde_norte + [[oeste, sur]]
+    return {"type": "Polygon", "coordinates": [anillo], "crs": CRS_ESTRICTO}
+
+
+def filtro_rectangulo(sur: float, oeste: float, norte: float, este: float) -> dict:
+    if oeste <= este:
+        if este - oeste >= 360:
+            return {"location": {"$ne": None}}
+        return {"location": {"$geoWithin": {"$geometry": _poligono(sur, oeste, norte, este)}}}
+    # La vista cruza el antimeridiano: dos rectángulos
+    return {"$or": [
+        {"location": {"$geoWithin": {"$geometry": _poligono(sur, oeste, norte, 180)}}},
+        {"location": {"$geoWithin": {"$geometry": _poligono(sur, -180, norte, este)}}},
+    ]}
+
+
+# ======= ¿El punto GeoJSON cae en el rectángulo? (sin consultar la BD) ========
+def dentro_de_rectangulo(location: Optional[dict], sur: float, oeste: float, norte: float, este: float) -> bool:
+    if not location:
+        return False
+    longitud, latitud = location["coordinates"]
+    if not sur <= latitud <= norte:
+        return False
+    if oeste <= este:
+        return oeste <= longitud <= este
+    # Cruza el antimeridiano
+    return longitud >= oeste or longitud <= este
+
+
+# ======= Tamaño de celda de agrupación para un nivel de zoom ========
+def tamano_celda(zoom: int, celdas_por_tesela: int) -> float:
+    # Una tesela de zoom z abarca 360 / 2^z grados de longitud
+    return 360 / (2 ** zoom) / celdas_por_tesela
@@ -0,0 +1,133 @@
+import logging
+from pymongo import IndexModel, ASCENDING, DESCENDING, TEXT, GEOSPHERE
+from pymongo.errors import PyMongoError
+from app.core.config import settings
+from app.core.database import db
+
+logger = logging.getLogger(__name__)
+
+# ===============================================
+#  Registro declarativo de índices por colección
+# ===============================================
+# Cada índice lleva nombre explícito: así create_indexes es idempotente
+# y el informe de arranque puede decir cuáles ya existían.
+INDICES = {
+    "Parcial2": [
+        # Listado de un usuario ordenado por fecha (y keyset sobre _id)
+        IndexModel([("usuarioId", ASCENDING), ("fecha", DESCENDING), ("_id", DESCENDING)], name="usuario_fecha"),
+        # Listado general paginado y rangos de fecha
+        IndexModel([("fecha", DESCENDING), ("_id", DESCENDING)], name="fecha"),
+        IndexModel([("valoracion", DESCENDING)], name="valoracion"),
+        IndexModel([("numero", ASCENDING), ("fecha", DESCENDING)], name="numero_fecha", sparse=True),
+        IndexModel([("booleana", ASCENDING), ("fecha", DESCENDING)], name="booleana_fecha", sparse=True),
+        # Búsqueda: texto completo con relevancia y prefijo anclado para autocompletar
+        IndexModel(
+            [("nombre", TEXT), ("direccion", TEXT)], name="busqueda_texto",
+            weights={"nombre": 3, "direccion": 1}, default_language="spanish",
+        ),
+        IndexModel([("nombre_normalizado", ASCENDING)], name="nombre_normalizado"),
+        # Cercanía ($nearSphere) y vista del mapa ($geoWithin)
+        IndexModel([("location", GEOSPHERE)], name="location_2dsphere"),
+    ],
+    "Usuario": [
+        # TTL: Mongo borra el usuario en cuanto pasa su fechaCaducidad;
+        # en modo barrido el índice solo sirve para encontrar los caducados
+        IndexModel([("fechaCaducidad", ASCENDING)], name="caducidad_ttl", expireAfterSeconds=0)
+        if settings.USUARIOS_CADUCIDAD_MODO == "ttl" else
+        IndexModel([("fechaCaducidad", ASCENDING)], name="caducidad"),
+    ],
+    "SubidasCloudinary": [
+        # Se olvidan un día después de que caduque su firma
+        IndexModel([("olvidar", ASCENDING)], name="olvidar_ttl", expireAfterSeconds=0),
+    ],
+    "BorradosCloudinary": [
+        # Los workers reclaman por estado y fecha de próximo intento
+        IndexModel([("estado", ASCENDING), ("proximoIntento", ASCENDING)], name="estado_proximo"),
+        # Una imagen solo puede estar una vez en la cola
+        IndexModel([("publicId", ASCENDING)], name="public_id_unico", unique=True),
+        IndexModel([("lote", ASCENDING)], name="lote", sparse=True),
+    ],
+}
+
+# Índices que se borran si existen (el de la otra forma de caducar usuarios:
+# no pueden convivir dos índices sobre la misma clave con opciones distintas)
+RETIRADOS = {
+    "Usuario": ["caducidad"] if settings.USUARIOS_CADUCIDAD_MODO == "ttl" else ["caducidad_ttl"],
+}
+
+
+# ======= Crear los índices que falten e informar del estado ========
+async def aplicar_indices() -> dict:
+    informe = {}
+    for coleccion, indices in INDICES.items():
+        existentes = set(await db[coleccion].index_information())
+        estado = {}
+        for nombre in RETIRADOS.get(coleccion, []):
+            if nombre in existentes:
+                try:
+                    await db[coleccion].drop_index(nombre)
+                    estado[nombre] = "retirado"
+                except PyMongoError as e:
+                    estado[nombre] = f"error: {e}"
+                    logger.error("No se pudo retirar el índice %s.%s: %s", coleccion, nombre, e)
+        for indice in indices:
+            nombre = indice.document["name"]
+            if nombre in existentes:
+                estado[nombre] = "existente"
+                continue
+            try:
+                await db[coleccion].create_indexes([indice])
+                estado[nombre] = "creado"
+            except PyMongoError as e:
+                # Un índice que no se puede crear no debe tumbar el arranque
+                estado[nombre] = f"error: {e}"
+                logger.error("No se pudo crear el índice %s.%s: %s", coleccion, nombre, e)
+        informe[coleccion] = estado
+
+    # Builds en curso (p. ej. en otro nodo o lanzados por otro worker)
+    try:
+        en_curso = await db.client.admin.command(
+            {"currentOp": 1, "command.createIndexes": {"$exists": True}}
+        )
+        for op in en_curso.get("inprog", []):
+            coleccion = op["command"]["createIndexes"]
+            for indice in op["command"].get("indexes", []):
+                informe.setdefault(coleccion, {})[indice["name"]] = "construyendo"
+    except PyMongoError:
+        # currentOp requiere permisos que no siempre tenemos (p. ej. Atlas compartido)
+        pass
+
+    for coleccion, estado in informe.items():
+        for nombre, valor in estado.items():
+            logger.info("Índice %s.%s: %s", coleccion, nombre, valor)
+    return informe
+
+
+# ======= Resumen de explain() para detectar COLLSCAN ========
+def resumir_explain(explain: dict) -> dict:
+    plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+    # En Mongo 7+ el plan puede venir envuelto en queryPlan
+    plan = plan.get("queryPlan", plan)
+
+    etapas, indices = [], []
+    pendientes = [plan]
+    while pendientes:
+        etapa = pendientes.pop()
+        if not etapa:
+            continue
+        etapas.append(etapa.get("stage"))
+        if etapa.get("indexName"):
+            indices.append(etapa["indexName"])
+        pendientes.extend(etapa.get("inputStages", []))
+        pendientes.append(etapa.get("inputStage"))
+
+    estadisticas = explain.get("executionStats", {})
+    return {
+        "etapas": etapas,
+        "indices": indices,
+        "usaIndice": "COLLSCAN" not in etapas,
+        "documentosExaminados": estadisticas.get("totalDocsExamined"),
+        "clavesExaminadas": estadisticas.get("totalKeysExamined"),
+        "devueltos": estadisticas.get("nReturned"),
+        "tiempoMs": estadisticas.get("executionTimeMillis"),
+    }
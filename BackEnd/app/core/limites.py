@@ -0,0 +1,174 @@
+import math
+import time
+from collections import OrderedDict
+from typing import Optional
+from fastapi import HTTPException, Request
+from app.core.auth import ClavesNoDisponibles, TokenNoValido, verificador
+from app.core.config import settings
+from app.core.metricas import LIMITADAS
+
+
+# ===============================================
+#  Token bucket en memoria (por proceso)
+# ===============================================
+# Cada clave tiene un cubo de `capacidad` fichas que se rellena a `recarga`
+# fichas por segundo; cada petición gasta una. El reloj se inyecta para
+# poder probarlo sin esperar.
+class LimitadorMemoria:
+
+    def __init__(
+            self,
+            capacidad: float = settings.LIMITE_CAPACIDAD,
+            recarga: float = settings.LIMITE_RECARGA,
+            max_claves: int = settings.LIMITE_MAX_CLAVES,
+            reloj=time.monotonic,
+        ):
+        self.capacidad = capacidad
+        self.recarga = recarga
+        self.max_claves = max_claves
+        self.reloj = reloj
+        self._cubos: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    # Devuelve (permitida, segundos hasta tener ficha)
+    async def consumir(self, clave: str, coste: float = 1) -> tuple[bool, float]:
+        ahora = self.reloj()
+        fichas, ultimo = self._cubos.get(clave, (self.capacidad, ahora))
+        fichas = min(self.capacidad, fichas + (ahora - ultimo) * self.recarga)
+        permitida = fichas >= coste
+        if permitida:
+            fichas -= coste
+        self._cubos[clave] = (fichas, ahora)
+        self._cubos.move_to_end(clave)
+        # Las claves menos recientes se olvidan (volverían con el cubo lleno)
+        while len(self._cubos) > self.max_claves:
+            self._cubos.popitem(last=False)
+        return permitida, 0.0 if permitida else (coste - fichas) / self.recarga
+
+
+# ===============================================
+#  Token bucket en Redis (compartido entre workers)
+# ===============================================
+# Leer, rellenar y gastar en un script Lua: atómico aunque lleguen a la vez
+# desde varios procesos. La hora la pone el cliente (reloj inyectable).
+_SCRIPT_CUBO = """
+local capacidad = tonumber(ARGV[1])
+local recarga = tonumber(ARGV[2])
+local ahora = tonumber(ARGV[3])
+local coste = tonumber(ARGV[4])
+local cubo = redis.call('HMGET', KEYS[1], 'fichas', 'ultimo')
+local fichas = tonumber(cubo[1]) or capacidad
+local ultimo = tonumber(cubo[2]) or ahora
+fichas = math.min(capacidad, fichas + math.max(0, ahora - ultimo) * recarga)
+local permitida = 0
+if fichas >= coste then
+    fichas = fichas - coste
+    permitida = 1
+end
+redis.call('HSET', KEYS[1], 'fichas', tostring(fichas), 'ultimo', tostring(ahora))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacidad / recarga * 1000))
+return {permitida, tostring(fichas)}
+"""
+
+
+class LimitadorRedis:
+
+    def __init__(
+            self,
+            capacidad: float = settings.LIMITE_CAPACIDAD,
+            recarga: float = settings.LIMITE_RECARGA,
+            url: str = settings.CACHE_REDIS_URL,
+            cliente=None,
+            reloj=time.time,
+            prefijo: str = "parcial2:limite:",
+        ):
+        if cliente is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError("LIMITE_BACKEND=redis necesita el paquete 'redis'")
+            cliente = redis.from_url(url)
+        self.capacidad = capacidad
+        self.recarga = recarga
+        self.reloj = reloj
+        self.prefijo = prefijo
+        self._script = cliente.register_script(_SCRIPT_CUBO)
+
+    async def consumir(self, clave: str, coste: float = 1) -> tuple[bool, float]:
+        permitida, fichas = await self._script(
+            keys=[self.prefijo + clave],
+            args=[self.capacidad, self.recarga, self.reloj(), coste],
+        )
+        fichas = float(fichas)
+        return bool(permitida), 0.0 if permitida else (coste - fichas) / self.recarga
+
+
+# ===============================================
+#  Sin límite (LIMITE_BACKEND=ninguno)
+# ===============================================
+class LimitadorNulo:
+
+    async def consumir(self, clave: str, coste: float = 1) -> tuple[bool, float]:
+        return True, 0.0
+
+
+def crear_limitador():
+    if settings.LIMITE_BACKEND == "redis":
+        return LimitadorRedis()
+    if settings.LIMITE_BACKEND == "ninguno":
+        return LimitadorNulo()
+    return LimitadorMemoria()
+
+
+limitador = crear_limitador()
+
+
+# ======= IP del cliente: X-Forwarded-For solo si lo pone un proxy de confianza ========
+# Cada proxy añade por la derecha la IP de quien le habla; lo que haya a la
+# izquierda del primer salto que no es de confianza lo escribe el cliente.
+# Con uvicorn/gunicorn (forwarded_allow_ips) request.client ya suele venir
+# corregido y ya no es un proxy, así que la cabecera no se vuelve a mirar.
+PROXIES = {ip.strip() for ip in settings.SERVIDOR_PROXIES.split(",") if ip.strip()}
+
+
+def ip_cliente(request: Request, proxies: set[str] = PROXIES) -> str:
+    ip = request.client.host if request.client else "desconocida"
+    reenviada: Optional[str] = request.headers.get("x-forwarded-for")
+    if not reenviada or ("*" not in proxies and ip not in proxies):
+        return ip
+    saltos = [s.strip() for s in reenviada.split(",") if s.strip()]
+    if "*" in proxies:
+        # Todo es de confianza: el cliente es el primero (como uvicorn)
+        return saltos[0] if saltos else ip
+    for salto in reversed(saltos):
+        ip = salto
+        if salto not in proxies:
+            break
+    return ip
+
+
+# ======= Clave del cliente: el usuario del token si es válido, si no su IP ========
+# Nada que el cliente pueda cambiar a su antojo (?usuarioId, cabeceras sin
+# firmar): con un token no válido cuenta la IP y la ruta ya dará 401 (o 503
+# si no hay claves de Firebase con las que comprobarlo)
+async def clave_cliente(request: Request) -> str:
+    autorizacion = request.headers.get("authorization", "")
+    esquema, _, token = autorizacion.partition(" ")
+    if verificador is not None and esquema.lower() == "bearer" and token.strip():
+        try:
+            claims = await verificador.verificar(token.strip())
+            return f"usuario:{claims['sub']}"
+        except (TokenNoValido, ClavesNoDisponibles):
+            pass
+    return f"ip:{ip_cliente(request)}"
+
+
+# ======= Dependencia de FastAPI: 429 + Retry-After si se acaba el cubo ========
+async def limitar_peticiones(request: Request):
+    permitida, espera = await limitador.consumir(await clave_cliente(request))
+    if not permitida:
+        LIMITADAS.inc()
+        raise HTTPException(
+            status_code=429,
+            detail="Demasiadas peticiones",
+            headers={"Retry-After": str(max(1, math.ceil(espera)))},
+        )
@@ -0,0 +1,430 @@
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+import cloudinary.api
+import cloudinary.utils
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+from app.core.config import settings
+from app.core.database import db, tomar_turno
+from app.core.metricas import medir_cloudinary
+
+logger = logging.getLogger(__name__)
+
+
+# ======= Credenciales de Cloudinary (una vez por proceso) ========
+# Con gunicorn --preload se ejecuta en el master y los workers lo heredan
+def configurar_cloudinary():
+    cloudinary.config(
+        cloud_name=settings.CLOUDINARY_CLOUD_NAME,
+        api_key=settings.CLOUDINARY_API_KEY,
+        api_secret=settings.CLOUDINARY_API_SECRET,
+        secure=True,
+    )
+    if settings.CLOUDINARY_UPLOAD_PREFIX:
+        cloudinary.config(upload_prefix=settings.CLOUDINARY_UPLOAD_PREFIX)
+
+
+configurar_cloudinary()
+
+
+# ================================================================
+#   HELPERS: public_id y medios estructurados
+# ================================================================
+# https://res.cloudinary.com/<cloud>/image/upload/[transformaciones/][v123/]carpeta/foto.jpg
+_URL_CLOUDINARY = re.compile(
+    r"/(?:image|video|raw)/(?:upload|private|authenticated)/"
+    r"(?:[^/]*,[^/]*/|[a-z]{1,2}_[^/]+/)*"
+    r"(?:v\d+/)?"
+    r"(?P<public_id>.+?)(?:\.[A-Za-z0-9]+)?$"
+)
+
+
+def public_id_desde_url(url: str) -> Optional[str]:
+    # Solo para enlaces antiguos sin public_id guardado; respeta carpetas
+    if "cloudinary" not in url:
+        return None  # No es de cloudinary
+    coincidencia = _URL_CLOUDINARY.search(url.split("?")[0])
+    return coincidencia.group("public_id") if coincidencia else None
+
+
+def medios_desde_enlaces(enlaces: list[str], anteriores: Optional[list[dict]] = None) -> list[dict]:
+    # Reutiliza los medios ya guardados con la misma URL (o el mismo public_id, si
+    # el cliente devuelve la URL de una variante) para no perder sus metadatos
+    por_url = {m["url"]: m for m in anteriores or []}
+    por_public_id = {m["public_id"]: m for m in anteriores or [] if m.get("public_id")}
+    medios = []
+    for url in enlaces:
+        public_id = public_id_desde_url(url)
+        medios.append(por_url.get(url) or por_public_id.get(public_id) or {"url": url_original(url), "public_id": public_id})
+    return medios
+
+
+def sincronizar_medios(datos: dict, anteriores: Optional[list[dict]] = None):
+    # 'medios' manda; 'enlaces' se mantiene para los clientes que solo leen URLs
+    if datos.get("medios") is not None:
+        datos["enlaces"] = [m["url"] for m in datos["medios"]]
+    elif datos.get("enlaces") is not None:
+        datos["medios"] = medios_desde_enlaces(datos["enlaces"], anteriores)
+        datos["enlaces"] = [m["url"] for m in datos["medios"]]
+    for medio in datos.get("medios") or []:
+        if medio.get("public_id") and not medio.get("variantes") and _es_imagen(medio["url"]):
+            medio["variantes"] = variantes_de(medio["public_id"])
+
+
+def public_ids_de(documento: dict) -> set[str]:
+    ids = {m.get("public_id") for m in documento.get("medios") or []}
+    # Documentos antiguos: solo tienen enlaces
+    ids.update(public_id_desde_url(url) for url in documento.get("enlaces") or [])
+    ids.discard(None)
+    return ids
+
+
+# ================================================================
+#   Variantes (eager) y subidas firmadas directas a Cloudinary
+# ================================================================
+# El navegador sube el original directamente a Cloudinary con parámetros que
+# firma el backend (los bytes nunca pasan por la API); Cloudinary genera las
+# variantes al subir y avisa al webhook. Las URLs de las variantes se deducen
+# del public_id, así que se guardan desde el primer momento; el webhook las
+# sustituye por las definitivas (con versión y formato) cuando llegan.
+class NotificacionNoValida(Exception):
+    pass
+
+
+# nombre -> transformación, p. ej. {"miniatura": "c_fill,g_auto,w_200,h_200,q_auto"}
+VARIANTES = dict(v.split(":", 1) for v in settings.CLOUDINARY_VARIANTES.split("|") if v)
+
+
+def _es_imagen(url: str) -> bool:
+    return "/video/" not in url and "/raw/" not in url
+
+
+def _normalizar_transformacion(transformacion: str) -> str:
+    # Cloudinary devuelve los parámetros de cada paso ordenados alfabéticamente
+    return "/".join(",".join(sorted(paso.split(","))) for paso in transformacion.split("/"))
+
+
+_VARIANTES_NORMALIZADAS = {_normalizar_transformacion(t): nombre for nombre, t in VARIANTES.items()}
+
+
+# Paso de transformación justo tras /upload/ (el de nuestras variantes)
+_PASO_VARIANTE = re.compile(r"(/image/upload/)([^/]+)/")
+
+
+def url_original(url: str) -> str:
+    # Los listados devuelven variantes en 'enlaces'; si vuelven en un PUT se guarda el original
+    coincidencia = _PASO_VARIANTE.search(url)
+    if coincidencia and _normalizar_transformacion(coincidencia.group(2)) in _VARIANTES_NORMALIZADAS:
+        return url[:coincidencia.start(2)] + url[coincidencia.end(2) + 1:]
+    return url
+
+
+def variantes_de(public_id: str) -> dict[str, str]:
+    # Sin cloud_name (desarrollo, tests) cloudinary_url lanza una excepción:
+    # los medios se quedan solo con su URL y las variantes se calculan cuando
+    # vuelvan a guardarse con Cloudinary configurado
+    if not cloudinary.config().cloud_name:
+        return {}
+    return {
+        nombre: cloudinary.utils.cloudinary_url(public_id, raw_transformation=transformacion, secure=True)[0]
+        for nombre, transformacion in VARIANTES.items()
+    }
+
+
+def variantes_de_notificacion(carga: dict) -> dict[str, str]:
+    variantes = variantes_de(carga["public_id"])
+    for derivada in carga.get("eager") or []:
+        nombre = _VARIANTES_NORMALIZADAS.get(_normalizar_transformacion(derivada.get("transformation", "")))
+        if nombre and derivada.get("secure_url"):
+            variantes[nombre] = derivada["secure_url"]
+    return variantes
+
+
+def medio_desde_notificacion(carga: dict) -> dict:
+    return {
+        "url": carga["secure_url"],
+        "public_id": carga["public_id"],
+        "ancho": carga.get("width"),
+        "alto": carga.get("height"),
+        "bytes": carga.get("bytes"),
+        "variantes": variantes_de_notificacion(carga),
+    }
+
+
+def con_variantes(documentos: list[dict], variante: str) -> list[dict]:
+    # 'enlaces' con la variante de cada imagen en vez del original. Se devuelven
+    # copias: las listas pueden venir de la caché compartida
+    if variante == "original":
+        return documentos
+    resultado = []
+    for documento in documentos:
+        medios = documento.get("medios")
+        if medios and documento.get("enlaces") is not None:
+            documento = {**documento, "enlaces": [(m.get("variantes") or {}).get(variante) or m["url"] for m in medios]}
+        resultado.append(documento)
+    return resultado
+
+
+def firmar_subida(public_id: str) -> dict:
+    configuracion = cloudinary.config()
+    campos = {
+        "timestamp": int(time.time()),
+        "public_id": public_id,
+        "eager": "|".join(VARIANTES.values()),
+        "eager_async": "true",
+    }
+    if settings.CLOUDINARY_NOTIFICACION_URL:
+        campos["notification_url"] = settings.CLOUDINARY_NOTIFICACION_URL
+    campos["signature"] = cloudinary.utils.api_sign_request(campos, configuracion.api_secret)
+    campos["api_key"] = configuracion.api_key
+    return {"url": cloudinary.utils.cloudinary_api_url("upload", resource_type="image"), "campos": campos}
+
+
+def verificar_notificacion(cuerpo: bytes, marca: Optional[str], firma: Optional[str]) -> dict:
+    # Cloudinary firma sha1(cuerpo + X-Cld-Timestamp + api_secret) y la manda en X-Cld-Signature
+    if not marca or not firma:
+        raise NotificacionNoValida("Faltan X-Cld-Timestamp o X-Cld-Signature")
+    try:
+        valida = cloudinary.utils.verify_notification_signature(cuerpo.decode(), marca, firma)
+    except ValueError:
+        valida = False
+    if not valida:
+        raise NotificacionNoValida("Firma no válida o caducada")
+    return json.loads(cuerpo)
+
+
+# ================================================================
+#   Cola de borrado de Cloudinary (outbox en Mongo + workers)
+# ================================================================
+# Las peticiones solo insertan en la colección BorradosCloudinary y vuelven;
+# los workers reclaman lotes de hasta 100 public_id, los borran con una sola
+# llamada a delete_resources fuera del bucle de eventos y reintentan con
+# espera exponencial. Como la cola vive en Mongo, lo pendiente sobrevive a
+# reinicios y varios procesos pueden consumirla a la vez sin repetir trabajo.
+class ColaBorradoCloudinary:
+
+    def __init__(
+            self,
+            concurrencia: int = settings.CLOUDINARY_BORRADO_CONCURRENCIA,
+            max_intentos: int = settings.CLOUDINARY_BORRADO_MAX_INTENTOS,
+            espera_base: float = settings.CLOUDINARY_BORRADO_ESPERA_BASE,
+            intervalo: float = settings.CLOUDINARY_BORRADO_INTERVALO,
+            bloqueo: float = settings.CLOUDINARY_BORRADO_BLOQUEO,
+            lote: int = settings.CLOUDINARY_BORRADO_LOTE,
+        ):
+        self.concurrencia = concurrencia
+        self.max_intentos = max_intentos
+        self.espera_base = espera_base
+        self.intervalo = intervalo
+        self.bloqueo = bloqueo
+        # delete_resources admite como máximo 100 public_id por llamada
+        self.lote = min(lote, 100)
+        self._aviso = asyncio.Event()
+        self._parar = False
+        self._tareas: list[asyncio.Task] = []
+
+    @property
+    def coleccion(self):
+        return db.BorradosCloudinary
+
+    # ======= Encolar (lo único que hace la petición HTTP) ========
+    async def encolar(self, public_ids) -> int:
+        ahora = datetime.utcnow()
+        entradas = [{
+            "publicId": public_id,
+            "estado": "pendiente",
+            "intentos": 0,
+            "proximoIntento": ahora,
+            "creado": ahora,
+        } for public_id in set(public_ids) if public_id]
+        if not entradas:
+            return 0
+        try:
+            insertadas = len((await self.coleccion.insert_many(entradas, ordered=False)).inserted_ids)
+        except BulkWriteError as e:
+            # publicId es único: lo que ya estaba en cola no se duplica
+            if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+            insertadas = e.details.get("nInserted", 0)
+        self._aviso.set()
+        return insertadas
+
+    # ======= Arranque y parada (lifespan) ========
+    def iniciar(self):
+        self._parar = False
+        self._tareas = [asyncio.create_task(self._trabajador()) for _ in range(self.concurrencia)]
+
+    async def detener(self, espera: float = 10):
+        # Dejamos terminar lo que esté en vuelo; lo no reclamado sigue en la colección
+        self._parar = True
+        self._aviso.set()
+        if self._tareas:
+            _, pendientes = await asyncio.wait(self._tareas, timeout=espera)
+            for tarea in pendientes:
+                tarea.cancel()
+        self._tareas = []
+
+    # ======= Reclamar un lote de entradas listas para procesar ========
+    async def _reclamar(self) -> list[dict]:
+        ahora = datetime.utcnow()
+        disponibles = {"$or": [
+            {"estado": "pendiente", "proximoIntento": {"$lte": ahora}},
+            # Reclamada por un proceso que murió a medias
+            {"estado": "procesando", "reclamado": {"$lte": ahora - timedelta(seconds=self.bloqueo)}},
+        ]}
+        candidatas = await self.coleccion.find(disponibles, {"_id": 1}).sort("proximoIntento", ASCENDING).limit(self.lote).to_list(self.lote)
+        if not candidatas:
+            return []
+        # El update_many vuelve a comprobar el filtro: si otro worker se adelantó
+        # con alguna, esa no se marca con nuestro lote
+        marca = uuid.uuid4().hex
+        await self.coleccion.update_many(
+            {"_id": {"$in": [c["_id"] for c in candidatas]}, **disponibles},
+            {"$set": {"estado": "procesando", "reclamado": ahora, "lote": marca}},
+        )
+        return await self.coleccion.find({"lote": marca}).to_list(self.lote)
+
+    async def _trabajador(self):
+        while not self._parar:
+            # Se limpia antes de consultar: un encolar posterior siempre nos despierta
+            self._aviso.clear()
+            try:
+                entradas = await self._reclamar()
+            except Exception as e:
+                logger.warning("No se pudo leer la cola de borrado: %s", e)
+                entradas = []
+
+            if not entradas:
+                try:
+                    await asyncio.wait_for(self._aviso.wait(), timeout=self.intervalo)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._procesar(entradas)
+
+    # ======= Borrar el lote en Cloudinary y actualizar las entradas ========
+    async def _procesar(self, entradas: list[dict]):
+        try:
+            # La SDK es bloqueante: a un hilo para no parar el bucle de eventos
+            with medir_cloudinary("delete_resources"):
+                resultado = await asyncio.to_thread(cloudinary.api.delete_resources, [e["publicId"] for e in entradas])
+            estados = resultado.get("deleted", {})
+        except Exception as e:
+            for entrada in entradas:
+                await self._reintentar_o_fallar(entrada, e)
+            return
+
+        hechas = [e["_id"] for e in entradas if estados.get(e["publicId"]) in ("deleted", "not_found")]
+        if hechas:
+            await self.coleccion.delete_many({"_id": {"$in": hechas}})
+        for entrada in entradas:
+            if entrada["_id"] not in hechas:
+                error = RuntimeError(f"Respuesta inesperada de Cloudinary: {estados.get(entrada['publicId'])}")
+                await self._reintentar_o_fallar(entrada, error)
+
+    async def _reintentar_o_fallar(self, entrada: dict, error: Exception):
+        intentos = entrada.get("intentos", 0) + 1
+        if intentos >= self.max_intentos:
+            logger.error("Borrado de %s abandonado tras %s intentos: %s", entrada["publicId"], intentos, error)
+            cambios = {"estado": "fallido", "intentos": intentos, "error": str(error)}
+        else:
+            espera = self.espera_base * (2 ** (intentos - 1)) * random.uniform(0.5, 1.5)
+            cambios = {
+                "estado": "pendiente",
+                "intentos": intentos,
+                "error": str(error),
+                "proximoIntento": datetime.utcnow() + timedelta(seconds=espera),
+            }
+        await self.coleccion.update_one({"_id": entrada["_id"]}, {"$set": cambios})
+
+
+# ================================================================
+#   Reconciliación: imágenes de Cloudinary que ninguna reseña usa
+# ================================================================
+# Se listan los recursos de la carpeta en páginas de 500 (una llamada por
+# página, nunca por imagen) y se comparan con los public_id guardados.
+# Lo que sobra y es más antiguo que el margen de gracia (para no tocar
+# subidas que aún no se han guardado en una reseña) va a la cola de borrado.
+# Sin CLOUDINARY_CARPETA no se ejecuta: se listaría la cuenta entera y todo
+# lo que no sea de esta API (otras apps, otros entornos) parecería huérfano.
+class ReconciliadorCloudinary:
+
+    def __init__(
+            self,
+            cola: ColaBorradoCloudinary,
+            intervalo: float = settings.CLOUDINARY_RECONCILIACION_INTERVALO,
+            gracia: float = settings.CLOUDINARY_RECONCILIACION_GRACIA,
+            carpeta: Optional[str] = settings.CLOUDINARY_CARPETA,
+        ):
+        self.cola = cola
+        self.intervalo = intervalo
+        self.gracia = gracia
+        self.carpeta = carpeta
+        self._tarea: Optional[asyncio.Task] = None
+
+    def iniciar(self):
+        # intervalo 0 = desactivado
+        if self.intervalo > 0 and not self.carpeta:
+            logger.warning("Reconciliación de Cloudinary desactivada: necesita CLOUDINARY_CARPETA")
+            return
+        if self.intervalo > 0:
+            self._tarea = asyncio.create_task(self._bucle())
+
+    async def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            self._tarea = None
+
+    async def _bucle(self):
+        while True:
+            try:
+                if await tomar_turno("reconciliacion_cloudinary", self.intervalo):
+                    huerfanas = await self.reconciliar()
+                    logger.info("Reconciliación de Cloudinary: %s imágenes huérfanas encoladas", huerfanas)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Reconciliación de Cloudinary fallida: %s", e)
+            await asyncio.sleep(self.intervalo)
+
+    async def _ids_guardados(self) -> set[str]:
+        ids = set()
+        async for documento in db.Parcial2.find({}, {"medios.public_id": 1, "enlaces": 1}).batch_size(1000):
+            ids |= public_ids_de(documento)
+        return ids
+
+    async def reconciliar(self) -> int:
+        if not self.carpeta:
+            raise ValueError("La reconciliación necesita una carpeta (CLOUDINARY_CARPETA)")
+        guardados = await self._ids_guardados()
+        limite = datetime.utcnow() - timedelta(seconds=self.gracia)
+        # La barra final evita casar con otras carpetas que empiecen igual
+        opciones = {"type": "upload", "max_results": 500, "prefix": f"{self.carpeta.rstrip('/')}/"}
+
+        huerfanas = []
+        siguiente = None
+        while True:
+            with medir_cloudinary("resources"):
+                pagina = await asyncio.to_thread(
+                    cloudinary.api.resources, **opciones, **({"next_cursor": siguiente} if siguiente else {})
+                )
+            for recurso in pagina.get("resources", []):
+                creado = datetime.fromisoformat(recurso["created_at"].replace("Z", "+00:00")).replace(tzinfo=None)
+                if recurso["public_id"] not in guardados and creado < limite:
+                    huerfanas.append(recurso["public_id"])
+            siguiente = pagina.get("next_cursor")
+            if not siguiente:
+                break
+        return await self.cola.encolar(huerfanas)
+
+
+cola_borrado = ColaBorradoCloudinary()
+reconciliador = ReconciliadorCloudinary(cola_borrado)
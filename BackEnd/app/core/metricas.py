@@ -0,0 +1,205 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from pymongo import monitoring
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_LATENCIAS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_TAMANOS = (256, 1024, 4096, 16_384, 65_536, 262_144, 1_048_576, 4_194_304, 16_777_216)
+
+
+# ===============================================
+#  Métricas
+# ===============================================
+# La ruta es la plantilla (/Parcial2/{id}), no la URL: así no crece la cardinalidad
+PETICIONES = Histogram(
+    "http_peticion_segundos", "Duración de las peticiones HTTP",
+    ["metodo", "ruta", "estado"], buckets=_LATENCIAS,
+)
+RESPUESTA_BYTES = Histogram(
+    "http_respuesta_bytes", "Tamaño del cuerpo de las respuestas HTTP",
+    ["metodo", "ruta"], buckets=_TAMANOS,
+)
+MONGO_COMANDOS = Histogram(
+    "mongo_comando_segundos", "Duración de los comandos enviados a MongoDB",
+    ["coleccion", "operacion", "resultado"], buckets=_LATENCIAS,
+)
+MONGO_DOCUMENTOS = Counter(
+    "mongo_documentos_devueltos", "Documentos devueltos por find/aggregate/getMore",
+    ["coleccion", "operacion"],
+)
+COALESCIDAS = Counter(
+    "listados_coalescidos", "Listados servidos esperando a una consulta idéntica ya en vuelo",
+)
+LIMITADAS = Counter(
+    "peticiones_limitadas", "Peticiones rechazadas con 429 por el límite de peticiones",
+)
+USUARIOS_CADUCADOS = Counter(
+    "usuarios_caducados_borrados", "Usuarios borrados por el barrido de caducidad",
+)
+RESENAS_CASCADA = Counter(
+    "resenas_borradas_en_cascada", "Reseñas borradas junto a su usuario caducado",
+)
+BARRIDOS = Histogram(
+    "barrido_usuarios_segundos", "Duración de cada pasada del barrido de usuarios caducados",
+    ["resultado"], buckets=_LATENCIAS,
+)
+STREAM_SUSCRIPTORES = Gauge(
+    "stream_suscriptores", "Clientes conectados a /Parcial2/stream",
+    multiprocess_mode="livesum",
+)
+STREAM_DESCARTADOS = Counter(
+    "stream_descartados", "Clientes de /Parcial2/stream cortados por no leer a tiempo",
+)
+COMPRESION_BYTES = Counter(
+    "compresion_bytes", "Bytes de las respuestas comprimidas, antes y después de comprimir",
+    ["codificacion", "tipo"],
+)
+COMPRESION_CACHE = Counter(
+    "compresion_cache", "Respuestas comprimidas servidas desde la caché o comprimidas en el momento",
+    ["resultado"],
+)
+CLOUDINARY_LLAMADAS = Histogram(
+    "cloudinary_llamada_segundos", "Duración de las llamadas a la API de Cloudinary",
+    ["operacion", "resultado"], buckets=_LATENCIAS,
+)
+
+
+# ======= Cloudinary: with medir_cloudinary("delete_resources"): ... ========
+@contextmanager
+def medir_cloudinary(operacion: str):
+    inicio = time.perf_counter()
+    resultado = "ok"
+    try:
+        yield
+    except Exception:
+        resultado = "error"
+        raise
+    finally:
+        CLOUDINARY_LLAMADAS.labels(operacion, resultado).observe(time.perf_counter() - inicio)
+
+
+# ===============================================
+#  Middleware ASGI: latencia y bytes por ruta
+# ===============================================
+class MiddlewareMetricas:
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        inicio = time.perf_counter()
+        estado = 500
+        tamano = 0
+
+        async def enviar(mensaje):
+            nonlocal estado, tamano
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            elif mensaje["type"] == "http.response.body":
+                tamano += len(mensaje.get("body", b""))
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            # El router deja la ruta resuelta en el scope
+            ruta = getattr(scope.get("route"), "path", "sin_ruta")
+            PETICIONES.labels(scope["method"], ruta, str(estado)).observe(time.perf_counter() - inicio)
+            RESPUESTA_BYTES.labels(scope["method"], ruta).observe(tamano)
+
+
+# ===============================================
+#  Listener de comandos de Motor/PyMongo
+# ===============================================
+# Los comandos de lectura llevan la colección como valor del propio comando
+# ({"find": "Parcial2", ...}); getMore la lleva en "collection"
+_DEVUELVEN_DOCUMENTOS = {"find", "aggregate", "getMore"}
+# Comandos internos del driver que no interesan
+_IGNORADOS = {"hello", "isMaster", "ismaster", "ping", "endSessions", "saslStart", "saslContinue", "buildInfo"}
+
+
+def forma_filtro(valor):
+    # Estructura del filtro sin los valores: {"nombre_normalizado": {"$regex": "?"}}
+    if isinstance(valor, dict):
+        return {k: forma_filtro(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [forma_filtro(v) for v in valor]
+    return "?"
+
+
+class MonitorComandos(monitoring.CommandListener):
+
+    def __init__(self, lento_ms: int = settings.MONGO_CONSULTA_LENTA_MS):
+        # 0 = sin registro de consultas lentas
+        self.lento_ms = lento_ms
+        self._en_curso: dict = {}
+
+    def started(self, event):
+        if event.command_name in _IGNORADOS:
+            return
+        comando = event.command
+        if event.command_name == "explain" and isinstance(comando.get("explain"), dict):
+            # explain envuelve el comando real: {"explain": {"find": "Parcial2", "filter": ...}}
+            comando = comando["explain"]
+            coleccion = next(iter(comando.values()), None)
+        elif event.command_name == "getMore":
+            coleccion = comando.get("collection")
+        else:
+            coleccion = comando.get(event.command_name)
+        # Etiqueta acotada: nunca el valor de un comando que no sea un nombre de colección
+        if not isinstance(coleccion, str):
+            coleccion = "-"
+        # Para el registro de lentas se guarda el filtro (find) o el primer $match (aggregate)
+        filtro = None
+        if self.lento_ms:
+            filtro = comando.get("filter")
+            if filtro is None and comando.get("pipeline"):
+                filtro = comando["pipeline"][0].get("$match")
+        self._en_curso[(event.connection_id, event.request_id)] = (coleccion, filtro, comando.get("sort"))
+
+    def succeeded(self, event):
+        self._terminar(event, "ok", event.reply)
+
+    def failed(self, event):
+        self._terminar(event, "error", None)
+
+    def _terminar(self, event, resultado: str, respuesta):
+        datos = self._en_curso.pop((event.connection_id, event.request_id), None)
+        if datos is None:
+            return
+        coleccion, filtro, orden = datos
+        segundos = event.duration_micros / 1e6
+        MONGO_COMANDOS.labels(coleccion, event.command_name, resultado).observe(segundos)
+
+        if respuesta and event.command_name in _DEVUELVEN_DOCUMENTOS:
+            cursor = respuesta.get("cursor") or {}
+            lote = cursor.get("firstBatch", cursor.get("nextBatch", []))
+            MONGO_DOCUMENTOS.labels(coleccion, event.command_name).inc(len(lote))
+
+        if self.lento_ms and segundos * 1000 >= self.lento_ms:
+            logger.warning(
+                "Consulta lenta (%.1f ms): %s.%s filtro=%s orden=%s",
+                segundos * 1000, coleccion, event.command_name, forma_filtro(filtro), orden,
+            )
+
+
+monitor_comandos = MonitorComandos()
+
+
+# ======= Exposición en formato Prometheus ========
+def exponer() -> tuple[bytes, str]:
+    # Con gunicorn y PROMETHEUS_MULTIPROC_DIR se agregan los contadores de todos los workers
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+        return generate_latest(registro), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,141 @@
+﻿"""
+Migraciones de datos sobre colecciones existentes.
+
+Se lanzan a mano (no en el arranque, para no bloquear los workers):
+
+    python -m app.core.migraciones nombre_normalizado location resumen tokens autores
+"""
+import asyncio
+import logging
+import sys
+from pymongo import UpdateOne
+from app.core.database import db, desconectar
+from app.core.texto import normalizar
+from app.core.geo import coordenadas_a_location
+
+logger = logging.getLogger(__name__)
+
+LOTE = 1000
+
+
+# ======= Aplicar una lista de UpdateOne en lotes ========
+async def _aplicar_por_lotes(coleccion, filtro: dict, proyeccion: dict, construir_operacion) -> int:
+    total = 0
+    operaciones = []
+    async for documento in coleccion.find(filtro, proyeccion).batch_size(LOTE):
+        operacion = construir_operacion(documento)
+        if operacion is not None:
+            operaciones.append(operacion)
+        if len(operaciones) >= LOTE:
+            total += (await coleccion.bulk_write(operaciones, ordered=False)).modified_count
+            operaciones = []
+            logger.info("%s documentos migrados", total)
+    if operaciones:
+        total += (await coleccion.bulk_write(operaciones, ordered=False)).modified_count
+    return total
+
+
+# ======= nombre_normalizado para la búsqueda por prefijo ========
+async def nombre_normalizado() -> int:
+    return await _aplicar_por_lotes(
+        db.Parcial2,
+        {"nombre_normalizado": {"$exists": False}},
+        {"nombre": 1},
+        lambda d: UpdateOne({"_id": d["_id"]}, {"$set": {"nombre_normalizado": normalizar(d.get("nombre") or "")}}),
+    )
+
+
+# ======= location (GeoJSON) a partir de coordenadas ========
+async def location() -> int:
+    return await _aplicar_por_lotes(
+        db.Parcial2,
+        {"location": {"$exists": False}},
+        {"coordenadas": 1},
+        lambda d: UpdateOne({"_id": d["_id"]}, {"$set": {"location": coordenadas_a_location(d.get("coordenadas"))}}),
+    )
+
+
+# ======= Reconstruir Parcial2Resumen (estadísticas) desde cero ========
+# Necesaria una vez para los datos anteriores al resumen, o si se ha desajustado.
+# $out sustituye la colección de golpe: las lecturas nunca ven un resumen a medias.
+async def resumen() -> int:
+    pipeline = [
+        {"$group": {
+            "_id": {
+                "clave": {"$ifNull": ["$nombre_normalizado", {"$toLower": "$nombre"}]},
+                "valoracion": {"$ifNull": ["$valoracion", 0]},
+            },
+            "nombre": {"$last": "$nombre"},
+            "cuenta": {"$sum": 1},
+        }},
+        {"$group": {
+            "_id": "$_id.clave",
+            "nombre": {"$last": "$nombre"},
+            "total": {"$sum": "$cuenta"},
+            "suma": {"$sum": {"$multiply": ["$_id.valoracion", "$cuenta"]}},
+            "histograma": {"$push": {"k": {"$toString": "$_id.valoracion"}, "v": "$cuenta"}},
+        }},
+        {"$addFields": {"histograma": {"$arrayToObject": "$histograma"}}},
+        {"$out": "Parcial2Resumen"},
+    ]
+    await db.Parcial2.aggregate(pipeline).to_list(None)
+    return await db.Parcial2Resumen.count_documents({})
+
+
+# ======= Quitar los JWT guardados en cada reseña ========
+# Ahora el token se verifica en la petición y solo se guarda token_ref
+async def tokens() -> int:
+    resultado = await db.Parcial2.update_many(
+        {"$or": [{"token_id": {"$exists": True}}, {"token_emision": {"$exists": True}}, {"token_caducidad": {"$exists": True}}]},
+        {"$unset": {"token_id": "", "token_emision": "", "token_caducidad": ""}},
+    )
+    return resultado.modified_count
+
+
+# ======= Instantánea del autor (alias/foto de Usuario) en cada reseña ========
+# Un solo $lookup en el servidor; las reseñas de usuarios que ya no existen
+# quedan con autor null y no se vuelven a buscar
+async def autores() -> int:
+    pendientes = await db.Parcial2.count_documents({"autor": {"$exists": False}})
+    pipeline = [
+        {"$match": {"autor": {"$exists": False}}},
+        {"$lookup": {
+            "from": "Usuario",
+            "localField": "usuarioId",
+            "foreignField": "_id",
+            "pipeline": [{"$project": {"_id": 0, "alias": 1, "foto": 1}}],
+            "as": "autor",
+        }},
+        {"$project": {"autor": {"$ifNull": [{"$arrayElemAt": ["$autor", 0]}, None]}}},
+        {"$merge": {"into": "Parcial2", "on": "_id", "whenMatched": "merge", "whenNotMatched": "discard"}},
+    ]
+    await db.Parcial2.aggregate(pipeline).to_list(None)
+    return pendientes
+
+
+MIGRACIONES = {
+    "nombre_normalizado": nombre_normalizado,
+    "location": location,
+    "resumen": resumen,
+    "tokens": tokens,
+    "autores": autores,
+}
+
+
+# Todas en el mismo bucle: el cliente de Motor queda ligado al primero que lo usa
+async def _ejecutar(nombres: list[str]):
+    try:
+        for nombre in nombres:
+            modificados = await MIGRACIONES[nombre]()
+            print(f"{nombre}: {modificados} documentos actualizados")
+    finally:
+        desconectar()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    nombres = sys.argv[1:] or list(MIGRACIONES)
+    desconocidas = [n for n in nombres if n not in MIGRACIONES]
+    if desconocidas:
+        sys.exit(f"Migración desconocida: {', '.join(desconocidas)}. Disponibles: {', '.join(MIGRACIONES)}")
+    asyncio.run(_ejecutar(nombres))
@@ -0,0 +1,99 @@
+from datetime import datetime
+from typing import Any, Optional, get_args
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# ===============================================
+#  Serializador de lecturas
+# ===============================================
+# Lo que sale de Mongo ya se validó al escribirlo: en los listados no hace
+# falta construir un modelo por documento y que FastAPI lo vuelva a validar
+# con response_model. Se toman los campos del modelo (con su alias y su valor
+# por defecto) una sola vez y cada documento se copia convirtiendo ObjectId y
+# datetime directamente. El resultado es el mismo JSON que model_dump(mode="json").
+_SIN_CAMBIOS = (str, int, float, bool, type(None))
+
+
+def a_primitivo(valor: Any) -> Any:
+    if type(valor) in _SIN_CAMBIOS:
+        return valor
+    if isinstance(valor, ObjectId):
+        return str(valor)
+    if isinstance(valor, datetime):
+        texto = valor.isoformat()
+        # Pydantic escribe UTC como "Z"
+        return texto[:-6] + "Z" if texto.endswith("+00:00") else texto
+    if isinstance(valor, dict):
+        return {k: a_primitivo(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [a_primitivo(v) for v in valor]
+    return valor
+
+
+def _modelo_anidado(anotacion) -> Optional[type[BaseModel]]:
+    # Optional[list[Medio]] -> Medio
+    if isinstance(anotacion, type) and issubclass(anotacion, BaseModel):
+        return anotacion
+    for argumento in get_args(anotacion):
+        modelo = _modelo_anidado(argumento)
+        if modelo:
+            return modelo
+    return None
+
+
+class SerializadorLectura:
+
+    def __init__(self, modelo: type[BaseModel]):
+        # (clave en el documento y en el JSON, valor si falta, serializador del submodelo)
+        self.campos = []
+        for nombre, campo in modelo.model_fields.items():
+            defecto = None if campo.is_required() else campo.get_default(call_default_factory=True)
+            anidado = _modelo_anidado(campo.annotation)
+            self.campos.append((campo.alias or nombre, defecto, SerializadorLectura(anidado) if anidado else None))
+
+    def documento(self, documento: dict) -> dict:
+        salida = {}
+        for clave, defecto, anidado in self.campos:
+            valor = documento.get(clave, defecto)
+            if anidado is None or valor is None:
+                salida[clave] = a_primitivo(valor)
+            elif isinstance(valor, list):
+                # Submodelos (coordenadas, medios): mismos campos que daría Pydantic
+                salida[clave] = anidado.lista(valor)
+            else:
+                salida[clave] = anidado.documento(valor)
+        return salida
+
+    def lista(self, documentos: list[dict]) -> list[dict]:
+        return [self.documento(d) for d in documentos]
+
+
+# ======= Codificar a JSON (orjson si está instalado) ========
+if orjson is not None:
+    def a_bytes(contenido: Any) -> bytes:
+        return orjson.dumps(contenido)
+else:
+    import json
+
+    def a_bytes(contenido: Any) -> bytes:
+        return json.dumps(contenido, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# ======= Respuesta que no vuelve a pasar por response_model ========
+# FastAPI no valida lo que se devuelve como Response: el contenido tiene que
+# ser ya primitivo (lo que sale de SerializadorLectura o de la caché)
+class RespuestaJSON(JSONResponse):
+
+    def render(self, content: Any) -> bytes:
+        return a_bytes(content)
+
+
+def respuesta_json(contenido: Any, status_code: int = 200, headers: Optional[dict] = None) -> RespuestaJSON:
+    return RespuestaJSON(contenido, status_code=status_code, headers=headers)
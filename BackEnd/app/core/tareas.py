@@ -0,0 +1,29 @@
+import asyncio
+import logging
+from typing import Coroutine
+
+logger = logging.getLogger(__name__)
+
+# Referencias a las tareas lanzadas: asyncio solo guarda referencias débiles
+# y una tarea sin referencia puede desaparecer a medias
+_pendientes: set[asyncio.Task] = set()
+
+
+# ======= Trabajo que no hace esperar a la petición ========
+def en_segundo_plano(corrutina: Coroutine, descripcion: str) -> asyncio.Task:
+    tarea = asyncio.create_task(corrutina)
+    _pendientes.add(tarea)
+
+    def terminar(t: asyncio.Task):
+        _pendientes.discard(t)
+        if not t.cancelled() and t.exception():
+            logger.warning("Tarea en segundo plano fallida (%s): %s", descripcion, t.exception())
+
+    tarea.add_done_callback(terminar)
+    return tarea
+
+
+# ======= Parada: se deja terminar lo que está en vuelo ========
+async def esperar_pendientes(espera: float = 10):
+    if _pendientes:
+        await asyncio.wait(set(_pendientes), timeout=espera)
@@ -0,0 +1,27 @@
+import re
+import unicodedata
+
+# Máximo de términos que aceptamos en una búsqueda $text
+MAX_TERMINOS = 10
+
+
+# ======= Normalizar: sin tildes, sin mayúsculas, espacios colapsados ========
+def normalizar(texto: str) -> str:
+    descompuesto = unicodedata.normalize("NFKD", texto)
+    sin_tildes = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return " ".join(sin_tildes.casefold().split())
+
+
+# ======= Regex anclada de prefijo (usa el índice de nombre_normalizado) ========
+def regex_prefijo(texto: str) -> dict:
+    return {"$regex": "^" + re.escape(normalizar(texto))}
+
+
+# ======= Limpiar la entrada del usuario para $text ========
+def escapar_busqueda_texto(texto: str) -> str:
+    # Fuera comillas (frases) y guiones iniciales (negaciones): solo términos sueltos
+    terminos = [t.lstrip("-") for t in texto.replace('"', " ").replace("\\", " ").split()]
+    terminos = [t for t in terminos if t][:MAX_TERMINOS]
+    if not terminos:
+        raise ValueError("Búsqueda vacía")
+    return " ".join(terminos)
@@ -0,0 +1,144 @@
+"""
+Coste de arranque: cuánto tarda en importarse la app (en procesos nuevos,
+con -X importtime) y cuánto cuestan los efectos de importación propios
+(leer .env, construir Settings, configurar Cloudinary, generar OpenAPI).
+No necesita MongoDB:
+
+    python benchmarks/bench_arranque.py --repeticiones 5
+
+Con --servidor además arranca gunicorn (gunicorn.conf.py) con y sin
+precarga contra un MongoDB real y mide cuánto tarda en dar la primera respuesta:
+
+    python benchmarks/bench_arranque.py --servidor --workers 4 --mongo mongodb://localhost:27017
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(RAIZ))
+
+# app.core.config lee estas variables al importarse (aquí no se conecta a nada)
+ENTORNO = {**os.environ, "MONGO_URI": os.environ.get("MONGO_URI", "mongodb://localhost:27017"), "CLASE1_URL": os.environ.get("CLASE1_URL", "")}
+_LINEA = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+# ======= Importar main en un proceso nuevo: (µs propios, µs acumulados) por módulo ========
+def importar(modulo: str) -> tuple[float, dict[str, tuple[int, int]]]:
+    inicio = time.perf_counter()
+    salida = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=RAIZ, env=ENTORNO, capture_output=True, text=True, check=True,
+    )
+    total = time.perf_counter() - inicio
+    tiempos = {}
+    for linea in salida.stderr.splitlines():
+        coincidencia = _LINEA.match(linea)
+        if coincidencia:
+            propio, acumulado, _, nombre = coincidencia.groups()
+            tiempos[nombre] = (int(propio), int(acumulado))
+    return total, tiempos
+
+
+def medir(funcion, repeticiones: int) -> float:
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+# ======= Efectos de importación de la app, uno a uno ========
+def efectos(repeticiones: int):
+    os.environ.update(ENTORNO)
+    from environs import Env
+    from app.core.config import Settings
+    from app.core.media import configurar_cloudinary
+    import main
+
+    def openapi():
+        main.app.openapi_schema = None
+        main.app.openapi()
+
+    casos = [
+        ("Env().read_env()", lambda: Env().read_env()),
+        ("Settings()", Settings),
+        ("configurar_cloudinary()", configurar_cloudinary),
+        ("app.openapi() (primera vez en cada worker)", openapi),
+    ]
+    print("\nEfectos de importación (mejor de %d):" % repeticiones)
+    for nombre, funcion in casos:
+        print(f"  {nombre:<45} {medir(funcion, repeticiones) * 1000:8.2f} ms")
+
+
+# ======= gunicorn con y sin precarga: hasta la primera respuesta ========
+def servidor(args):
+    import httpx
+    from benchmarks.carga import puerto_libre
+
+    for precarga in (False, True):
+        puerto = puerto_libre()
+        entorno = {**ENTORNO, "MONGO_URI": args.mongo, "DB_NAME": args.db, "LIMITE_BACKEND": "ninguno",
+                   "SERVIDOR_PRECARGA": str(precarga).lower(), "SERVIDOR_WORKERS": str(args.workers),
+                   "SERVIDOR_PUERTO": str(puerto), "SERVIDOR_HOST": "127.0.0.1"}
+        inicio = time.perf_counter()
+        proceso = subprocess.Popen([sys.executable, "-m", "gunicorn", "main:app", "-c", "gunicorn.conf.py", "--log-level", "warning"],
+                                   cwd=RAIZ, env=entorno)
+        try:
+            primera = None
+            while primera is None and time.perf_counter() - inicio < 60:
+                try:
+                    if httpx.get(f"http://127.0.0.1:{puerto}/health/ready", timeout=1).status_code == 200:
+                        primera = time.perf_counter() - inicio
+                except httpx.TransportError:
+                    time.sleep(0.05)
+            print(f"  precarga={precarga!s:<5}  primera respuesta {primera * 1000 if primera else float('nan'):8.1f} ms")
+        finally:
+            proceso.terminate()
+            proceso.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--servidor", action="store_true")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--mongo", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="Parcial2_bench")
+    args = parser.parse_args()
+
+    totales, ejecuciones = [], []
+    for _ in range(args.repeticiones):
+        total, tiempos = importar("main")
+        totales.append(total)
+        ejecuciones.append(tiempos)
+    print(f"import main en un proceso nuevo: mediana {statistics.median(totales) * 1000:.0f} ms "
+          f"(incluye arrancar el intérprete; {args.repeticiones} repeticiones)")
+
+    def mediana(nombre: str, indice: int) -> float:
+        return statistics.median(t[nombre][indice] for t in ejecuciones if nombre in t) / 1000
+
+    nombres = set().union(*ejecuciones)
+    print("\nMódulos propios (ms propios / acumulados):")
+    for nombre in sorted((n for n in nombres if n == "main" or n.startswith("app.")), key=lambda n: -mediana(n, 1)):
+        print(f"  {nombre:<32} {mediana(nombre, 0):7.1f} {mediana(nombre, 1):8.1f}")
+    print(f"\nDependencias de primer nivel más caras (ms acumulados, top {args.top}):")
+    externos = {n for n in nombres if "." not in n and not n.startswith("_") and n != "main"}
+    for nombre in sorted(externos, key=lambda n: -mediana(n, 1))[:args.top]:
+        print(f"  {nombre:<32} {mediana(nombre, 1):8.1f}")
+
+    efectos(args.repeticiones)
+    if args.servidor:
+        print(f"\ngunicorn con {args.workers} workers:")
+        servidor(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Rendimiento de las rutas /Parcial2/bulk frente a N peticiones individuales.
+
+Necesita un MongoDB local; usa la base de datos indicada en --db (la vacía):
+
+    python benchmarks/bench_bulk.py --mongo mongodb://localhost:27017 --tamanos 1000 10000 100000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+def resena(i: int) -> dict:
+    return {
+        "usuarioId": f"user{i % 500}",
+        "nombre": f"Bar {i}",
+        "direccion": "Calle Granada 46, Málaga",
+        "valoracion": i % 6,
+        "coordenadas": [{"latitud": "36.722", "longitud": "-4.418"}],
+        "autor_email": "bench@example.com",
+        "autor_nombre": "Bench",
+        "token_id": "-",
+        "token_emision": "-",
+        "token_caducidad": "-",
+    }
+
+
+async def por_lotes(cliente, metodo: str, elementos: list, tam_lote: int) -> list:
+    resultados = []
+    for inicio in range(0, len(elementos), tam_lote):
+        respuesta = await cliente.request(metodo, "/Parcial2/bulk", json=elementos[inicio:inicio + tam_lote])
+        respuesta.raise_for_status()
+        resultados.extend(respuesta.json()["resultados"])
+    return resultados
+
+
+async def medir(n: int, tam_lote: int, individuales: int):
+    import httpx
+    from main import app
+    from app.core.database import db
+
+    await db.Parcial2.delete_many({})
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=None) as cliente:
+        elementos = [resena(i) for i in range(n)]
+
+        inicio = time.perf_counter()
+        creados = await por_lotes(cliente, "POST", elementos, tam_lote)
+        t_crear = time.perf_counter() - inicio
+        ids = [r["id"] for r in creados if r.get("id")]
+
+        cambios = [{"id": id, "datos": {"valoracion": 5}} for id in ids]
+        inicio = time.perf_counter()
+        await por_lotes(cliente, "PUT", cambios, tam_lote)
+        t_modificar = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        await por_lotes(cliente, "DELETE", ids, tam_lote)
+        t_eliminar = time.perf_counter() - inicio
+
+        # Referencia: las mismas altas de una en una (sobre una muestra)
+        muestra = elementos[:individuales]
+        inicio = time.perf_counter()
+        for elemento in muestra:
+            (await cliente.post("/Parcial2/", json=elemento)).raise_for_status()
+        t_individual = (time.perf_counter() - inicio) / len(muestra) * n
+
+    print(f"n={n:>7}  crear {n / t_crear:9.0f}/s  modificar {n / t_modificar:9.0f}/s  "
+          f"eliminar {n / t_eliminar:9.0f}/s  | crear de uno en uno ≈ {n / t_individual:7.0f}/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="Parcial2_bench")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--lote", type=int, default=1_000, help="Elementos por petición bulk")
+    parser.add_argument("--individuales", type=int, default=200, help="Muestra para la referencia sin bulk")
+    args = parser.parse_args()
+
+    # app.core.config lee estas variables al importarse
+    os.environ["MONGO_URI"] = args.mongo
+    os.environ["DB_NAME"] = args.db
+    os.environ.setdefault("CLASE1_URL", "")
+
+    async def todos():
+        for n in args.tamanos:
+            await medir(n, args.lote, min(args.individuales, n))
+
+    asyncio.run(todos())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Compara la búsqueda por nombre antigua ($regex sin anclar, case-insensitive)
+con la búsqueda $text y el prefijo anclado sobre nombre_normalizado.
+
+Necesita un MongoDB local (usa su propia base de datos, que vacía al empezar):
+
+    python benchmarks/bench_busqueda.py --mongo mongodb://localhost:27017 --n 100000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from pymongo import MongoClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+PALABRAS = ["Casa", "Bar", "Mesón", "Taberna", "Bodega", "Café", "Cervecería", "Marisquería",
+            "Lola", "Pepe", "Málaga", "Antonio", "Sol", "Mar", "Jardín", "Puerto", "Plaza", "Ángel"]
+CALLES = ["Calle Granada", "Avenida de Andalucía", "Plaza de la Constitución", "Calle Larios", "Paseo del Parque"]
+
+
+def sembrar(coleccion, n: int):
+    from app.core.indices import INDICES
+    from app.core.texto import normalizar
+
+    coleccion.drop()
+    lote = []
+    for i in range(n):
+        nombre = " ".join(random.sample(PALABRAS, 3))
+        lote.append({
+            "usuarioId": f"user{i % 500}",
+            "nombre": nombre,
+            "nombre_normalizado": normalizar(nombre),
+            "direccion": f"{random.choice(CALLES)} {random.randint(1, 200)}, Málaga",
+            "valoracion": random.randint(0, 5),
+        })
+        if len(lote) == 10_000:
+            coleccion.insert_many(lote, ordered=False)
+            lote = []
+    if lote:
+        coleccion.insert_many(lote, ordered=False)
+    coleccion.create_indexes(INDICES["Parcial2"])
+
+
+def medir(nombre: str, consulta, repeticiones: int):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        consulta()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    p95 = tiempos[int(len(tiempos) * 0.95) - 1]
+    print(f"{nombre:<28} p50={statistics.median(tiempos):8.2f} ms  p95={p95:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="Parcial2_bench")
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--repeticiones", type=int, default=50)
+    args = parser.parse_args()
+
+    # app.core.config exige estas variables al importarse
+    os.environ.setdefault("MONGO_URI", args.mongo)
+    os.environ.setdefault("CLASE1_URL", "")
+    from app.core.texto import regex_prefijo, escapar_busqueda_texto
+
+    coleccion = MongoClient(args.mongo)[args.db].Parcial2
+    print(f"Sembrando {args.n} documentos...")
+    sembrar(coleccion, args.n)
+
+    termino = "maris"
+    medir("regex sin anclar (antes)",
+          lambda: list(coleccion.find({"nombre": {"$regex": termino, "$options": "i"}}).limit(100)),
+          args.repeticiones)
+    medir("prefijo nombre_normalizado",
+          lambda: list(coleccion.find({"nombre_normalizado": regex_prefijo(termino)}).sort("nombre_normalizado").limit(100)),
+          args.repeticiones)
+    medir("$text por relevancia",
+          lambda: list(coleccion.find({"$text": {"$search": escapar_busqueda_texto("marisquería")}},
+                                      {"puntuacion": {"$meta": "textScore"}})
+                        .sort([("puntuacion", {"$meta": "textScore"})]).limit(100)),
+          args.repeticiones)
+
+
+if __name__ == "__main__":
+    main()
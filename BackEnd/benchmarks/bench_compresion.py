@@ -0,0 +1,116 @@
+"""
+CPU frente a ancho de banda de comprimir los listados: para cada algoritmo y
+nivel, tamaño resultante, tiempo de compresión y descompresión y tiempo
+total estimado (comprimir + transferir + descomprimir) en redes móviles.
+Al final, coste por petición del middleware con la caché de respuestas
+comprimidas (acierto) y sin ella. No necesita MongoDB:
+
+    python benchmarks/bench_compresion.py --tamanos 20 100 1000
+"""
+import argparse
+import asyncio
+import gzip
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.bench_serializacion import resena, medir
+
+# Niveles a probar por algoritmo (los de config.py por defecto: zstd 3, br 5, gzip 6)
+NIVELES = {"gzip": [1, 6, 9], "br": [1, 4, 5, 11], "zstd": [1, 3, 9, 19]}
+# Mbit/s: 3G lento, 4G normal, wifi
+REDES = {"3G": 1.6, "4G": 10, "wifi": 50}
+
+
+def descomprimir(datos: bytes, codificacion: str) -> bytes:
+    if codificacion == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(datos)
+    if codificacion == "br":
+        import brotli
+        return brotli.decompress(datos)
+    return gzip.decompress(datos)
+
+
+def listado(n: int) -> bytes:
+    # El mismo JSON que sale de GET /Parcial2/
+    from app.Parcial2_Service import serializador_parcial2
+    from app.core.serializacion import a_bytes
+    return a_bytes(serializador_parcial2.lista([resena(i) for i in range(n)]))
+
+
+def tabla(cuerpo: bytes, disponibles: tuple[str, ...], repeticiones: int):
+    from app.core.compresion import comprimir
+    print(f"\n{len(cuerpo) / 1024:.1f} KiB sin comprimir; "
+          + ", ".join(f"{red} {len(cuerpo) * 8 / (mbps * 1e6) * 1000:.0f} ms" for red, mbps in REDES.items()))
+    print(f"  {'algoritmo':<9} {'nivel':>5} {'KiB':>8} {'ratio':>6} {'comp ms':>8} {'MB/s':>7} {'desc ms':>8}  "
+          + " ".join(f"{'total ' + red:>11}" for red in REDES))
+    for codificacion in disponibles:
+        for nivel in NIVELES[codificacion]:
+            comprimido = comprimir(cuerpo, codificacion, nivel)
+            assert descomprimir(comprimido, codificacion) == cuerpo
+            compresion = medir("", lambda: comprimir(cuerpo, codificacion, nivel), repeticiones)
+            descompresion = medir("", lambda: descomprimir(comprimido, codificacion), repeticiones)
+            totales = [compresion + len(comprimido) * 8 / (mbps * 1e6) + descompresion for mbps in REDES.values()]
+            print(f"  {codificacion:<9} {nivel:>5} {len(comprimido) / 1024:8.1f} {len(cuerpo) / len(comprimido):6.1f} "
+                  f"{compresion * 1000:8.2f} {len(cuerpo) / compresion / 1e6:7.1f} {descompresion * 1000:8.2f}  "
+                  + " ".join(f"{t * 1000:8.1f} ms" for t in totales))
+
+
+# ======= Middleware: misma respuesta con ETag, con y sin caché ========
+def middleware(cuerpo: bytes, disponibles: tuple[str, ...], peticiones: int):
+    from app.core.cache import CacheMemoria
+    from app.core.compresion import MiddlewareCompresion
+
+    async def aplicacion(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"application/json"), (b"content-length", str(len(cuerpo)).encode()), (b"etag", b'"parcial2-1-bench"'),
+        ]})
+        await send({"type": "http.response.body", "body": cuerpo})
+
+    async def recibir():
+        return {"type": "http.request", "body": b""}
+
+    async def enviar(mensaje):
+        pass
+
+    async def medir_peticiones(app, codificacion: str) -> float:
+        scope = {"type": "http", "method": "GET", "path": "/Parcial2/", "query_string": b"", "headers": [(b"accept-encoding", codificacion.encode())]}
+        await app(scope, recibir, enviar)  # la primera llena la caché
+        inicio = time.perf_counter()
+        for _ in range(peticiones):
+            await app(scope, recibir, enviar)
+        return (time.perf_counter() - inicio) / peticiones
+
+    print(f"\nMiddleware ({peticiones} peticiones, {len(cuerpo) / 1024:.1f} KiB, niveles de config.py):")
+    for codificacion in disponibles:
+        sin_cache = asyncio.run(medir_peticiones(MiddlewareCompresion(aplicacion, cache=None), codificacion))
+        con_cache = asyncio.run(medir_peticiones(MiddlewareCompresion(aplicacion, cache=CacheMemoria(max_entradas=16)), codificacion))
+        print(f"  {codificacion:<5} comprimiendo cada vez {sin_cache * 1e6:9.1f} µs   desde la caché {con_cache * 1e6:7.1f} µs   x{sin_cache / con_cache:5.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[20, 100, 1_000], help="Reseñas por listado")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--peticiones", type=int, default=200)
+    args = parser.parse_args()
+
+    # app.core.config lee estas variables al importarse (aquí no se conecta a nada)
+    os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+    os.environ.setdefault("CLASE1_URL", "")
+    from app.core.compresion import DISPONIBLES
+    print(f"Algoritmos instalados: {', '.join(DISPONIBLES)}")
+
+    for n in args.tamanos:
+        print(f"\n===== Listado de {n} reseñas =====", end="")
+        cuerpo = listado(n)
+        tabla(cuerpo, DISPONIBLES, args.repeticiones)
+        middleware(cuerpo, DISPONIBLES, args.peticiones)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Rendimiento de la exportación e importación completas (app/core/exportacion.py)
+en NDJSON y CSV con gzip: documentos por segundo, tamaño del fichero y memoria
+máxima del proceso. Sin MongoDB mide solo el formato (codificar + comprimir,
+descomprimir + decodificar) con reseñas sintéticas que se generan al vuelo:
+
+    python benchmarks/bench_exportacion.py --documentos 1000000
+
+Con --mongo siembra la base indicada en --db (la BORRA, ver sembrar.py) y mide
+el camino completo: cursor -> fichero y fichero -> insert_many sin orden:
+
+    python benchmarks/bench_exportacion.py --mongo mongodb://localhost:27017 --documentos 1000000
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.sembrar import resena
+
+# Reseñas distintas que se van repitiendo: generar 1M con random cuesta más
+# que exportarlas y el fichero no debe poder comprimir una contra otra (cada
+# vuelta queda mucho más lejos que la ventana de 32 KiB de gzip)
+VARIEDAD = 10_000
+
+
+def memoria_maxima() -> float:
+    # ru_maxrss va en KiB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def sinteticos(n: int, muestra: list[dict]):
+    for i in range(n):
+        yield muestra[i % len(muestra)]
+
+
+async def a_fichero(trozos, ruta: str) -> int:
+    with open(ruta, "wb") as fichero:
+        async for trozo in trozos:
+            fichero.write(trozo)
+    return os.path.getsize(ruta)
+
+
+def informe(etiqueta: str, documentos: int, segundos: float, tamano: int = None):
+    extra = f"  {tamano / 1e6:8.1f} MB gz ({tamano / documentos:5.0f} B/doc)" if tamano is not None else ""
+    print(f"  {etiqueta:<28} {segundos:7.1f} s  {documentos / segundos:9.0f} docs/s{extra}  memoria máx {memoria_maxima():6.0f} MiB")
+
+
+# ======= Solo formato: sin base de datos ========
+async def formato(n: int, directorio: str):
+    from app.core.exportacion import exportar, documentos, leer_fichero
+
+    azar = random.Random(1)
+    muestra = [resena(i, max(1, n // 20), azar) for i in range(min(n, VARIEDAD))]
+    print(f"Solo formato, {n} reseñas (memoria tras generar la muestra: {memoria_maxima():.0f} MiB)")
+    for formato_ in ("ndjson", "csv"):
+        ruta = os.path.join(directorio, f"Parcial2.{formato_}.gz")
+        inicio = time.perf_counter()
+        tamano = await a_fichero(exportar(sinteticos(n, muestra), "Parcial2", formato_), ruta)
+        informe(f"exportar {formato_}", n, time.perf_counter() - inicio, tamano)
+
+        inicio = time.perf_counter()
+        leidos = errores = 0
+        async for _, _, error in documentos(leer_fichero(ruta), "Parcial2", formato_):
+            leidos += 1
+            errores += error is not None
+        assert leidos == n and not errores, (leidos, errores)
+        informe(f"leer {formato_}", n, time.perf_counter() - inicio)
+
+
+# ======= Camino completo contra MongoDB ========
+async def completo(n: int, directorio: str):
+    from app.Parcial2_Service import Parcial2Service
+    from app.core.exportacion import leer_fichero
+    from app.core.database import db, desconectar
+
+    try:
+        print(f"MongoDB, {n} reseñas")
+        for formato_ in ("ndjson", "csv"):
+            ruta = os.path.join(directorio, f"Parcial2.{formato_}.gz")
+            inicio = time.perf_counter()
+            tamano = await a_fichero(Parcial2Service.exportar("Parcial2", formato_), ruta)
+            informe(f"exportar {formato_}", n, time.perf_counter() - inicio, tamano)
+
+            # Se importa sobre la colección vacía y otra vez encima (todo duplicados)
+            await db.Parcial2.delete_many({})
+            await db.Parcial2Resumen.delete_many({})
+            inicio = time.perf_counter()
+            resumen = await Parcial2Service.importar("Parcial2", formato_, leer_fichero(ruta))
+            informe(f"importar {formato_}", n, time.perf_counter() - inicio)
+            assert resumen["insertados"] == n, resumen
+
+            inicio = time.perf_counter()
+            resumen = await Parcial2Service.importar("Parcial2", formato_, leer_fichero(ruta))
+            informe(f"reimportar {formato_} (duplicados)", n, time.perf_counter() - inicio)
+            assert resumen["duplicados"] == n, resumen
+    finally:
+        desconectar()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documentos", type=int, default=100_000)
+    parser.add_argument("--mongo", help="Sin él, solo se mide el formato")
+    parser.add_argument("--db", default="Parcial2_bench")
+    parser.add_argument("--directorio", default=None, help="Dónde escribir los ficheros (por defecto, uno temporal)")
+    args = parser.parse_args()
+
+    # app.core.config lee estas variables al importarse
+    os.environ["MONGO_URI"] = args.mongo or os.environ.get("MONGO_URI", "mongodb://localhost:27017")
+    os.environ["DB_NAME"] = args.db
+    os.environ.setdefault("CLASE1_URL", "")
+
+    with tempfile.TemporaryDirectory() as temporal:
+        directorio = args.directorio or temporal
+        if args.mongo:
+            from benchmarks.sembrar import sembrar
+            sembrar(args.mongo, args.db, args.documentos, max(1, args.documentos // 20))
+            asyncio.run(completo(args.documentos, directorio))
+        else:
+            asyncio.run(formato(args.documentos, directorio))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Latencia de PUT /Parcial2/{id}: camino antiguo (find_one + update_one +
+find_one, tres viajes) frente al actual (un find_one_and_update).
+
+Necesita un MongoDB local; usa la base de datos indicada en --db:
+
+    python benchmarks/bench_modificar.py --mongo mongodb://localhost:27017 --n 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# Límites superiores (ms) de las cubetas del histograma
+CUBETAS = [0.5, 1, 2, 5, 10, 20, 50, 100, float("inf")]
+
+
+def histograma(nombre: str, tiempos: list[float]):
+    tiempos.sort()
+    percentil = lambda p: tiempos[min(len(tiempos) - 1, int(len(tiempos) * p))]
+    print(f"\n{nombre}: p50={percentil(0.50):.2f} ms  p95={percentil(0.95):.2f} ms  p99={percentil(0.99):.2f} ms")
+    anterior = 0
+    for limite in CUBETAS:
+        cuenta = sum(1 for t in tiempos if anterior < t <= limite)
+        etiqueta = f"<= {limite:g} ms" if limite != float("inf") else f">  {anterior:g} ms"
+        print(f"  {etiqueta:>12} {cuenta:6d} {'#' * (60 * cuenta // len(tiempos))}")
+        anterior = limite
+
+
+async def medir(n: int):
+    from bson import ObjectId
+    from app.core.database import db
+    from app.Parcial2_Repository import Parcial2Repository
+
+    await db.Parcial2.delete_many({})
+    ids = [ObjectId() for _ in range(n)]
+    await db.Parcial2.insert_many([
+        {"_id": id, "usuarioId": "bench", "nombre": "Bar", "valoracion": 3, "version": 1, "enlaces": []}
+        for id in ids
+    ])
+
+    antes = []
+    for id in ids:
+        inicio = time.perf_counter()
+        await db.Parcial2.find_one({"_id": id})
+        await db.Parcial2.update_one({"_id": id}, {"$set": {"valoracion": 4}})
+        await db.Parcial2.find_one({"_id": id})
+        antes.append((time.perf_counter() - inicio) * 1000)
+
+    despues = []
+    for id in ids:
+        inicio = time.perf_counter()
+        await Parcial2Repository.modificar(id, {"valoracion": 5})
+        despues.append((time.perf_counter() - inicio) * 1000)
+
+    histograma("Antes (3 viajes)", antes)
+    histograma("Después (find_one_and_update)", despues)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="Parcial2_bench")
+    parser.add_argument("--n", type=int, default=2_000)
+    args = parser.parse_args()
+
+    # app.core.config lee estas variables al importarse
+    os.environ["MONGO_URI"] = args.mongo
+    os.environ["DB_NAME"] = args.db
+    os.environ.setdefault("CLASE1_URL", "")
+    asyncio.run(medir(args.n))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Tamaño y tiempo de GET /Parcial2/ con todos los campos frente a ?fields=
+(solo lo que pinta una vista de lista/mapa).
+
+Necesita un MongoDB local; usa la base de datos indicada en --db (la vacía):
+
+    python benchmarks/bench_proyeccion.py --mongo mongodb://localhost:27017 --n 10000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+CAMPOS_VISTA = "_id,nombre,valoracion,coordenadas"
+
+
+def resena(i: int) -> dict:
+    from datetime import datetime, timedelta
+    enlaces = [f"https://res.cloudinary.com/demo/image/upload/v1/resenas/{i}_{j}.jpg" for j in range(3)]
+    return {
+        "usuarioId": f"user{i % 500}",
+        "nombre": f"Bar {i}",
+        "nombre_normalizado": f"bar {i}",
+        "direccion": "Calle Granada 46, Málaga",
+        "valoracion": i % 6,
+        "fecha": datetime(2025, 1, 1) + timedelta(minutes=i),
+        "coordenadas": [{"latitud": "36.722", "longitud": "-4.418"}],
+        "enlaces": enlaces,
+        "medios": [{"url": u, "public_id": u.rsplit("/", 1)[1][:-4]} for u in enlaces],
+        "version": 1,
+        "autor_email": "bench@example.com",
+        "autor_nombre": "Bench",
+        "token_id": "eyJhbGciOiJSUzI1NiIsImtpZCI6IjEifQ." + "x" * 600,
+        "token_emision": "2025-01-01T00:00:00Z",
+        "token_caducidad": "2025-01-01T01:00:00Z",
+    }
+
+
+async def recorrer(cliente, parametros: dict) -> tuple[int, int, float]:
+    # Todas las páginas, siguiendo X-Siguiente-Cursor
+    total_bytes = documentos = 0
+    cursor = None
+    inicio = time.perf_counter()
+    while True:
+        respuesta = await cliente.get("/Parcial2/", params={**parametros, **({"cursor": cursor} if cursor else {})})
+        respuesta.raise_for_status()
+        total_bytes += len(respuesta.content)
+        documentos += len(respuesta.json())
+        cursor = respuesta.headers.get("X-Siguiente-Cursor")
+        if not cursor:
+            break
+    return documentos, total_bytes, time.perf_counter() - inicio
+
+
+async def medir(n: int, limite: int):
+    import httpx
+    from main import app
+    from app.core.database import db
+    from app.core.cache import CacheNula
+    import app.Parcial2_Service as servicio
+
+    # Sin caché: se mide la consulta y la serialización, no la memoria
+    servicio.cache = CacheNula()
+    await db.Parcial2.delete_many({})
+    await db.Parcial2.insert_many([resena(i) for i in range(n)])
+
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=None) as cliente:
+        for nombre, parametros in [("completo", {}), (f"fields={CAMPOS_VISTA}", {"fields": CAMPOS_VISTA})]:
+            documentos, total_bytes, segundos = await recorrer(cliente, {"limit": limite, **parametros})
+            print(f"{nombre:<45} {documentos:>7} docs  {total_bytes / documentos:8.0f} B/doc  "
+                  f"{total_bytes / 1e6:8.2f} MB  {segundos * 1000:8.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="Parcial2_bench")
+    parser.add_argument("--n", type=int, default=10_000)
+    parser.add_argument("--limite", type=int, default=1_000, help="Tamaño de página")
+    args = parser.parse_args()
+
+    # app.core.config lee estas variables al importarse
+    os.environ["MONGO_URI"] = args.mongo
+    os.environ["DB_NAME"] = args.db
+    os.environ.setdefault("CLASE1_URL", "")
+    asyncio.run(medir(args.n, args.limite))
+
+
+if __name__ == "__main__":
+    main()
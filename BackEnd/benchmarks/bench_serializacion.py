@@ -0,0 +1,107 @@
+"""
+Coste por documento de serializar listados: camino con Pydantic (modelo por
+documento + revalidación de response_model + json) frente a
+SerializadorLectura + orjson. No necesita MongoDB; los documentos se generan
+con la misma forma que devuelve Motor (ObjectId, datetime, medios...):
+
+    python benchmarks/bench_serializacion.py --tamanos 1000 10000 100000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+def resena(i: int) -> dict:
+    from bson import ObjectId
+    return {
+        "_id": ObjectId(),
+        "usuarioId": f"user{i % 500}",
+        "nombre": f"Bar {i}",
+        "nombre_normalizado": f"bar {i}",
+        "direccion": "Calle Granada 46, Málaga",
+        "valoracion": i % 6,
+        "fecha": datetime(2025, 1, 1) + timedelta(minutes=i),
+        "coordenadas": [{"latitud": "36.722", "longitud": "-4.418"}],
+        "location": {"type": "Point", "coordinates": [-4.418, 36.722]},
+        "enlaces": [f"https://res.cloudinary.com/demo/image/upload/v1/resenas/{i}.jpg"],
+        "medios": [{"url": f"https://res.cloudinary.com/demo/image/upload/v1/resenas/{i}.jpg", "public_id": f"resenas/{i}"}],
+        "version": 1,
+        "autor_email": "bench@example.com",
+        "autor_nombre": "Bench",
+        "token_id": "-",
+        "token_emision": "-",
+        "token_caducidad": "-",
+    }
+
+
+def usuario(i: int) -> dict:
+    return {
+        "_id": f"uid{i}",
+        "email": f"user{i}@example.com",
+        "fechaLogueo": datetime(2025, 1, 1),
+        "fechaCaducidad": datetime(2025, 1, 1) + timedelta(days=30),
+        "alias": None,
+        "foto": None,
+    }
+
+
+def con_pydantic(modelo, documentos: list[dict]) -> bytes:
+    # Lo que hacía la ruta: un modelo por documento y FastAPI revalidando la lista
+    from pydantic import TypeAdapter
+    modelos = [modelo(**d) for d in documentos]
+    validados = TypeAdapter(list[modelo]).validate_python(modelos)
+    return json.dumps([m.model_dump(mode="json", by_alias=True) for m in validados]).encode()
+
+
+def con_serializador(serializador, documentos: list[dict]) -> bytes:
+    from app.core.serializacion import a_bytes
+    return a_bytes(serializador.lista(documentos))
+
+
+def medir(nombre: str, funcion, repeticiones: int) -> float:
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    # app.core.config lee estas variables al importarse (aquí no se conecta a nada)
+    os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+    os.environ.setdefault("CLASE1_URL", "")
+    from app.Parcial2_Schema import Parcial2Respuesta, UsuarioRespuesta
+    from app.core.serializacion import SerializadorLectura, orjson
+
+    print(f"Codificador: {'orjson' if orjson else 'json'}")
+    casos = [
+        ("Parcial2Respuesta", Parcial2Respuesta, resena),
+        ("UsuarioRespuesta", UsuarioRespuesta, usuario),
+    ]
+    for nombre, modelo, generar in casos:
+        serializador = SerializadorLectura(modelo)
+        for n in args.tamanos:
+            documentos = [generar(i) for i in range(n)]
+            # Mismo JSON por los dos caminos
+            assert json.loads(con_pydantic(modelo, documentos[:50])) == json.loads(con_serializador(serializador, documentos[:50]))
+
+            antes = medir(nombre, lambda: con_pydantic(modelo, documentos), args.repeticiones)
+            despues = medir(nombre, lambda: con_serializador(serializador, documentos), args.repeticiones)
+            print(f"{nombre:<18} n={n:>7}  pydantic {antes / n * 1e6:7.2f} µs/doc  "
+                  f"serializador {despues / n * 1e6:7.2f} µs/doc  x{antes / despues:4.1f}")
+
+
+if __name__ == "__main__":
+    main()
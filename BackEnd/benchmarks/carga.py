@@ -0,0 +1,250 @@
+"""
+Prueba de carga de las rutas /Parcial2 contra un MongoDB local ya sembrado
+(ver benchmarks/sembrar.py) y un Cloudinary falso (benchmarks/fake_cloudinary.py).
+
+Modos:
+  asgi      la app en este mismo proceso, a través de httpx.ASGITransport
+  uvicorn   un proceso uvicorn real (--workers)
+  gunicorn  gunicorn con workers de uvicorn (--workers)
+
+Informa p50/p95/p99 y peticiones por segundo de cada escenario (ruta +
+combinación de filtros). Con --baseline compara con una ejecución guardada y
+sale con código 1 si algún escenario empeora más que --umbral:
+
+    python benchmarks/sembrar.py --resenas 100000
+    python benchmarks/carga.py --modo uvicorn --workers 2 --guardar-baseline
+    python benchmarks/carga.py --modo uvicorn --workers 2 --baseline benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(RAIZ))
+
+from benchmarks.fake_cloudinary import FakeCloudinary
+
+
+# ===============================================
+#  Escenarios
+# ===============================================
+# Cada escenario genera (método, ruta, parámetros, cuerpo) a partir de un
+# Random con semilla fija: dos ejecuciones lanzan las mismas peticiones
+def escenarios(ids: list[str], usuarios: list[str]) -> dict:
+    return {
+        "listar": lambda a: ("GET", "/Parcial2/", {}, None),
+        "listar?usuarioId": lambda a: ("GET", "/Parcial2/", {"usuarioId": a.choice(usuarios)}, None),
+        "listar?nombre": lambda a: ("GET", "/Parcial2/", {"nombre": a.choice(["bar", "casa 01", "bodega", "taber"])}, None),
+        "listar?fechas": lambda a: ("GET", "/Parcial2/", {"fechaComienzo": f"2024-{a.randint(1, 12):02d}-01", "fechaFinal": f"2024-{a.randint(1, 12):02d}-28"}, None),
+        "listar?numero&booleana": lambda a: ("GET", "/Parcial2/", {"numero": a.randint(0, 100), "booleana": a.choice(["true", "false"])}, None),
+        "listar?fields": lambda a: ("GET", "/Parcial2/", {"fields": "_id,nombre,valoracion,coordenadas"}, None),
+        "listar?cursor": lambda a: ("GET", "/Parcial2/", {"limit": 50, "usuarioId": a.choice(usuarios)}, None),
+        "listar ndjson": lambda a: ("GET", "/Parcial2/", {"formato": "ndjson", "limit": 1000}, None),
+        "buscar texto": lambda a: ("GET", "/Parcial2/buscar", {"q": a.choice(["bar", "taberna larios", "bodega", "café granada"])}, None),
+        "buscar prefijo": lambda a: ("GET", "/Parcial2/buscar", {"q": a.choice(["ca", "bod", "mari"]), "modo": "prefijo"}, None),
+        "cercanos": lambda a: ("GET", "/Parcial2/cercanos", {"latitud": 36.72 + a.uniform(-0.1, 0.1), "longitud": -4.42 + a.uniform(-0.1, 0.1), "radio": 1000}, None),
+        "mapa agrupado": lambda a: ("GET", "/Parcial2/mapa", {"sur": 36.5, "oeste": -4.7, "norte": 37.0, "este": -4.1, "zoom": 10}, None),
+        "mapa detalle": lambda a: ("GET", "/Parcial2/mapa", {"sur": 36.71, "oeste": -4.43, "norte": 36.73, "este": -4.41, "zoom": 16}, None),
+        "estadisticas": lambda a: ("GET", "/Parcial2/estadisticas", {}, None),
+        "estadisticas?usuarioId": lambda a: ("GET", "/Parcial2/estadisticas", {"usuarioId": a.choice(usuarios)}, None),
+        "establecimientos": lambda a: ("GET", "/Parcial2/estadisticas/establecimientos", {"orden": "total", "limit": 20}, None),
+        "obtener": lambda a: ("GET", f"/Parcial2/{a.choice(ids)}", {}, None),
+        "usuarios": lambda a: ("GET", "/Parcial2/Usuarios/", {}, None),
+        # Escritura al final: invalida cachés y versiones de los listados
+        "modificar": lambda a: ("PUT", f"/Parcial2/{a.choice(ids)}", {}, {"valoracion": a.randint(0, 5)}),
+    }
+
+
+def muestra(mongo: str, base: str, n: int = 1_000) -> tuple[list[str], list[str]]:
+    from pymongo import MongoClient
+    bd = MongoClient(mongo)[base]
+    ids = [str(d["_id"]) for d in bd.Parcial2.aggregate([{"$sample": {"size": n}}, {"$project": {"_id": 1}}])]
+    usuarios = [d["_id"] for d in bd.Parcial2.aggregate([{"$sample": {"size": n}}, {"$group": {"_id": "$usuarioId"}}])]
+    if not ids:
+        sys.exit(f"La base {base} está vacía: ejecuta antes benchmarks/sembrar.py")
+    return ids, usuarios
+
+
+# ===============================================
+#  Ejecución y medida
+# ===============================================
+def percentil(ordenadas: list[float], p: float) -> float:
+    return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p))]
+
+
+async def ejecutar_escenario(cliente, generar, peticiones: int, concurrencia: int, calentamiento: int, semilla: int) -> dict:
+    azar = random.Random(semilla)
+    for _ in range(calentamiento):
+        metodo, ruta, parametros, cuerpo = generar(azar)
+        await cliente.request(metodo, ruta, params=parametros, json=cuerpo)
+
+    latencias, errores = [], 0
+    # Un único iterador compartido: cada trabajador toma la siguiente petición
+    pendientes = iter(range(peticiones))
+
+    async def trabajador():
+        nonlocal errores
+        for _ in pendientes:
+            metodo, ruta, parametros, cuerpo = generar(azar)
+            inicio = time.perf_counter()
+            respuesta = await cliente.request(metodo, ruta, params=parametros, json=cuerpo)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            errores += respuesta.status_code >= 400
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+    segundos = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        "peticiones": peticiones,
+        "errores": errores,
+        "rps": round(peticiones / segundos, 1),
+        "p50": round(percentil(latencias, 0.50), 2),
+        "p95": round(percentil(latencias, 0.95), 2),
+        "p99": round(percentil(latencias, 0.99), 2),
+    }
+
+
+async def ejecutar_todos(cliente, args, ids, usuarios) -> dict:
+    resultados = {}
+    for nombre, generar in escenarios(ids, usuarios).items():
+        if args.escenarios and nombre not in args.escenarios:
+            continue
+        resultados[nombre] = await ejecutar_escenario(
+            cliente, generar, args.peticiones, args.concurrencia, args.calentamiento, args.semilla,
+        )
+        r = resultados[nombre]
+        print(f"{nombre:<24} {r['rps']:>8.1f} rps  p50 {r['p50']:>8.2f}  p95 {r['p95']:>8.2f}  p99 {r['p99']:>8.2f} ms"
+              f"{'  errores: ' + str(r['errores']) if r['errores'] else ''}")
+    return resultados
+
+
+# ======= Modo asgi: la app en este proceso ========
+async def modo_asgi(args, entorno: dict, ids, usuarios) -> dict:
+    import httpx
+    os.environ.update(entorno)
+    from main import app
+
+    # ASGITransport no lanza el lifespan: se abre a mano (cliente de Mongo, workers...)
+    async with app.router.lifespan_context(app):
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://carga", timeout=60) as cliente:
+            return await ejecutar_todos(cliente, args, ids, usuarios)
+
+
+# ======= Modos uvicorn/gunicorn: un servidor real en otro proceso ========
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def modo_servidor(args, entorno: dict, ids, usuarios) -> dict:
+    import httpx
+    puerto = puerto_libre()
+    if args.modo == "uvicorn":
+        comando = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(puerto),
+                   "--workers", str(args.workers), "--log-level", "warning"]
+    else:
+        comando = [sys.executable, "-m", "gunicorn", "main:app", "-c", "gunicorn.conf.py",
+                   "-w", str(args.workers), "-b", f"127.0.0.1:{puerto}", "--log-level", "warning"]
+
+    proceso = subprocess.Popen(comando, cwd=RAIZ, env={**os.environ, **entorno})
+    try:
+        limites = httpx.Limits(max_connections=args.concurrencia, max_keepalive_connections=args.concurrencia)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{puerto}", timeout=60, limits=limites) as cliente:
+            for _ in range(300):
+                if proceso.poll() is not None:
+                    sys.exit(f"El servidor terminó al arrancar (código {proceso.returncode})")
+                try:
+                    if (await cliente.get("/health/ready")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+            else:
+                sys.exit("El servidor no está listo tras 30 s")
+            return await ejecutar_todos(cliente, args, ids, usuarios)
+    finally:
+        proceso.terminate()
+        proceso.wait(timeout=30)
+
+
+# ===============================================
+#  Baseline
+# ===============================================
+def comparar(actual: dict, base: dict, umbral: float) -> list[str]:
+    # Empeora si sube el p95 o baja el rendimiento más que el umbral
+    regresiones = []
+    for nombre, r in actual.items():
+        anterior = base.get(nombre)
+        if not anterior:
+            continue
+        if r["p95"] > anterior["p95"] * (1 + umbral):
+            regresiones.append(f"{nombre}: p95 {anterior['p95']} -> {r['p95']} ms")
+        if r["rps"] < anterior["rps"] * (1 - umbral):
+            regresiones.append(f"{nombre}: {anterior['rps']} -> {r['rps']} rps")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="Parcial2_bench")
+    parser.add_argument("--modo", choices=["asgi", "uvicorn", "gunicorn"], default="asgi")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--peticiones", type=int, default=500, help="Por escenario")
+    parser.add_argument("--concurrencia", type=int, default=16)
+    parser.add_argument("--calentamiento", type=int, default=20)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--escenarios", nargs="*", help="Solo estos escenarios (por nombre)")
+    parser.add_argument("--cache", choices=["memoria", "redis", "ninguno"], default="memoria")
+    parser.add_argument("--latencia-cloudinary-ms", type=float, default=50)
+    parser.add_argument("--baseline", type=Path, default=RAIZ / "benchmarks" / "baseline.json")
+    parser.add_argument("--guardar-baseline", action="store_true")
+    parser.add_argument("--umbral", type=float, default=0.25, help="Empeoramiento tolerado (0.25 = 25 %%)")
+    args = parser.parse_args()
+
+    ids, usuarios = muestra(args.mongo, args.db)
+    with FakeCloudinary(latencia_ms=args.latencia_cloudinary_ms) as fake:
+        entorno = {
+            "MONGO_URI": args.mongo,
+            "DB_NAME": args.db,
+            "CLASE1_URL": os.environ.get("CLASE1_URL", ""),
+            "CACHE_BACKEND": args.cache,
+            # Todas las peticiones salen de la misma IP: sin límite de peticiones
+            "LIMITE_BACKEND": "ninguno",
+            **fake.entorno(),
+        }
+        print(f"Modo {args.modo} ({args.workers} workers), {args.peticiones} peticiones por escenario, concurrencia {args.concurrencia}")
+        ejecutar = modo_asgi if args.modo == "asgi" else modo_servidor
+        resultados = asyncio.run(ejecutar(args, entorno, ids, usuarios))
+        print(f"Cloudinary falso: {fake.llamadas or 'sin llamadas'}")
+
+    configuracion = {"modo": args.modo, "workers": args.workers, "concurrencia": args.concurrencia, "cache": args.cache}
+    if args.guardar_baseline:
+        args.baseline.write_text(json.dumps({"configuracion": configuracion, "escenarios": resultados}, indent=2))
+        print(f"Baseline guardada en {args.baseline}")
+        return
+
+    if args.baseline.exists():
+        base = json.loads(args.baseline.read_text())
+        if base["configuracion"] != configuracion:
+            print(f"Aviso: la baseline se tomó con otra configuración ({base['configuracion']})")
+        regresiones = comparar(resultados, base["escenarios"], args.umbral)
+        if regresiones:
+            print("\nRegresiones:\n  " + "\n  ".join(regresiones))
+            sys.exit(1)
+        print("\nSin regresiones respecto a la baseline")
+
+
+if __name__ == "__main__":
+    main()
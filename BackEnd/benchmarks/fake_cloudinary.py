@@ -0,0 +1,202 @@
+"""
+Sustituto local de la Admin API de Cloudinary para benchmarks y pruebas de carga.
+
+La SDK se apunta aquí con CLOUDINARY_UPLOAD_PREFIX=http://127.0.0.1:<puerto>.
+Responde a delete_resources (todo "deleted") y a resources (sin recursos),
+con una latencia simulada opcional, y cuenta las llamadas recibidas.
+
+También acepta subidas firmadas (POST /v1_1/<cloud>/image/upload, como las
+que hace el navegador con los campos de POST /Parcial2/subidas): comprueba
+la firma, responde como Cloudinary y, si la subida trae notification_url,
+le envía las notificaciones "upload" y "eager" firmadas con el api_secret.
+Todas quedan además en `fake.notificaciones` para poder entregarlas a mano.
+
+    python benchmarks/fake_cloudinary.py --puerto 9100 --latencia-ms 80
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+from email.parser import BytesParser
+from email.policy import default as politica_email
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+NUBE = "bench"
+SECRETO = "bench"
+# Lo que no entra en la firma de una subida
+_SIN_FIRMA = {"file", "api_key", "signature", "resource_type", "cloud_name"}
+
+
+def firma_subida(campos: dict, secreto: str = SECRETO) -> str:
+    texto = "&".join(f"{k}={v}" for k, v in sorted(campos.items()) if k not in _SIN_FIRMA and v not in (None, ""))
+    return hashlib.sha1((texto + secreto).encode()).hexdigest()
+
+
+def _campos_formulario(tipo: str, cuerpo: bytes) -> dict:
+    # multipart/form-data (navegador) o application/x-www-form-urlencoded
+    if tipo.startswith("multipart/"):
+        mensaje = BytesParser(policy=politica_email).parsebytes(f"Content-Type: {tipo}\r\n\r\n".encode() + cuerpo)
+        campos = {}
+        for parte in mensaje.iter_parts():
+            nombre = parte.get_param("name", header="content-disposition")
+            contenido = parte.get_payload(decode=True) or b""
+            campos[nombre] = contenido if nombre == "file" else contenido.decode()
+        return campos
+    return {k: v[0] for k, v in parse_qs(cuerpo.decode()).items()}
+
+
+class _Manejador(BaseHTTPRequestHandler):
+
+    def _parametros(self) -> dict:
+        url = urlsplit(self.path)
+        parametros = parse_qs(url.query)
+        longitud = int(self.headers.get("Content-Length") or 0)
+        if longitud:
+            cuerpo = self.rfile.read(longitud).decode()
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                parametros.update({k: v if isinstance(v, list) else [v] for k, v in json.loads(cuerpo).items()})
+            else:
+                parametros.update(parse_qs(cuerpo))
+        return parametros
+
+    def _responder(self, contenido: dict):
+        datos = json.dumps(contenido).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_DELETE(self):
+        parametros = self._parametros()
+        ids = parametros.get("public_ids[]") or parametros.get("public_ids") or []
+        self.server.fake.registrar("delete_resources", len(ids))
+        self._responder({"deleted": {i: "deleted" for i in ids}, "partial": False})
+
+    def do_GET(self):
+        self.server.fake.registrar("resources", 0)
+        self._responder({"resources": []})
+
+    def do_POST(self):
+        longitud = int(self.headers.get("Content-Length") or 0)
+        campos = _campos_formulario(self.headers.get("Content-Type", ""), self.rfile.read(longitud))
+        if not urlsplit(self.path).path.endswith("/image/upload"):
+            self.send_error(404)
+            return
+        if campos.get("signature") != firma_subida(campos):
+            datos = json.dumps({"error": {"message": "Invalid Signature"}}).encode()
+            self.send_response(401)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(datos)))
+            self.end_headers()
+            self.wfile.write(datos)
+            return
+        self.server.fake.registrar("upload", 1)
+        self._responder(self.server.fake.subir(campos))
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeCloudinary:
+
+    def __init__(self, puerto: int = 0, latencia_ms: float = 0):
+        self.latencia = latencia_ms / 1000
+        self.llamadas: dict[str, int] = {}
+        self.public_ids = 0
+        # (cuerpo, cabeceras) de cada notificación generada
+        self.notificaciones: list[tuple[bytes, dict]] = []
+        self._bloqueo = threading.Lock()
+        self._servidor = ThreadingHTTPServer(("127.0.0.1", puerto), _Manejador)
+        self._servidor.fake = self
+        self._hilo = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, puerto = self._servidor.server_address
+        return f"http://{host}:{puerto}"
+
+    def registrar(self, operacion: str, public_ids: int):
+        if self.latencia:
+            time.sleep(self.latencia)
+        with self._bloqueo:
+            self.llamadas[operacion] = self.llamadas.get(operacion, 0) + 1
+            self.public_ids += public_ids
+
+    # ======= Subida: respuesta de Cloudinary y notificaciones ========
+    def subir(self, campos: dict) -> dict:
+        public_id = campos["public_id"]
+        version = int(time.time())
+        base = f"{self.url}/{NUBE}/image/upload"
+        eager = [{
+            "transformation": transformacion,
+            "width": 200, "height": 200, "bytes": 8_000,
+            "secure_url": f"{base}/{transformacion}/v{version}/{public_id}.jpg",
+        } for transformacion in filter(None, (campos.get("eager") or "").split("|"))]
+        respuesta = {
+            "public_id": public_id,
+            "version": version,
+            "width": 1600, "height": 1200, "format": "jpg",
+            "bytes": len(campos.get("file") or b""),
+            "secure_url": f"{base}/v{version}/{public_id}.jpg",
+            "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+        asincrono = campos.get("eager_async") == "true"
+        if not asincrono:
+            respuesta["eager"] = eager
+        notificaciones = [{"notification_type": "upload", **respuesta}]
+        if asincrono and eager:
+            notificaciones.append({"notification_type": "eager", "public_id": public_id, "eager": eager})
+        for carga in notificaciones:
+            self._notificar(carga, campos.get("notification_url"))
+        return respuesta
+
+    def _notificar(self, carga: dict, url: str | None):
+        cuerpo = json.dumps(carga).encode()
+        marca = str(int(time.time()))
+        cabeceras = {
+            "Content-Type": "application/json",
+            "X-Cld-Timestamp": marca,
+            "X-Cld-Signature": hashlib.sha1(cuerpo + marca.encode() + SECRETO.encode()).hexdigest(),
+        }
+        with self._bloqueo:
+            self.notificaciones.append((cuerpo, cabeceras))
+        if url:
+            # Como Cloudinary: después de responder a la subida y sin bloquearla
+            peticion = urllib.request.Request(url, data=cuerpo, headers=cabeceras, method="POST")
+            threading.Thread(target=lambda: urllib.request.urlopen(peticion, timeout=10).close(), daemon=True).start()
+
+    def entorno(self) -> dict:
+        # Variables para que la SDK (en este proceso o en uno hijo) use el sustituto
+        return {
+            "CLOUDINARY_UPLOAD_PREFIX": self.url,
+            "CLOUDINARY_CLOUD_NAME": NUBE,
+            "CLOUDINARY_API_KEY": "bench",
+            "CLOUDINARY_API_SECRET": SECRETO,
+        }
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--puerto", type=int, default=9100)
+    parser.add_argument("--latencia-ms", type=float, default=0)
+    args = parser.parse_args()
+    with FakeCloudinary(args.puerto, args.latencia_ms) as fake:
+        print(f"Cloudinary falso en {fake.url} (Ctrl+C para parar)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,122 @@
+"""
+Siembra reseñas y usuarios sintéticos (reproducibles con --semilla) para las
+pruebas de carga, crea los índices y reconstruye el resumen de estadísticas.
+
+Necesita un MongoDB local; BORRA las colecciones de la base indicada en --db:
+
+    python benchmarks/sembrar.py --mongo mongodb://localhost:27017 --resenas 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+LOTE = 10_000
+# Centro de Málaga; las reseñas caen en un cuadrado de ~0,5° alrededor
+CENTRO = (36.722, -4.418)
+ESTABLECIMIENTOS = 2_000
+INICIO = datetime(2024, 1, 1)
+
+
+def nombre_establecimiento(i: int) -> str:
+    tipos = ["Bar", "Casa", "Bodega", "Taberna", "Restaurante", "Café", "Marisquería", "Chiringuito"]
+    return f"{tipos[i % len(tipos)]} {i:04d}"
+
+
+def usuario(i: int, azar: random.Random) -> dict:
+    logueo = INICIO + timedelta(days=azar.randint(0, 600))
+    return {
+        "_id": f"uid{i:07d}",
+        "email": f"user{i}@example.com",
+        "fechaLogueo": logueo,
+        "fechaCaducidad": logueo + timedelta(days=30),
+        "alias": f"user{i}",
+        "foto": None,
+    }
+
+
+def resena(i: int, usuarios: int, azar: random.Random) -> dict:
+    from bson import ObjectId
+    from app.core.texto import normalizar
+
+    nombre = nombre_establecimiento(azar.randint(0, ESTABLECIMIENTOS - 1))
+    latitud = CENTRO[0] + azar.uniform(-0.25, 0.25)
+    longitud = CENTRO[1] + azar.uniform(-0.25, 0.25)
+    fotos = [f"resenas/{i}_{j}" for j in range(azar.randint(0, 3))]
+    return {
+        "_id": ObjectId(),
+        "usuarioId": f"uid{azar.randint(0, usuarios - 1):07d}",
+        "nombre": nombre,
+        "nombre_normalizado": normalizar(nombre),
+        "direccion": f"Calle {azar.choice(['Larios', 'Granada', 'Carretería', 'Victoria'])} {azar.randint(1, 200)}, Málaga",
+        "valoracion": azar.choices(range(6), weights=[2, 3, 8, 20, 35, 32])[0],
+        "fecha": INICIO + timedelta(seconds=azar.randint(0, 2 * 365 * 86_400)),
+        "numero": azar.randint(0, 100),
+        "booleana": azar.random() < 0.5,
+        "coordenadas": [{"latitud": f"{latitud:.6f}", "longitud": f"{longitud:.6f}"}],
+        "location": {"type": "Point", "coordinates": [longitud, latitud]},
+        "enlaces": [f"https://res.cloudinary.com/bench/image/upload/v1/{p}.jpg" for p in fotos],
+        "medios": [{"url": f"https://res.cloudinary.com/bench/image/upload/v1/{p}.jpg", "public_id": p} for p in fotos],
+        "version": 1,
+        "autor_email": "bench@example.com",
+        "autor_nombre": "Bench",
+        "token_id": "-",
+        "token_emision": "-",
+        "token_caducidad": "-",
+    }
+
+
+def sembrar(mongo: str, base: str, resenas: int, usuarios: int, semilla: int = 1):
+    from pymongo import MongoClient
+
+    azar = random.Random(semilla)
+    bd = MongoClient(mongo)[base]
+    for coleccion in ("Parcial2", "Usuario", "Parcial2Resumen", "Versiones", "BorradosCloudinary"):
+        bd.drop_collection(coleccion)
+
+    inicio = time.perf_counter()
+    for desde in range(0, usuarios, LOTE):
+        bd.Usuario.insert_many([usuario(i, azar) for i in range(desde, min(desde + LOTE, usuarios))], ordered=False)
+    for desde in range(0, resenas, LOTE):
+        bd.Parcial2.insert_many([resena(i, usuarios, azar) for i in range(desde, min(desde + LOTE, resenas))], ordered=False)
+        print(f"\r{min(desde + LOTE, resenas):>9} reseñas", end="", flush=True)
+    print(f"  ({time.perf_counter() - inicio:.0f} s)")
+
+    # Índices y resumen con el código de la app (mismo proceso, un solo bucle)
+    async def preparar():
+        from app.core.indices import aplicar_indices
+        from app.core.migraciones import resumen
+        from app.core.database import desconectar
+        try:
+            await aplicar_indices()
+            print(f"Resumen: {await resumen()} establecimientos")
+        finally:
+            desconectar()
+
+    asyncio.run(preparar())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="Parcial2_bench")
+    parser.add_argument("--resenas", type=int, default=10_000, help="De 10k a 1M")
+    parser.add_argument("--usuarios", type=int, default=None, help="Por defecto, una vigésima parte de las reseñas")
+    parser.add_argument("--semilla", type=int, default=1)
+    args = parser.parse_args()
+
+    # app.core.config lee estas variables al importarse
+    os.environ["MONGO_URI"] = args.mongo
+    os.environ["DB_NAME"] = args.db
+    os.environ.setdefault("CLASE1_URL", "")
+    sembrar(args.mongo, args.db, args.resenas, args.usuarios or max(1, args.resenas // 20), args.semilla)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Arranque de producción (es el CMD de la imagen de Docker):
+
+    gunicorn main:app -c gunicorn.conf.py
+
+`python main.py` sigue siendo el arranque de desarrollo (un proceso con
+reload). Todo se ajusta con variables de entorno SERVIDOR_*.
+"""
+import math
+import os
+import tempfile
+from environs import Env
+
+env = Env()
+env.read_env()
+
+
+# ======= CPUs disponibles: afinidad y cuota del contenedor (cgroup v2) ========
+def cpus_disponibles() -> int:
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as fichero:
+            cuota, periodo = fichero.read().split()
+        if cuota != "max":
+            cpus = min(cpus, math.ceil(int(cuota) / int(periodo)))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+# --- Procesos ---
+# Workers asíncronos: uno por CPU basta (0 = automático). Cada worker tiene
+# su pool de Mongo (MONGO_POOL_MAX) y sus cachés en memoria: en total se
+# abren hasta workers × MONGO_POOL_MAX conexiones.
+workers = env.int("SERVIDOR_WORKERS", 0) or cpus_disponibles()
+worker_class = "servidor.TrabajadorUvicorn"
+# La app se importa una vez en el master y los workers la heredan al hacer
+# fork: arrancan antes y comparten las páginas de memoria del código
+preload_app = env.bool("SERVIDOR_PRECARGA", True)
+
+# --- Red ---
+bind = f"{env('SERVIDOR_HOST', '0.0.0.0')}:{env.int('SERVIDOR_PUERTO', 8001)}"
+backlog = env.int("SERVIDOR_BACKLOG", 2048)
+# Mayor que el idle timeout del balanceador (60 s en nginx y ALB): si no, el
+# balanceador reutiliza conexiones que el servidor ya ha cerrado (502)
+keepalive = env.int("SERVIDOR_KEEPALIVE", 65)
+# IPs de confianza para X-Forwarded-For / X-Forwarded-Proto (el límite de
+# peticiones de app/core/limites.py usa la misma variable)
+forwarded_allow_ips = env("SERVIDOR_PROXIES", "127.0.0.1")
+
+# --- Parada y reciclado ---
+# SIGTERM: dejar de aceptar, terminar las peticiones en vuelo y cerrar Mongo
+# y los workers de Cloudinary (lifespan) antes de este plazo. El orquestador
+# tiene que esperar más (docker stop -t / terminationGracePeriodSeconds).
+graceful_timeout = env.int("SERVIDOR_PARADA", 25)
+# Un worker que no da señales en este tiempo se reinicia
+timeout = env.int("SERVIDOR_TIMEOUT", 60)
+# Reciclar workers cada N peticiones (0 = nunca); el jitter evita que se
+# reinicien todos a la vez
+max_requests = env.int("SERVIDOR_MAX_PETICIONES", 0)
+max_requests_jitter = max_requests // 10
+
+# --- Logs ---
+# Sin log de accesos por defecto (ya están las métricas); "-" = stdout
+accesslog = env("SERVIDOR_LOG_ACCESOS", None)
+loglevel = env("SERVIDOR_LOG_NIVEL", "info")
+
+# --- Métricas de todos los workers (ver app/core/metricas.py) ---
+# Antes de importar la app: prometheus_client elige el modo al importarse.
+# Los ficheros de una ejecución anterior contarían dos veces: se borran los
+# *.db que deja prometheus_client, y solo si el directorio no tiene nada más
+# (una ruta mal puesta o compartida no se vacía)
+_metricas = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "parcial2-metricas"))
+os.makedirs(_metricas, exist_ok=True)
+_ajenos = [nombre for nombre in os.listdir(_metricas)
+           if not (nombre.endswith(".db") and os.path.isfile(os.path.join(_metricas, nombre)))]
+if _ajenos:
+    raise RuntimeError(
+        f"PROMETHEUS_MULTIPROC_DIR={_metricas} contiene otros ficheros ({', '.join(sorted(_ajenos)[:5])}); "
+        "debe ser un directorio solo para las métricas"
+    )
+for _nombre in os.listdir(_metricas):
+    os.remove(os.path.join(_metricas, _nombre))
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        # El esquema OpenAPI se genera una vez aquí y no en cada worker con la
+        # primera petición a /docs
+        server.app.wsgi().openapi()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,23 +1,69 @@
-﻿from fastapi import FastAPI
-from app.Parcial2_Routes import router as parcial2_router
+﻿from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from app.Parcial2_Routes import router as parcial2_router, notificaciones as notificaciones_router
+from app.Sistema_Routes import router as sistema_router
+from app.Admin_Routes import router as admin_router
+from app.core.database import conectar, desconectar
+from app.core.indices import aplicar_indices
+from app.core.media import cola_borrado, reconciliador
+from app.core.auth import claves_firebase, verificador
+from app.Parcial2_Service import barrendero_usuarios, difusor_cambios
 from fastapi.middleware.cors import CORSMiddleware
+from app.core.metricas import MiddlewareMetricas
+from app.core.compresion import MiddlewareCompresion
+from app.core.tareas import esperar_pendientes
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Arranque: un cliente de Mongo (y su pool) por worker
+    conectar()
+    # Índices declarados en app/core/indices.py (idempotente)
+    app.state.indices = await aplicar_indices()
+    cola_borrado.iniciar()
+    reconciliador.iniciar()
+    # Usuarios caducados (solo con USUARIOS_CADUCIDAD_MODO=barrido)
+    barrendero_usuarios.iniciar()
+    if verificador:
+        # Claves de Firebase: se cargan y renuevan en segundo plano
+        claves_firebase.iniciar()
+    yield
+    await claves_firebase.detener()
+    await barrendero_usuarios.detener()
+    # Los clientes de /Parcial2/stream reciben "descartado" y reconectan a otro worker
+    await difusor_cambios.detener()
+    # Parada: los workers de Cloudinary terminan lo que tienen en vuelo
+    await reconciliador.detener()
+    await cola_borrado.detener()
+    # Instantáneas de autor que se estén refrescando
+    await esperar_pendientes()
+    desconectar()
+
 
 app = FastAPI(
     title="Parcial Server - Servicio de Parcial2",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.include_router(parcial2_router)
+app.include_router(notificaciones_router)
+app.include_router(sistema_router)
+app.include_router(admin_router)
 
+# gzip/br/zstd según Accept-Encoding (ver app/core/compresion.py). Va por
+# dentro de las métricas: los bytes medidos son los que salen por la red
+app.add_middleware(MiddlewareCompresion)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # pon aquí tu dominio si quieres restringir
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Siguiente-Cursor", "ETag"],
 )
+# Latencia y tamaño de respuesta por ruta (servidos en /metrics)
+app.add_middleware(MiddlewareMetricas)
 
 
 if __name__ == "__main__":
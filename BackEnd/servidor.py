@@ -0,0 +1,49 @@
+"""
+Worker de gunicorn para la app (ver gunicorn.conf.py): uvicorn con uvloop y
+httptools si están instalados y una parada que no se queda esperando a los
+clientes de /Parcial2/stream.
+"""
+import importlib.util
+import sys
+from gunicorn.arbiter import Arbiter
+from uvicorn.server import Server
+from uvicorn_worker import UvicornWorker
+
+
+def instalado(modulo: str) -> bool:
+    return importlib.util.find_spec(modulo) is not None
+
+
+class ServidorParcial2(Server):
+
+    async def shutdown(self, sockets=None):
+        # Las conexiones SSE no terminan solas: se cortan (reciben "descartado"
+        # y reconectan a otro worker) antes de esperar a las peticiones en vuelo
+        from app.Parcial2_Service import difusor_cambios
+        await difusor_cambios.detener()
+        await super().shutdown(sockets)
+
+
+class TrabajadorUvicorn(UvicornWorker):
+
+    CONFIG_KWARGS = {
+        "loop": "uvloop" if instalado("uvloop") else "asyncio",
+        "http": "httptools" if instalado("httptools") else "h11",
+        # Si el arranque falla (Mongo, índices) el worker muere en vez de servir sin BD
+        "lifespan": "on",
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # uvicorn no toma graceful_timeout de gunicorn y esperaría sin límite.
+        # Se dejan unos segundos para el lifespan: pasado graceful_timeout
+        # gunicorn mata el worker.
+        self.config.timeout_graceful_shutdown = max(1, self.cfg.graceful_timeout - 5)
+
+    async def _serve(self):
+        self.config.app = self.wsgi
+        servidor = ServidorParcial2(config=self.config)
+        self._install_sigquit_handler()
+        await servidor.serve(sockets=self.sockets)
+        if not servidor.started:
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
@@ -4,7 +4,7 @@ import ControlAcceso from '../componentes/ControlAcceso';
 import Boton from "../componentes/Boton";
 import CrearElementoPopUp from '../componentes/PopUp/CrearElementoPopUp';
 import Mapa from "../componentes/Mapa";
-import { listarParcial2, eliminarParcial2 } from "../services/servicesParcial2"; 
+import { listarParcial2, buscarParcial2, eliminarParcial2 } from "../services/servicesParcial2"; 
 import { Parcial2Respuesta } from "../esquemas/esquemas";
 import '../estilos/Home.css';
 
@@ -30,10 +30,13 @@ const Home = () => {
         if (!user?.uid) return;
         setCargando(true);
         const usuarioIdParaBackend = modoVista === 'mis' ? user.uid : undefined;
-        const nombreParaBackend = (!filtroTexto || filtroTexto.trim() === "") ? undefined : filtroTexto;
+        const textoParaBackend = (!filtroTexto || filtroTexto.trim() === "") ? undefined : filtroTexto.trim();
 
         try {
-            const datos = await listarParcial2({ usuarioId: usuarioIdParaBackend, nombre: nombreParaBackend });
+            // Con texto se busca cualquier palabra ("lola" encuentra "Casa Lola")
+            const datos = textoParaBackend
+                ? await buscarParcial2(textoParaBackend, usuarioIdParaBackend)
+                : await listarParcial2({ usuarioId: usuarioIdParaBackend });
             if (datos) setElementos(datos);
             else setElementos([]);
         } catch (error) { console.error(error); } finally { setCargando(false); }
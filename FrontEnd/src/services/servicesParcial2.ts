@@ -52,6 +52,34 @@ export async function listarParcial2(params?: {
 }
 
 
+// ==============================
+//  Buscar Parcial2 por texto
+// ==============================
+// El filtro 'nombre' del listado solo casa con el comienzo del nombre;
+// /buscar (modo texto) encuentra cualquier palabra del nombre o la dirección
+export async function buscarParcial2(q: string, usuarioId?: string): Promise<Parcial2Respuesta[] | null> {
+
+    try {
+        const params: Record<string, string> = { q, modo: "texto" };
+        if (usuarioId) params.usuarioId = usuarioId;
+
+        const query = new URLSearchParams(params).toString();
+        const response = await fetch(`${API}/Parcial2/buscar?${query}`);
+
+        if (!response.ok) {
+            console.error("Error backend al buscar Parcial2");
+            return null;
+        }
+
+        return await response.json();
+
+    } catch (err) {
+        console.error("Error de conexión al backend:", err);
+        return null;
+    }
+}
+
+
 // ==============================
 //  Crear Parcial2
 // ==============================